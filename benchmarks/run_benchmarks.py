@@ -0,0 +1,421 @@
+"""
+Benchmarks of time accounting and activity hot paths over synthetic histories.
+
+Runs work_time_core headlessly (fake foreground window and input sources instead of win32/pynput, no Qt), so it
+can be run on any machine:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --months 1 12 --apps 5 50 --output before.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+Results are saved as json (by default into benchmarks/results/<commit>.json), so they can be compared
+between commits.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from work_time_core import JsonHelpers, WriteBehindScheduler, InputSampler, ForegroundSampler, ActivityTracker, \
+    WorkTime
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results")
+MONTHS = (1, 12, 120)
+APPS = (5, 50, 500)
+SEED = 1
+INTERVALS_PER_DAY = 4
+APPS_PER_SAMPLE_SWITCH = 30
+SIMULATED_SECONDS = 3600
+CHECK_OVERTIME_INTERVAL = 60
+FLUSH_INTERVAL = 60
+TRACEMALLOC_CALLS = 100
+PERCENTILES = (50, 90, 99)
+
+
+class FakeWindowSource:
+    """
+    Foreground window source switching between applications every few samples.
+    """
+    def __init__(self, apps):
+        self.apps = apps
+        self.samples = 0
+
+    def foreground_pid(self):
+        self.samples += 1
+
+        return 1000 + (self.samples // APPS_PER_SAMPLE_SWITCH) % self.apps
+
+    def create_time(self, pid):
+        return float(pid)
+
+    def name(self, pid):
+        return "app{}.exe".format(pid - 1000)
+
+
+class FakeInputSampler(InputSampler):
+    def __init__(self):
+        super().__init__()
+        self.random = random.Random(SEED)
+
+    def _detect(self):
+        return self.random.random() < 0.8
+
+
+def generate_history(path, months, apps):
+    """
+    Generate log.json, overtimes.json and activity store of given size, ending today with open interval.
+
+    :param path: user directory.
+    :param months: number of months of history.
+    :param apps: number of applications used every day.
+    :return: None.
+    """
+    rnd = random.Random(SEED)
+    today = datetime.date.today()
+    day = today - datetime.timedelta(days=30 * months - 1)
+    working_time = {}
+    overtimes = {}
+    activity = ActivityTracker(os.path.join(path, "activity")).store
+
+    while day <= today:
+        date = day.strftime("%Y/%m/%d")
+
+        if day.weekday() < 5:
+            start = 7 * 3600 + rnd.randrange(3600)
+            intervals = []
+            for index in range(INTERVALS_PER_DAY):
+                end = start + 3600 + rnd.randrange(3600)
+                intervals.append({"START": _time(start), "END": _time(end)})
+                start = end + rnd.randrange(900)
+            working_time[date] = intervals
+
+            if rnd.random() < 0.3:
+                overtimes[date] = str(datetime.timedelta(seconds=rnd.randrange(3600)))
+
+        for app in range(apps):
+            activity.add(date, "app{}.exe".format(app), True, rnd.randrange(600))
+            activity.add(date, "app{}.exe".format(app), False, rnd.randrange(60))
+        activity.save()
+        activity.release(date)
+
+        day += datetime.timedelta(days=1)
+
+    working_time[today.strftime("%Y/%m/%d")] = [{"START": "00:00:01", "END": ""}]
+
+    JsonHelpers.dump_atomic(os.path.join(path, "log.json"), working_time)
+    JsonHelpers.dump_atomic(os.path.join(path, "overtimes.json"), overtimes)
+
+
+def _time(seconds):
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Session:
+    """
+    Headless equivalent of tray application state: working time, activity tracker and sampler sharing
+    write-behind scheduler, with all disk writes counted.
+    """
+    def __init__(self, path, apps):
+        self.path = path
+        self.scheduler = WriteBehindScheduler()
+        self.time = WorkTime(os.path.join(path, "log.json"), os.path.join(path, "overtimes.json"),
+                             os.path.join(path, "journal.log"), self.scheduler)
+        self.activity = ActivityTracker(os.path.join(path, "activity"), scheduler=self.scheduler)
+        self.sampler = ForegroundSampler(FakeWindowSource(apps), FakeInputSampler())
+        self.time.log_time(first_run=True)
+        # Overtime is saved on every check, like after 8 hours of work.
+        self.time.reference_time = datetime.timedelta()
+
+    def calculate_working_time(self):
+        self.time._calculate_working_time()
+
+    def calculate_summary_working_time(self):
+        self.time._calculate_summary_working_time()
+
+    def check_overtime(self):
+        working_time = self.time._calculate_working_time()
+
+        if working_time > self.time.reference_time:
+            overtimes = working_time - self.time.reference_time
+            self.time.save_overtime(self.time.now_date, overtimes)
+        self.time.working_time_message()
+
+    def detect_application(self):
+        today, app, active, seconds, error, second = self.sampler.sample()
+        self.activity.record(today, app, active, seconds, second)
+        self.activity.store.summary(self.activity.now_date)
+
+    def activity_message(self):
+        self.activity.activity_message()
+
+    def record_sample(self):
+        # New sample increases version of activity, so next message is rendered again.
+        self.detect_application()
+
+    def record_minute(self):
+        # Changes between two flushes of tray application.
+        for _ in range(FLUSH_INTERVAL):
+            self.detect_application()
+        self.check_overtime()
+
+    def flush(self):
+        self.scheduler.flush()
+
+    def compact(self):
+        self.time.storage.compact(background=False)
+
+
+class WriteCounter:
+    """
+    Counts bytes written by snapshot/activity files and time journal while active.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.bytes = 0
+        self.write_atomic = JsonHelpers.write_atomic
+
+    def __enter__(self):
+        def write_atomic(file_path, write, mode='w'):
+            self.write_atomic(file_path, write, mode)
+            self.bytes += os.path.getsize(file_path)
+
+        def sync():
+            written = storage_sync()
+            self.bytes += written
+
+            return written
+
+        storage_sync = self.session.time.storage.sync
+        JsonHelpers.write_atomic = staticmethod(write_atomic)
+        self.session.time.storage.sync = sync
+        self.session.scheduler.register("time", sync)
+
+        return self
+
+    def __exit__(self, *args):
+        JsonHelpers.write_atomic = staticmethod(self.write_atomic)
+
+
+def percentiles(durations):
+    ordered = sorted(durations)
+    result = {"calls": len(ordered), "mean_us": sum(ordered) / len(ordered) * 1e6, "max_us": ordered[-1] * 1e6}
+
+    for percentile in PERCENTILES:
+        index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+        result["p{}_us".format(percentile)] = ordered[index] * 1e6
+
+    return result
+
+
+def measure(function, calls, setup=None):
+    """
+    Measure latency of calls and memory allocated by them (in separate, tracemalloc traced run).
+
+    :param function: callable without arguments.
+    :param calls: number of timed calls.
+    :param setup: callable without arguments called before every call and not measured, e.g. to change state
+        which the call works on.
+    :return: dict with latency percentiles in microseconds and allocations in bytes.
+    """
+    durations = []
+    for _ in range(calls):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+
+    result = percentiles(durations)
+
+    traced_calls = min(calls, TRACEMALLOC_CALLS)
+    peak = 0
+    retained = 0
+    tracemalloc.start()
+    for _ in range(traced_calls):
+        if setup:
+            setup()
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        after, call_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, call_peak - before)
+        retained += after - before
+    tracemalloc.stop()
+
+    result["alloc_peak_bytes"] = peak
+    result["alloc_retained_bytes_per_call"] = retained / traced_calls
+
+    return result
+
+
+def measure_load(path, apps, calls):
+    durations = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        session = Session(path, apps)
+        durations.append(time.perf_counter() - started)
+        session.time.storage.close()
+
+    result = percentiles(durations)
+
+    tracemalloc.start()
+    session = Session(path, apps)
+    result["alloc_retained_bytes"] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    session.time.storage.close()
+
+    return result
+
+
+def simulate_hour(path, apps):
+    """
+    Simulate hour of tray application: activity sampled every second, overtime checked and stores flushed every
+    minute.
+
+    :return: dict with flush latency and bytes written per simulated hour.
+    """
+    session = Session(path, apps)
+    flushes = []
+
+    with WriteCounter(session) as counter:
+        for second in range(1, SIMULATED_SECONDS + 1):
+            session.detect_application()
+
+            if second % CHECK_OVERTIME_INTERVAL == 0:
+                session.check_overtime()
+
+            if second % FLUSH_INTERVAL == 0:
+                started = time.perf_counter()
+                session.flush()
+                flushes.append(time.perf_counter() - started)
+
+        session.flush()
+        session.time.storage._wait_compaction()
+
+    result = percentiles(flushes)
+    result["bytes_written_per_hour"] = counter.bytes
+    session.time.storage.close()
+
+    return result
+
+
+def run_case(months, apps, base_path):
+    path = os.path.join(base_path, "{}m_{}apps".format(months, apps))
+    os.makedirs(path)
+
+    started = time.perf_counter()
+    generate_history(path, months, apps)
+    print("{} months, {} apps: history generated in {:.1f}s".format(months, apps, time.perf_counter() - started))
+
+    results = {"load": measure_load(path, apps, 5)}
+
+    session = Session(path, apps)
+    benchmarks = (
+        ("calculate_working_time", session.calculate_working_time, 1000, None),
+        ("calculate_summary_working_time", session.calculate_summary_working_time, 1000, None),
+        ("check_overtime", session.check_overtime, 200, None),
+        ("detect_application", session.detect_application, SIMULATED_SECONDS, None),
+        ("activity_message_miss", session.activity_message, 100, session.record_sample),
+        ("activity_message_hit", session.activity_message, 100, session.activity_message),
+        ("flush", session.flush, 100, session.record_minute),
+        ("compact", session.compact, 5, None)
+    )
+    for name, function, calls, setup in benchmarks:
+        results[name] = measure(function, calls, setup)
+    session.time.storage.close()
+
+    results["simulated_hour"] = simulate_hour(path, apps)
+
+    for name, result in results.items():
+        print("  {:<32} p50 {:>10.1f}us  p99 {:>10.1f}us".format(name, result["p50_us"], result["p99_us"]))
+
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(months, apps, output):
+    base_path = tempfile.mkdtemp(prefix="work_time_bench_")
+    results = {
+        "commit": commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": {}
+    }
+
+    try:
+        for months_count in months:
+            for apps_count in apps:
+                key = "{}m_{}apps".format(months_count, apps_count)
+                results["cases"][key] = run_case(months_count, apps_count, base_path)
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+    output = output or os.path.join(RESULTS_PATH, "{}.json".format(results["commit"]))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump(results, fp, indent=3)
+
+    print("Results saved into '{}'".format(output))
+
+
+def compare(old_path, new_path):
+    """
+    Print p50 latency, allocations and written bytes of two results side by side.
+    """
+    with open(old_path, 'r') as fp:
+        old = json.load(fp)
+    with open(new_path, 'r') as fp:
+        new = json.load(fp)
+
+    print("{} -> {}".format(old["commit"], new["commit"]))
+
+    for case in sorted(set(old["cases"]) & set(new["cases"])):
+        print(case)
+        for name in new["cases"][case]:
+            old_result = old["cases"][case].get(name)
+            if not old_result:
+                continue
+            new_result = new["cases"][case][name]
+
+            for metric in ("p50_us", "p99_us", "alloc_peak_bytes", "bytes_written_per_hour"):
+                if metric in new_result and metric in old_result:
+                    ratio = new_result[metric] / old_result[metric] if old_result[metric] else float("inf")
+                    print("  {:<32} {:<24} {:>12.1f} -> {:>12.1f}  x{:.2f}".format(
+                        name, metric, old_result[metric], new_result[metric], ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time accounting and activity hot paths.")
+    parser.add_argument("--months", type=int, nargs="+", default=MONTHS, help="history lengths in months")
+    parser.add_argument("--apps", type=int, nargs="+", default=APPS, help="applications used per day")
+    parser.add_argument("--output", help="results file, benchmarks/results/<commit>.json by default")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args.months, args.apps, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import importlib
+
+from .metrics import METRICS, Metrics
+from .locking import FileLock, VersionStamp
+from .notifications import Notifier, HeadlessSink
+from .storage import JsonHelpers, TimeJournal
+from .shards import ShardedDays
+from .timeline import ActivityTimeline, DayTimeline
+from .scheduler import WriteBehindScheduler
+from .index import WorkingTimeIndex
+from .activity import ActivityStore, InputSampler, ProcessNameCache, ForegroundSampler, ActivityTracker
+from .database import Database, DatabaseJournal, DatabaseActivityStore
+from .render import RenderCache
+from .ledger import OvertimeLedger
+from .edits import EditSession, parse_range
+from .timekeeping import WorkTime
+from .deadlines import DeadlineScheduler
+
+# Analytics (numpy) and aggregation server/client (asyncio) are imported on first access, so they don't slow
+# down start of tray application and reports which don't use them.
+_LAZY = {
+    "Analytics": ".analytics",
+    "IntervalTable": ".analytics",
+    "ActivityTable": ".analytics",
+    "Rollups": ".server",
+    "AggregationServer": ".server",
+    "simulate_clients": ".server",
+    "AggregationClient": ".client"
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+
+    if module is None:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+    return getattr(importlib.import_module(module, __name__), name)
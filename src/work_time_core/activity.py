@@ -0,0 +1,664 @@
+import os
+import json
+import lzma
+import array
+import queue
+import datetime
+import threading
+import time
+import collections
+
+from .storage import JsonHelpers
+from .loader import validate_activity_day
+from .scheduler import WriteBehindScheduler
+from .database import Database, DatabaseActivityStore
+from .render import RenderCache
+from .timeline import ActivityTimeline
+from .locking import VersionStamp
+from .metrics import METRICS
+
+INPUT_HISTORY = 3600
+SAMPLING_INTERVAL = 1
+IDLE_SAMPLING_INTERVAL = 10
+# Sampling slows down to IDLE_SAMPLING_INTERVAL after this many seconds without keyboard/mouse input.
+IDLE_SECONDS = 60
+SAMPLES_QUEUE_SIZE = 3600
+PROCESS_CACHE_SIZE = 64
+# Process of unchanged foreground pid is validated at most once per this time.
+PROCESS_REVALIDATE_SECONDS = 60
+ARCHIVE_CACHE_SIZE = 2
+
+
+class ActivityStore:
+    """
+    Active/inactive seconds per day kept in arrays indexed by interned application id.
+
+    Every day is saved as separate binary file (count, active counters, inactive counters) and loaded only when
+    it's accessed, so old history doesn't stay in memory. Day files of closed months are packed into a single
+    lzma compressed archive per month ('2024-01.xz'), last accessed archives are kept decompressed. Day totals
+    are kept separately, one file per month (totals/2024-01.json) of which only changed months are written,
+    together with per-week and per-month rollups, all updated on every added sample. Writes are ordered by
+    version stamp of parent directory, so readers in other processes see consistent files.
+    """
+    TYPECODE = 'I'
+
+    def __init__(self, path, legacy_path=None, read_file=JsonHelpers.load):
+        self.path = path
+        self.apps_path = os.path.join(path, "apps.txt")
+        self.totals_path = os.path.join(path, "totals")
+        self.legacy_totals_path = os.path.join(path, "totals.json")
+        self.apps = []
+        self.app_ids = {}
+        self.days = {}
+        self.dirty = set()
+        self.dirty_totals = set()
+        self.totals = {}
+        self.month_dates = {}
+        self.week_totals = {}
+        self.month_totals = {}
+        self.rollup_keys = {}
+        self.archives = collections.OrderedDict()
+        self.stamp = VersionStamp.for_directory(os.path.dirname(os.path.abspath(path)))
+
+        os.makedirs(path, exist_ok=True)
+        self._load_apps()
+        self._load_totals()
+
+        if legacy_path and os.path.exists(legacy_path) and not self.totals and not self._stored_dates():
+            self.import_json(read_file(legacy_path, validate_activity_day))
+            self.save()
+
+    def _load_apps(self):
+        if os.path.exists(self.apps_path):
+            with open(self.apps_path, 'r', encoding='utf-8') as fp:
+                for name in fp.read().splitlines():
+                    self.app_ids[name] = len(self.apps)
+                    self.apps.append(name)
+
+    def _load_totals(self):
+        totals = {}
+
+        if os.path.isdir(self.totals_path):
+            for name in sorted(os.listdir(self.totals_path)):
+                if name.endswith(".json"):
+                    with open(os.path.join(self.totals_path, name), 'r') as fp:
+                        totals.update(json.load(fp))
+        else:
+            if os.path.exists(self.legacy_totals_path):
+                # Totals of all days in a single file, split into months by next save.
+                with open(self.legacy_totals_path, 'r') as fp:
+                    totals = json.load(fp)
+            else:
+                for date in self._stored_dates():
+                    if os.path.exists(self._day_path(date)):
+                        active, inactive = self.day(date)
+                        self.release(date)
+                    else:
+                        active, inactive = self._archive(date[:7])[date]
+                    totals[date] = [sum(active), sum(inactive)]
+            self.dirty_totals.update(date[:7] for date in totals)
+
+        for date, (active, inactive) in totals.items():
+            self._add_total(date, active, inactive)
+
+    def _add_total(self, date, active, inactive):
+        keys = self.rollup_keys.get(date)
+
+        if keys is None:
+            day = datetime.datetime.strptime(date, "%Y/%m/%d").date()
+            keys = self.rollup_keys[date] = ("{}-W{:02d}".format(*day.isocalendar()[:2]), date[:7])
+            self.month_dates.setdefault(date[:7], []).append(date)
+
+        for totals, key in ((self.totals, date), (self.week_totals, keys[0]), (self.month_totals, keys[1])):
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = [0, 0]
+            total[0] += active
+            total[1] += inactive
+
+    def _intern(self, name):
+        app_id = self.app_ids.get(name)
+
+        if app_id is None:
+            with open(self.apps_path, 'a', encoding='utf-8') as fp:
+                fp.write("{}\n".format(name))
+            app_id = self.app_ids[name] = len(self.apps)
+            self.apps.append(name)
+
+        return app_id
+
+    def _day_path(self, date):
+        return os.path.join(self.path, "{}.bin".format(date.replace("/", "-")))
+
+    def _archive_path(self, month):
+        return os.path.join(self.path, "{}.xz".format(month.replace("/", "-")))
+
+    def _totals_path(self, month):
+        return os.path.join(self.totals_path, "{}.json".format(month.replace("/", "-")))
+
+    def dates(self):
+        """
+        Get days with activity. Every stored day has its totals, so they're listed from totals without reading
+        day files or decompressing archives.
+
+        :return: sorted list of days in '%Y/%m/%d' format.
+        """
+        return sorted(self.totals)
+
+    def _stored_dates(self):
+        # Days of day files and archives, used only when totals are missing.
+        dates = set()
+
+        for name in os.listdir(self.path):
+            if name.endswith(".bin"):
+                dates.add(name[:-4].replace("-", "/"))
+            elif name.endswith(".xz"):
+                dates.update(self._archive(name[:-3].replace("-", "/")))
+
+        return sorted(dates)
+
+    def _archive(self, month):
+        """
+        Get days of archived month, decompressing the archive on first access.
+
+        :param month: month in '%Y/%m' format.
+        :return: dict of days with active and inactive counters arrays.
+        """
+        days = self.archives.get(month)
+
+        if days is not None:
+            self.archives.move_to_end(month)
+            return days
+
+        days = {}
+        path = self._archive_path(month)
+        if os.path.exists(path):
+            with lzma.open(path, 'rb') as fp:
+                content = fp.read()
+
+            header = array.array(self.TYPECODE)
+            position = 0
+            while position < len(content):
+                date = content[position:position + 10].decode()
+                header.frombytes(content[position + 10:position + 10 + header.itemsize])
+                count = header.pop()
+                position += 10 + header.itemsize
+                size = count * header.itemsize
+                active = array.array(self.TYPECODE, content[position:position + size])
+                inactive = array.array(self.TYPECODE, content[position + size:position + 2 * size])
+                days[date] = (active, inactive)
+                position += 2 * size
+
+        self.archives[month] = days
+        while len(self.archives) > ARCHIVE_CACHE_SIZE:
+            self.archives.popitem(last=False)
+
+        return days
+
+    def archive_closed(self, current_month):
+        """
+        Pack day files of months before current month into compressed month archives.
+
+        :param current_month: month in '%Y/%m' format.
+        :return: number of bytes written.
+        """
+        months = sorted({name[:7].replace("-", "/") for name in os.listdir(self.path) if name.endswith(".bin")})
+        months = [month for month in months if month < current_month]
+
+        if not months:
+            return 0
+
+        with self.stamp:
+            return sum(self.archive_month(month) for month in months)
+
+    def archive_month(self, month):
+        """
+        Pack day files of a month, together with already archived days, into compressed month archive.
+
+        :param month: month in '%Y/%m' format.
+        :return: number of bytes written.
+        """
+        prefix = month.replace("/", "-")
+        dates = {name[:-4].replace("-", "/") for name in os.listdir(self.path)
+                 if name.startswith(prefix) and name.endswith(".bin")}
+        dates.update(date for date in self.dirty if date.startswith(month))
+        days = dict(self._archive(month))
+        for date in dates:
+            days[date] = self.day(date)
+
+        content = bytearray()
+        for date in sorted(days):
+            active, inactive = days[date]
+            content += date.encode()
+            content += array.array(self.TYPECODE, [len(active)]).tobytes()
+            content += active.tobytes() + inactive.tobytes()
+
+        compressed = lzma.compress(bytes(content))
+        with self.stamp:
+            JsonHelpers.write_atomic(self._archive_path(month), lambda fp: fp.write(compressed), mode='wb')
+            self.archives.pop(month, None)
+
+            for date in dates:
+                if os.path.exists(self._day_path(date)):
+                    os.remove(self._day_path(date))
+                self.dirty.discard(date)
+                self.release(date)
+
+        return len(compressed)
+
+    def day(self, date):
+        """
+        Get counters of specific day, loading them from disk on first access.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: tuple of active and inactive counters arrays indexed by application id.
+        """
+        counters = self.days.get(date)
+
+        if counters is None:
+            active = array.array(self.TYPECODE)
+            inactive = array.array(self.TYPECODE)
+            path = self._day_path(date)
+
+            if os.path.exists(path):
+                with open(path, 'rb') as fp:
+                    count = array.array(self.TYPECODE)
+                    count.fromfile(fp, 1)
+                    active.fromfile(fp, count[0])
+                    inactive.fromfile(fp, count[0])
+            elif date in self.totals and os.path.exists(self._archive_path(date[:7])):
+                archived = self._archive(date[:7]).get(date)
+                if archived:
+                    # Copy, so changes of the day don't modify cached archive.
+                    active.extend(archived[0])
+                    inactive.extend(archived[1])
+
+            counters = self.days[date] = (active, inactive)
+
+        return counters
+
+    def release(self, date):
+        if date not in self.dirty:
+            self.days.pop(date, None)
+
+    def add(self, date, app, active, seconds=1):
+        app_id = self._intern(app)
+        counters = self.day(date)
+
+        if app_id >= len(counters[0]):
+            padding = [0] * (app_id + 1 - len(counters[0]))
+            counters[0].extend(padding)
+            counters[1].extend(padding)
+
+        counters[0 if active else 1][app_id] += seconds
+        self._add_total(date, seconds if active else 0, 0 if active else seconds)
+        self.dirty.add(date)
+        self.dirty_totals.add(date[:7])
+
+    def items(self, date):
+        """
+        Get applications used in specific day.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: list of (application name, active seconds, inactive seconds) tuples.
+        """
+        active, inactive = self.day(date)
+
+        return [(self.apps[app_id], active[app_id], inactive[app_id])
+                for app_id in range(len(active)) if active[app_id] or inactive[app_id]]
+
+    def summary(self, date):
+        return tuple(self.totals.get(date, (0, 0)))
+
+    def week(self, date):
+        day = datetime.datetime.strptime(date, "%Y/%m/%d").date()
+
+        return tuple(self.week_totals.get("{}-W{:02d}".format(*day.isocalendar()[:2]), (0, 0)))
+
+    def month(self, month):
+        return tuple(self.month_totals.get(month, (0, 0)))
+
+    def rollup(self, start, end):
+        """
+        Sum active/inactive seconds in date range. Fully covered months are taken from month totals, so only
+        days at both ends of range are summed separately.
+
+        :param start: first day in '%Y/%m/%d' format.
+        :param end: last day in '%Y/%m/%d' format.
+        :return: tuple of active and inactive seconds.
+        """
+        day = datetime.datetime.strptime(start, "%Y/%m/%d").date()
+        last = datetime.datetime.strptime(end, "%Y/%m/%d").date()
+        active = inactive = 0
+
+        while day <= last:
+            next_month = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+            if day.day == 1 and next_month - datetime.timedelta(days=1) <= last:
+                total = self.month_totals.get(day.strftime("%Y/%m"), (0, 0))
+                day = next_month
+            else:
+                total = self.totals.get(day.strftime("%Y/%m/%d"), (0, 0))
+                day += datetime.timedelta(days=1)
+
+            active += total[0]
+            inactive += total[1]
+
+        return active, inactive
+
+    def save(self):
+        """
+        Save days changed since last save.
+
+        :return: number of bytes written.
+        """
+        written = 0
+
+        if not self.dirty and not self.dirty_totals:
+            return written
+
+        with self.stamp:
+            for date in list(self.dirty):
+                written += self._save_day(date)
+                self.dirty.discard(date)
+
+            os.makedirs(self.totals_path, exist_ok=True)
+            for month in sorted(self.dirty_totals):
+                content = json.dumps({date: self.totals[date] for date in self.month_dates[month]})
+                JsonHelpers.write_atomic(self._totals_path(month), lambda fp: fp.write(content))
+                written += len(content)
+            self.dirty_totals.clear()
+
+            if os.path.exists(self.legacy_totals_path):
+                os.remove(self.legacy_totals_path)
+
+        return written
+
+    def _save_day(self, date):
+        active, inactive = self.days[date]
+
+        def write(fp):
+            array.array(self.TYPECODE, [len(active)]).tofile(fp)
+            active.tofile(fp)
+            inactive.tofile(fp)
+
+        JsonHelpers.write_atomic(self._day_path(date), write, mode='wb')
+
+        return (2 * len(active) + 1) * active.itemsize
+
+    def import_json(self, process_time):
+        """
+        Import activity in activity_logs.json layout.
+
+        :param process_time: dict of days with applications active/inactive seconds.
+        :return: None.
+        """
+        for date, apps in process_time.items():
+            for app, times in apps.items():
+                if app != "Summary":
+                    self.add(date, app, True, times["active"])
+                    self.add(date, app, False, times["inactive"])
+
+    def to_json(self, date):
+        return {app: {"active": active, "inactive": inactive} for app, active, inactive in self.items(date)}
+
+
+class InputSampler:
+    """
+    Keyboard/mouse activity measured once per sampling window, kept as active(1)/idle(0) bits.
+    """
+    def __init__(self, history=INPUT_HISTORY):
+        self.bits = collections.deque(maxlen=history)
+        self.last_active = time.monotonic()
+        # Input events which called back into Python, samplers polling system state have none.
+        self.callbacks = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def _detect(self):
+        raise NotImplementedError
+
+    def sample(self):
+        """
+        Close current sampling window and start next one.
+
+        :return: True if any input was detected since previous sample.
+        """
+        active = self._detect()
+        self.bits.append(1 if active else 0)
+
+        if active:
+            self.last_active = time.monotonic()
+
+        return active
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_active
+
+    def stats(self):
+        return {
+            "samples": len(self.bits),
+            "active": sum(self.bits),
+            "callbacks": self.callbacks
+        }
+
+
+class ProcessNameCache:
+    """
+    Bounded pid -> process name cache. Entries are validated with process create time, so reused pid
+    is never resolved to name of already finished process.
+
+    Looking up create time is a system call too, so it's done only when foreground pid changes or
+    revalidate seconds passed since the pid was validated.
+    """
+    def __init__(self, source, size=PROCESS_CACHE_SIZE, revalidate=PROCESS_REVALIDATE_SECONDS,
+                 clock=time.monotonic):
+        self.source = source
+        self.size = size
+        self.revalidate = revalidate
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.last = None
+        self.hits = 0
+        self.misses = 0
+        self.validations = 0
+
+    def name(self, pid):
+        now = self.clock()
+
+        if self.last and self.last[0] == pid and now - self.last[2] < self.revalidate:
+            self.hits += 1
+
+            return self.last[1]
+
+        self.validations += 1
+        create_time = self.source.create_time(pid)
+        entry = self.entries.get(pid)
+
+        if entry and entry[0] == create_time:
+            self.entries.move_to_end(pid)
+            self.hits += 1
+            self.last = (pid, entry[1], now)
+
+            return entry[1]
+
+        self.misses += 1
+        name = self.source.name(pid)
+        self.entries[pid] = (create_time, name)
+        self.entries.move_to_end(pid)
+        self.last = (pid, name, now)
+
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+        return name
+
+
+class ForegroundSampler(threading.Thread):
+    """
+    Background thread sampling foreground application and input activity every interval.
+
+    Samples are (date, application name, active, seconds, exception, seconds since midnight) tuples delivered
+    through samples queue, which is drained on GUI thread, so slow process lookups never block the tray menu.
+    Sampling slows down to idle interval while there is no keyboard/mouse input and speeds up again with the
+    first sample which detects it, every sample counts seconds of its own window.
+    """
+    def __init__(self, source, input_sampler, interval=SAMPLING_INTERVAL, idle_interval=IDLE_SAMPLING_INTERVAL):
+        super().__init__(name="ForegroundSampler", daemon=True)
+        self.source = source
+        self.input = input_sampler
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.cache = ProcessNameCache(source)
+        self.samples = queue.Queue(maxsize=SAMPLES_QUEUE_SIZE)
+        self.dropped = 0
+        self.wakeups = 0
+        self.started = time.monotonic()
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = self.current_interval()
+        next_sample = time.monotonic() + interval
+
+        while not self.stopped.wait(max(0, next_sample - time.monotonic())):
+            self.wakeups += 1
+            started = time.perf_counter()
+            try:
+                self.samples.put_nowait(self.sample(interval))
+            except queue.Full:
+                self.dropped += 1
+            METRICS.observe("sample", time.perf_counter() - started)
+            interval = self.current_interval()
+            next_sample += interval
+
+    def sample(self, seconds=1):
+        active = self.input.sample()
+        now = datetime.datetime.now()
+        second = now.hour * 3600 + now.minute * 60 + now.second
+
+        try:
+            app = self.cache.name(self.source.foreground_pid())
+        except Exception as exc:
+            return now.date(), None, active, seconds, exc, second
+
+        return now.date(), app, active, seconds, None, second
+
+    def set_interval(self, interval):
+        self.interval = interval
+
+    def current_interval(self):
+        """
+        Get length of next sampling window, based on input activity rather than on logged breaks, so e.g. work
+        after closed overtime interval is still sampled every second.
+
+        :return: seconds.
+        """
+        if self.input.idle_seconds() < IDLE_SECONDS:
+            return self.interval
+
+        return max(self.interval, self.idle_interval)
+
+    def wakeups_per_hour(self):
+        return self.wakeups * 3600 / max(60.0, time.monotonic() - self.started)
+
+    def stats(self):
+        return {
+            "wakeups": self.wakeups,
+            "queued": self.samples.qsize(),
+            "dropped": self.dropped,
+            "process_cache_hits": self.cache.hits,
+            "process_cache_misses": self.cache.misses,
+            "process_cache_validations": self.cache.validations
+        }
+
+    def stop(self):
+        self.stopped.set()
+
+
+class ActivityTracker:
+    """
+    Counts seconds of foreground application samples into activity store of current day and adds them into
+    timeline of the day (activity/timeline). Activity message is rendered once per version, which is increased
+    by every recorded sample.
+    """
+    def __init__(self, store_path, legacy_path=None, scheduler=None, read_file=JsonHelpers.load,
+                 database_path=None):
+        self.today = datetime.date.today()
+        self.now_date = str(self.today.strftime("%Y/%m/%d"))
+        if database_path:
+            self.store = DatabaseActivityStore(Database.connect(database_path), store_path, legacy_path, read_file)
+        else:
+            self.store = ActivityStore(store_path, legacy_path, read_file)
+        self.store.archive_closed(self.today.strftime("%Y/%m"))
+        self.store.day(self.now_date)
+        self.timeline = ActivityTimeline(os.path.join(store_path, "timeline"))
+        self.version = 0
+        self.rendered = RenderCache()
+        self.publisher = None
+
+        self.scheduler = scheduler or WriteBehindScheduler()
+        self.scheduler.register("activity", self.store.save)
+        self.scheduler.register("timeline", self.timeline.save)
+
+    def record(self, today, current_app, active, seconds=1, second=None):
+        if today != self.today:
+            self.store.release(self.now_date)
+            self.timeline.release(self.now_date)
+            if today.month != self.today.month:
+                self.store.archive_closed(today.strftime("%Y/%m"))
+            self.today = today
+            self.now_date = str(today.strftime("%Y/%m/%d"))
+
+        self.store.add(self.now_date, current_app, active, seconds)
+        METRICS.count("activity_samples")
+        self.version += 1
+        self.scheduler.mark_dirty("activity")
+
+        if second is not None:
+            self.timeline.add(self.now_date, second, current_app, active, seconds)
+            self.scheduler.mark_dirty("timeline")
+
+        if self.publisher:
+            self.publisher.activity_sample(self.now_date, current_app, active, seconds)
+
+    def stats(self):
+        return {
+            "loaded_days": len(getattr(self.store, "days", ())),
+            "dirty_days": len(getattr(self.store, "dirty", ())),
+            "apps": len(self.store.app_ids),
+            "timeline": self.timeline.stats(),
+            "rendered": self.rendered.stats()
+        }
+
+    def activity_message(self):
+        return self.rendered.get(("activity", self.now_date), self.version, self._render_activity)
+
+    def _render_activity(self):
+        summary = self.store.summary(self.now_date)
+        data = sorted(self.store.items(self.now_date), key=lambda item: item[1], reverse=True)
+        lines = ["Application usage:", ""]
+
+        for app, active, inactive in data:
+            lines.append(self._activity_line(app, active, inactive))
+
+        lines.extend(["", self._activity_line("Summary", summary[0], summary[1])])
+
+        hours = self.timeline.hours(self.now_date)
+        if hours:
+            lines.extend(["", "Timeline:", ""])
+            for hour, app, active in hours:
+                lines.append("{:02d}:00 - {:02d}:00\t{:<20}\tactive: {}".format(
+                    hour, hour + 1, app, datetime.timedelta(seconds=active)))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _activity_line(app, active, inactive):
+        converted_active = str(datetime.timedelta(seconds=active))
+        converted_inactive = str(datetime.timedelta(seconds=inactive))
+
+        return "{:<20}\tactive: {:<6}\tinactive: {}".format(app, converted_active, converted_inactive)
@@ -0,0 +1,419 @@
+import os
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .intervals import DAY_SECONDS, entry_epochs
+from .storage import TimeJournal
+from .activity import ActivityStore
+from .database import DATABASE_NAME, Database, DatabaseActivityStore
+from .locking import VersionStamp
+from .loader import StreamingJsonLoader, validate_activity_day
+
+HOUR_SECONDS = 3600
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# 1970/01/01 (day 0) was Thursday.
+EPOCH_WEEKDAY = 3
+REPORTS = ("apps", "heatmap", "weekly", "times")
+FIELDS = {
+    "apps": ("user", "period", "app", "active_seconds", "inactive_seconds", "active_ratio"),
+    "heatmap": ("user", "weekday") + tuple("{:02d}".format(hour) for hour in range(24)),
+    "weekly": ("user", "week", "working_seconds", "active_seconds", "inactive_seconds"),
+    "times": ("user", "period", "days", "median_start", "median_end")
+}
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("Analytics require numpy, install it with 'pip install numpy'.")
+
+
+def _day_numbers(dates):
+    # '%Y/%m/%d' dates into days since 1970/01/01.
+    if not len(dates):
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.array(numpy.char.replace(numpy.asarray(dates, dtype=str), "/", "-"),
+                       dtype="datetime64[D]").astype(numpy.int64)
+
+
+def _period_keys(days, period):
+    if period == "all":
+        return numpy.zeros(len(days), dtype=numpy.int64), ["all"]
+
+    unit = "M" if period == "month" else "Y"
+    keys = days.astype("datetime64[D]").astype("datetime64[{}]".format(unit)).astype(numpy.int64)
+    labels = [str(key).replace("-", "/")
+              for key in numpy.unique(keys).astype("datetime64[{}]".format(unit))]
+
+    return keys, labels
+
+
+def _group_starts(keys):
+    # Start indexes of runs of equal keys in sorted array.
+    return numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]]) if len(keys) else numpy.zeros(0, dtype=int)
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def week_label(week):
+    monday = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(week) * 7 - EPOCH_WEEKDAY)
+
+    return "{}-W{:02d}".format(*monday.isocalendar()[:2])
+
+
+class IntervalTable:
+    """
+    Closed intervals of working time as arrays of epoch seconds: start, end, UTC offset of start and day which
+    the interval is logged under (days since 1970/01/01), sorted by day and start. Open intervals aren't
+    included, as history has no current time to close them with.
+    """
+    def __init__(self, days, starts, ends, offsets):
+        order = numpy.lexsort((starts, days))
+        self.days = days[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.offsets = offsets[order]
+
+    @classmethod
+    def from_days(cls, working_time):
+        """
+        Build table from days of log, e.g. WorkTime.working_time (shards or database days) or loaded log.json.
+
+        :param working_time: mapping of days with START/END entries lists.
+        :return: IntervalTable.
+        """
+        _require_numpy()
+        dates, starts, ends, offsets = [], [], [], []
+
+        for date in working_time:
+            for elements in working_time[date]:
+                start, end, offset = entry_epochs(date, elements)
+                if end is not None:
+                    dates.append(date)
+                    starts.append(start)
+                    ends.append(end)
+                    offsets.append(offset)
+
+        return cls(_day_numbers(dates), numpy.array(starts, dtype=numpy.int64),
+                   numpy.array(ends, dtype=numpy.int64), numpy.array(offsets, dtype=numpy.int64))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def pieces(self, size):
+        """
+        Split intervals at multiples of size seconds of local time, e.g. at full hours. Offset of start is used
+        for whole interval, so durations stay exact across DST change.
+
+        :param size: length of bucket in seconds.
+        :return: tuple of bucket numbers (local time // size) and seconds of every piece.
+        """
+        local_starts = self.starts + self.offsets
+        local_ends = self.ends + self.offsets
+        first = local_starts // size
+        counts = numpy.maximum((local_ends - 1) // size - first + 1, 0)
+
+        intervals = numpy.repeat(numpy.arange(len(counts)), counts)
+        within = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        buckets = first[intervals] + within
+        seconds = (numpy.minimum(local_ends[intervals], (buckets + 1) * size) -
+                   numpy.maximum(local_starts[intervals], buckets * size))
+
+        return buckets, seconds
+
+
+class ActivityTable:
+    """
+    Active/inactive seconds of applications as matrices of days x applications, sorted by day.
+    """
+    def __init__(self, days, apps, active, inactive):
+        order = numpy.argsort(days, kind="stable")
+        self.days = days[order]
+        self.apps = list(apps)
+        self.active = active[order]
+        self.inactive = inactive[order]
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Build table from activity store, e.g. ActivityTracker.store. Day counters of ActivityStore are copied
+        from their arrays without conversion of single values.
+
+        :param store: ActivityStore or DatabaseActivityStore.
+        :return: ActivityTable.
+        """
+        _require_numpy()
+
+        if isinstance(store, DatabaseActivityStore):
+            return cls.from_rows(store.database.activity_rollup("0000/00/00", "9999/99/99", "day"))
+
+        dates = store.dates()
+        active = numpy.zeros((len(dates), len(store.apps)), dtype=numpy.int64)
+        inactive = numpy.zeros_like(active)
+
+        for row, date in enumerate(dates):
+            day_active, day_inactive = store.day(date)
+            active[row, :len(day_active)] = numpy.frombuffer(day_active, dtype=numpy.uint32)
+            inactive[row, :len(day_inactive)] = numpy.frombuffer(day_inactive, dtype=numpy.uint32)
+            store.release(date)
+
+        return cls(_day_numbers(dates), store.apps, active, inactive)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build table from (date, application, active seconds, inactive seconds) rows.
+
+        :param rows: iterable of rows.
+        :return: ActivityTable.
+        """
+        _require_numpy()
+        rows = list(rows)
+
+        if not rows:
+            empty = numpy.zeros((0, 0), dtype=numpy.int64)
+            return cls(numpy.zeros(0, dtype=numpy.int64), [], empty, empty)
+
+        dates, apps, active, inactive = zip(*rows)
+        dates, day_rows = numpy.unique(numpy.asarray(dates, dtype=str), return_inverse=True)
+        apps, app_columns = numpy.unique(numpy.asarray(apps, dtype=str), return_inverse=True)
+
+        matrices = []
+        for values in (active, inactive):
+            matrix = numpy.zeros((len(dates), len(apps)), dtype=numpy.int64)
+            numpy.add.at(matrix, (day_rows, app_columns), numpy.asarray(values, dtype=numpy.int64))
+            matrices.append(matrix)
+
+        return cls(_day_numbers(dates), apps.tolist(), *matrices)
+
+    @classmethod
+    def from_process_time(cls, process_time):
+        """
+        Build table from days of activity_logs.json format ({app: {"active": s, "inactive": s}}).
+
+        :param process_time: mapping of days.
+        :return: ActivityTable.
+        """
+        return cls.from_rows((date, app, times["active"], times["inactive"])
+                             for date in process_time for app, times in process_time[date].items()
+                             if app != "Summary")
+
+
+class Analytics:
+    """
+    Reports over whole history of one user, computed with array operations over IntervalTable and
+    ActivityTable.
+    """
+    def __init__(self, intervals, activity=None):
+        self.intervals = intervals
+        self.activity = activity
+
+    @classmethod
+    def from_sources(cls, working_time, store=None):
+        """
+        Build analytics from the same structures the application keeps (WorkTime.working_time,
+        ActivityTracker.store).
+
+        :return: Analytics.
+        """
+        return cls(IntervalTable.from_days(working_time), ActivityTable.from_store(store) if store else None)
+
+    def app_ratios(self, period="month"):
+        """
+        Get active and inactive seconds and active ratio of every application.
+
+        :param period: 'month', 'year' or 'all'.
+        :return: list of (period, application, active seconds, inactive seconds, active ratio) tuples.
+        """
+        activity = self.activity
+        if activity is None or not len(activity.days):
+            return []
+
+        keys, labels = _period_keys(activity.days, period)
+        starts = _group_starts(keys)
+        active = numpy.add.reduceat(activity.active, starts, axis=0)
+        inactive = numpy.add.reduceat(activity.inactive, starts, axis=0)
+        total = active + inactive
+        ratios = numpy.divide(active, total, out=numpy.zeros(total.shape), where=total > 0)
+
+        rows = []
+        for group, app in zip(*numpy.nonzero(total)):
+            rows.append((labels[group], activity.apps[app], int(active[group, app]), int(inactive[group, app]),
+                         round(float(ratios[group, app]), 4)))
+
+        return sorted(rows, key=lambda row: (row[0], -row[2], row[1]))
+
+    def hour_heatmap(self):
+        """
+        Get working time per weekday and hour of day (local time).
+
+        :return: 7 x 24 array of seconds, Monday first.
+        """
+        buckets, seconds = self.intervals.pieces(HOUR_SECONDS)
+        weekdays = (buckets // 24 + EPOCH_WEEKDAY) % 7
+
+        return numpy.bincount(weekdays * 24 + buckets % 24, weights=seconds, minlength=7 * 24).reshape(7, 24)
+
+    def weekly_trend(self):
+        """
+        Get working time and applications activity per week (Monday to Sunday).
+
+        :return: list of (ISO week, working seconds, active seconds, inactive seconds) tuples.
+        """
+        buckets, seconds = self.intervals.pieces(DAY_SECONDS)
+        weeks = [(buckets + EPOCH_WEEKDAY) // 7]
+        activity = self.activity
+        if activity is not None and len(activity.days):
+            weeks.append((activity.days + EPOCH_WEEKDAY) // 7)
+
+        all_weeks = numpy.concatenate(weeks)
+        if not len(all_weeks):
+            return []
+
+        first = all_weeks.min()
+        size = all_weeks.max() - first + 1
+        working = numpy.bincount(weeks[0] - first, weights=seconds, minlength=size)
+        active = numpy.zeros(size)
+        inactive = numpy.zeros(size)
+        if len(weeks) > 1:
+            active = numpy.bincount(weeks[1] - first, weights=activity.active.sum(axis=1), minlength=size)
+            inactive = numpy.bincount(weeks[1] - first, weights=activity.inactive.sum(axis=1), minlength=size)
+
+        return [(week_label(first + week), int(working[week]), int(active[week]), int(inactive[week]))
+                for week in numpy.unique(all_weeks - first)]
+
+    def start_end_medians(self, period="month"):
+        """
+        Get median start of first interval and end of last interval of days (local time, end after midnight
+        is over 24:00:00).
+
+        :param period: 'month', 'year' or 'all'.
+        :return: list of (period, number of days, median start seconds, median end seconds) tuples.
+        """
+        intervals = self.intervals
+        if not len(intervals):
+            return []
+
+        # Intervals are sorted by day and start, so first start and last end of every day are reduced at once.
+        starts = _group_starts(intervals.days)
+        days = intervals.days[starts]
+        midnights = days * DAY_SECONDS
+        first_starts = numpy.minimum.reduceat(intervals.starts + intervals.offsets, starts) - midnights
+        last_ends = numpy.maximum.reduceat(intervals.ends + intervals.offsets, starts) - midnights
+
+        keys, labels = _period_keys(days, period)
+        bounds = numpy.r_[_group_starts(keys), len(keys)]
+
+        return [(labels[group], int(end - start), float(numpy.median(first_starts[start:end])),
+                 float(numpy.median(last_ends[start:end])))
+                for group, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+    def history_message(self, months=3, apps=5):
+        """
+        Render summary of recent months: median start/end times, most used applications of last month with their
+        active ratio and busiest hours.
+
+        :param months: number of months of start/end times.
+        :param apps: number of applications.
+        :return: text of message.
+        """
+        lines = ["Start/end times (median):", ""]
+        for key, days, start, end in self.start_end_medians("month")[-months:]:
+            lines.append("{:<20} {} - {} ({} days)".format(key, format_seconds(start), format_seconds(end), days))
+
+        ratios = self.app_ratios("month")
+        if ratios:
+            month = ratios[-1][0]
+            lines.extend(["", "Applications in {}:".format(month), ""])
+            for _, app, active, inactive, ratio in [row for row in ratios if row[0] == month][:apps]:
+                lines.append("{:<20} active: {}\tratio: {:.0%}".format(app[:20], format_seconds(active), ratio))
+
+        heatmap = self.hour_heatmap()
+        if heatmap.any():
+            hours = heatmap.sum(axis=0)
+            lines.extend(["", "Busiest hours:", ""])
+            for hour in numpy.argsort(hours)[::-1][:3]:
+                lines.append("{:02d}:00 - {:02d}:00 {:>16}".format(hour, (hour + 1) % 24, format_seconds(hours[hour])))
+
+        return "\n".join(lines)
+
+
+def load_user(path, database_path=None):
+    """
+    Load history of user directory, from database, log/ shards or log.json with journal.log and activity/ store or
+    activity_logs.json. Files are only read, so history of running logger can be loaded on any thread.
+
+    :param path: user directory.
+    :param database_path: database file, if it isn't work_time.db in user directory.
+    :return: Analytics.
+    """
+    _require_numpy()
+    database_path = database_path or os.path.join(path, DATABASE_NAME)
+
+    if os.path.exists(database_path):
+        database = Database(database_path, read_only=True)
+        try:
+            return Analytics(IntervalTable.from_days(database.working_time()),
+                             ActivityTable.from_rows(database.activity_rollup("0000/00/00", "9999/99/99", "day")))
+        finally:
+            database.connection.close()
+
+    return VersionStamp.for_directory(path).read_consistent(lambda: _load_files(path))[0]
+
+
+def _load_file(file_path, validate):
+    if not os.path.exists(file_path):
+        return {}
+
+    return StreamingJsonLoader(validate).load(file_path)
+
+
+def _load_files(path):
+    # Events of running logger since last compaction are only in journal.
+    journal = TimeJournal(os.path.join(path, "log.json"), os.path.join(path, "overtimes.json"),
+                          os.path.join(path, "journal.log"), _load_file)
+    working_time, _ = journal.read()
+
+    if os.path.isdir(os.path.join(path, "activity")):
+        activity = ActivityTable.from_store(ActivityStore(os.path.join(path, "activity")))
+    elif os.path.exists(os.path.join(path, "activity_logs.json")):
+        activity = ActivityTable.from_process_time(
+            StreamingJsonLoader(validate_activity_day).load(os.path.join(path, "activity_logs.json")))
+    else:
+        activity = None
+
+    return Analytics(IntervalTable.from_days(working_time), activity)
+
+
+def user_analytics(path, report="apps", period="month"):
+    """
+    Calculate analytics report of single user.
+
+    :param path: user directory.
+    :param report: one of REPORTS.
+    :param period: 'month', 'year' or 'all' for 'apps' and 'times' reports.
+    :return: list of report rows.
+    """
+    user = os.path.basename(os.path.normpath(path))
+    analytics = load_user(path)
+
+    if report == "apps":
+        return [dict(zip(FIELDS[report], (user,) + row)) for row in analytics.app_ratios(period)]
+
+    if report == "heatmap":
+        return [dict(zip(FIELDS[report], [user, weekday] + [int(seconds) for seconds in hours]))
+                for weekday, hours in zip(WEEKDAYS, analytics.hour_heatmap())]
+
+    if report == "weekly":
+        return [dict(zip(FIELDS[report], (user,) + row)) for row in analytics.weekly_trend()]
+
+    return [dict(zip(FIELDS[report], (user, key, days, format_seconds(start), format_seconds(end))))
+            for key, days, start, end in analytics.start_end_medians(period)]
@@ -0,0 +1,91 @@
+import sys
+import csv
+import json
+import argparse
+import functools
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .report import FIELDS, user_report
+from . import database
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="work_time_core",
+        description="Working time, overtimes and applications activity reports of many users."
+    )
+    parser.add_argument("users", nargs="+",
+                        help="user directories with log.json, overtimes.json and activity data")
+    parser.add_argument("--period", choices=("day", "month"), default="day", help="report period (default: day)")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv",
+                        help="csv or json (one object per line) output (default: csv)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--output", default="-", help="output file (default: stdout)")
+
+    return parser.parse_args(argv)
+
+
+def _parse_analytics_args(argv):
+    from . import analytics
+
+    parser = argparse.ArgumentParser(
+        prog="work_time_core analytics",
+        description="Historical analytics of many users: active ratio of applications, heatmap of working hours, "
+                    "weekly trends and median start/end times."
+    )
+    parser.add_argument("users", nargs="+", help="user directories")
+    parser.add_argument("--report", choices=analytics.REPORTS, default="apps", help="report (default: apps)")
+    parser.add_argument("--period", choices=("month", "year", "all"), default="month",
+                        help="period of apps and times reports (default: month)")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv",
+                        help="csv or json (one object per line) output (default: csv)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--output", default="-", help="output file (default: stdout)")
+
+    return parser.parse_args(argv)
+
+
+def _write_reports(args, fields, report):
+    fp = sys.stdout if args.output == "-" else open(args.output, 'w', newline='')
+
+    try:
+        if args.format == "csv":
+            writer = csv.DictWriter(fp, fieldnames=fields)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(row):
+                fp.write("{}\n".format(json.dumps(row)))
+
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            # Rows are written as soon as report of every user is ready.
+            for rows in executor.map(report, args.users):
+                for row in rows:
+                    write(row)
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Database import/export, migration and aggregation server have their own commands. Server (asyncio) and
+    # analytics (numpy) are imported only by their commands, as they take longer to import than the rest.
+    if argv and argv[0] in ("import", "export", "migrate"):
+        return database.main(argv)
+    if argv and argv[0] in ("serve", "simulate"):
+        from . import server
+        return server.main(argv)
+    if argv and argv[0] == "analytics":
+        from . import analytics
+        args = _parse_analytics_args(argv[1:])
+        _write_reports(args, analytics.FIELDS[args.report],
+                       functools.partial(analytics.user_analytics, report=args.report, period=args.period))
+        return 0
+
+    args = _parse_args(argv)
+    _write_reports(args, FIELDS, functools.partial(user_report, period=args.period))
+
+    return 0
@@ -0,0 +1,144 @@
+import json
+import queue
+import socket
+import threading
+
+DEFAULT_PORT = 8765
+CLIENT_QUEUE_SIZE = 10000
+SEND_INTERVAL = 10
+RECONNECT_INTERVAL = 60
+
+
+class AggregationClient(threading.Thread):
+    """
+    Background thread sending interval, overtime and activity events of one user to aggregation server.
+
+    Events are queued without blocking caller. Activity seconds are summed per day and application and sent
+    every SEND_INTERVAL, so per-second samples don't become per-second messages. Events are kept while server
+    is unreachable and sent after reconnecting; events over queue size are dropped and counted.
+    """
+    def __init__(self, address, user, send_interval=SEND_INTERVAL):
+        super().__init__(name="AggregationClient", daemon=True)
+        self.address = self.parse_address(address)
+        self.user = user
+        self.send_interval = send_interval
+        self.events = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.activity = {}
+        self.pending = []
+        self.socket = None
+        self.sent = 0
+        self.dropped = 0
+        self.error = None
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def parse_address(address):
+        """
+        Parse 'host:port' or Unix socket path.
+
+        :param address: address string.
+        :return: (host, port) tuple or Unix socket path.
+        """
+        host, separator, port = address.rpartition(":")
+
+        if separator and port.isdigit():
+            return host or "127.0.0.1", int(port)
+        if address.isdigit():
+            return "127.0.0.1", int(address)
+        if "/" not in address and "\\" not in address:
+            return address, DEFAULT_PORT
+
+        return address
+
+    def interval(self, date, index, elements):
+        event = {"type": "interval", "date": date, "index": index, "start": elements["START"], "end": elements["END"]}
+        if "TS" in elements:
+            event["ts"] = list(elements["TS"])
+            event["utc"] = list(elements["UTC"])
+        self._put(event)
+
+    def overtime(self, date, value):
+        self._put({"type": "overtime", "date": date, "value": value})
+
+    def activity_sample(self, date, app, active, seconds=1):
+        self._put({"type": "activity", "date": date, "app": app, "active": seconds if active else 0,
+                   "inactive": 0 if active else seconds})
+
+    def _put(self, event):
+        event["user"] = self.user
+
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while not self.stopped.wait(self.send_interval):
+            self._send()
+        self._send()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _collect(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event["type"] != "activity":
+                self.pending.append(event)
+                continue
+
+            total = self.activity.get((event["date"], event["app"]))
+            if total is None:
+                total = self.activity[(event["date"], event["app"])] = dict(event)
+            else:
+                total["active"] += event["active"]
+                total["inactive"] += event["inactive"]
+
+        self.pending.extend(self.activity.values())
+        self.activity = {}
+
+    def _send(self):
+        self._collect()
+        if not self.pending:
+            return
+
+        if len(self.pending) > CLIENT_QUEUE_SIZE:
+            self.dropped += len(self.pending) - CLIENT_QUEUE_SIZE
+            del self.pending[:len(self.pending) - CLIENT_QUEUE_SIZE]
+
+        try:
+            if self.socket is None:
+                self.socket = self._connect()
+            self.socket.sendall("".join("{}\n".format(json.dumps(event)) for event in self.pending).encode())
+        except OSError as exc:
+            self.error = exc
+            self._close()
+            # Events are sent again after reconnecting.
+            self.stopped.wait(RECONNECT_INTERVAL)
+            return
+
+        self.sent += len(self.pending)
+        self.pending = []
+
+    def _connect(self):
+        if isinstance(self.address, str):
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(5)
+            connection.connect(self.address)
+        else:
+            connection = socket.create_connection(self.address, timeout=5)
+
+        return connection
+
+    def _close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def stats(self):
+        return {"sent": self.sent, "dropped": self.dropped, "queued": self.events.qsize() + len(self.pending),
+                "error": str(self.error) if self.error else ""}
@@ -0,0 +1,599 @@
+import os
+import copy
+import array
+import sqlite3
+import argparse
+import datetime
+
+from collections.abc import MutableMapping
+from urllib.request import pathname2url
+
+from .storage import JsonHelpers, TimeJournal
+from .loader import validate_activity_day, validate_log_day, validate_overtime
+from .intervals import new_entry, close_entry, normalize_day
+
+DATABASE_NAME = "work_time.db"
+
+# Columns added to tables of older databases.
+UPGRADES = {
+    "intervals": ("start_ts INTEGER", "end_ts INTEGER", "start_offset INTEGER", "end_offset INTEGER")
+}
+INTERVAL_COLUMNS = "start, end, start_ts, end_ts, start_offset, end_offset"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intervals (
+    date TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    start_ts INTEGER,
+    end_ts INTEGER,
+    start_offset INTEGER,
+    end_offset INTEGER,
+    PRIMARY KEY (date, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS overtimes (
+    date TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS apps (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS activity (
+    date TEXT NOT NULL,
+    app_id INTEGER NOT NULL REFERENCES apps (id),
+    active INTEGER NOT NULL DEFAULT 0,
+    inactive INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, app_id)
+) WITHOUT ROWID;
+"""
+
+
+class Database:
+    """
+    SQLite database (WAL mode) with intervals, overtimes and applications activity tables, all keyed by date.
+
+    There is a single connection per database file shared by all stores. Changes are written as row inserts
+    into one open transaction which is committed when stores are flushed, so many samples cost one commit.
+    """
+    connections = {}
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.pending_bytes = 0
+        self.interval_columns = INTERVAL_COLUMNS
+
+        if read_only:
+            # Reports and analytics neither create nor upgrade tables, columns missing in database which wasn't
+            # upgraded yet are read as NULL.
+            self.connection = sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(path))),
+                                              uri=True)
+            existing = {row[1] for row in self.connection.execute("PRAGMA table_info(intervals)")}
+            self.interval_columns = ", ".join(column if column in existing else "NULL"
+                                              for column in INTERVAL_COLUMNS.split(", "))
+            return
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._upgrade()
+        self.connection.commit()
+
+    def _upgrade(self):
+        for table, columns in UPGRADES.items():
+            existing = {row[1] for row in self.connection.execute("PRAGMA table_info({})".format(table))}
+            for column in columns:
+                if column.split()[0] not in existing:
+                    self.connection.execute("ALTER TABLE {} ADD COLUMN {}".format(table, column))
+
+    @classmethod
+    def connect(cls, path):
+        """
+        Get shared database of file, opening it on first use.
+
+        :param path: path to database file.
+        :return: Database.
+        """
+        path = os.path.abspath(path)
+        database = cls.connections.get(path)
+
+        if database is None:
+            database = cls.connections[path] = cls(path)
+
+        return database
+
+    def write(self, sql, params=()):
+        self.connection.execute(sql, params)
+        self.pending_bytes += sum(len(str(param)) for param in params)
+
+    def query(self, sql, params=()):
+        return self.connection.execute(sql, params).fetchall()
+
+    def commit(self):
+        """
+        Commit pending changes.
+
+        :return: approximate size of written rows in bytes.
+        """
+        written = self.pending_bytes
+
+        if self.connection.in_transaction:
+            self.connection.commit()
+        self.pending_bytes = 0
+
+        return written
+
+    def rollback(self):
+        """
+        Drop pending changes.
+
+        :return: None.
+        """
+        self.connection.rollback()
+        self.pending_bytes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+        self.connections.pop(self.path, None)
+
+    def is_empty(self):
+        return not any(self.query("SELECT 1 FROM {} LIMIT 1".format(table))
+                       for table in ("intervals", "overtimes", "activity"))
+
+    def interval_dates(self):
+        return [date for date, in self.query("SELECT DISTINCT date FROM intervals ORDER BY date")]
+
+    @staticmethod
+    def _entry(start, end, start_ts, end_ts, start_offset, end_offset):
+        if start_ts is None:
+            # Interval written before epoch seconds were kept.
+            return {"START": start, "END": end}
+
+        return {"START": start, "END": end, "TS": [start_ts, end_ts], "UTC": [start_offset, end_offset]}
+
+    def intervals(self, date):
+        return [self._entry(*row) for row in self.query(
+            "SELECT {} FROM intervals WHERE date = ? ORDER BY idx".format(self.interval_columns), (date,))]
+
+    def set_interval(self, date, index, elements):
+        timestamps = elements.get("TS", (None, None))
+        offsets = elements.get("UTC", (None, None))
+        self.write("INSERT OR REPLACE INTO intervals (date, idx, {}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)".format(
+            INTERVAL_COLUMNS), (date, index, elements["START"], elements["END"]) + tuple(timestamps) + tuple(offsets))
+
+    def set_day(self, date, intervals):
+        self.write("DELETE FROM intervals WHERE date = ?", (date,))
+
+        for index, elements in enumerate(intervals):
+            self.set_interval(date, index, elements)
+
+    def working_time(self):
+        working_time = {}
+
+        for row in self.query("SELECT date, {} FROM intervals ORDER BY date, idx".format(self.interval_columns)):
+            working_time.setdefault(row[0], []).append(self._entry(*row[1:]))
+
+        return working_time
+
+    def overtimes(self, month=None):
+        if month is None:
+            return dict(self.query("SELECT date, value FROM overtimes ORDER BY date"))
+
+        return dict(self.query("SELECT date, value FROM overtimes WHERE date BETWEEN ? AND ? ORDER BY date",
+                               ("{}/01".format(month), "{}/31".format(month))))
+
+    def set_overtime(self, date, value):
+        if value is None:
+            self.write("DELETE FROM overtimes WHERE date = ?", (date,))
+        else:
+            self.write("INSERT OR REPLACE INTO overtimes (date, value) VALUES (?, ?)", (date, value))
+
+    def replace_time(self, working_time, overtimes):
+        """
+        Replace all intervals and overtimes with given days.
+
+        :param working_time: dict of days with START/END entries lists.
+        :param overtimes: dict of days with overtime values.
+        :return: None.
+        """
+        self.write("DELETE FROM intervals")
+        self.write("DELETE FROM overtimes")
+
+        for date in working_time:
+            for index, elements in enumerate(working_time[date]):
+                self.set_interval(date, index, elements)
+        for date, value in overtimes.items():
+            self.set_overtime(date, value)
+
+    def app_ids(self):
+        return dict(self.query("SELECT name, id FROM apps"))
+
+    def add_app(self, name):
+        self.write("INSERT INTO apps (name) VALUES (?)", (name,))
+
+        return self.query("SELECT id FROM apps WHERE name = ?", (name,))[0][0]
+
+    def add_activity(self, date, app_id, active, inactive):
+        self.write("INSERT INTO activity (date, app_id, active, inactive) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT (date, app_id) DO UPDATE SET "
+                   "active = active + excluded.active, inactive = inactive + excluded.inactive",
+                   (date, app_id, active, inactive))
+
+    def activity_dates(self):
+        return [date for date, in self.query("SELECT DISTINCT date FROM activity ORDER BY date")]
+
+    def activity_items(self, date):
+        return self.query("SELECT apps.name, active, inactive FROM activity JOIN apps ON apps.id = app_id "
+                          "WHERE date = ? AND (active > 0 OR inactive > 0) ORDER BY app_id", (date,))
+
+    def activity_sum(self, start, end):
+        active, inactive = self.query("SELECT TOTAL(active), TOTAL(inactive) FROM activity "
+                                      "WHERE date BETWEEN ? AND ?", (start, end))[0]
+
+        return int(active), int(inactive)
+
+    def activity_rollup(self, start, end, period):
+        """
+        Sum activity per period and application in date range.
+
+        :param period: 'day' or 'month'.
+        :return: list of (period, application name, active seconds, inactive seconds) tuples.
+        """
+        length = 10 if period == "day" else 7
+
+        return self.query("SELECT substr(date, 1, ?) AS period, apps.name, SUM(active), SUM(inactive) "
+                          "FROM activity JOIN apps ON apps.id = app_id WHERE date BETWEEN ? AND ? "
+                          "GROUP BY period, app_id ORDER BY period, apps.name", (length, start, end))
+
+
+class DatabaseDays(MutableMapping):
+    """
+    Days of intervals table where intervals of a day are queried on first access.
+    """
+    def __init__(self, database):
+        self.data = dict.fromkeys(database.interval_dates())
+        self.database = database
+
+    def __getitem__(self, key):
+        value = self.data[key]
+
+        if value is None:
+            value = self.data[key] = self.database.intervals(key)
+
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class DatabaseJournal:
+    """
+    Time storage keeping intervals and overtimes in database, with the same interface as TimeJournal.
+
+    log.json and overtimes.json are imported once into empty database and written back by export, e.g. to be
+    edited manually and imported again by reload.
+    """
+    def __init__(self, database, log_path, overtimes_path, journal_path, read_file=JsonHelpers.load):
+        self.database = database
+        self.log_path = log_path
+        self.overtimes_path = overtimes_path
+        self.journal_path = journal_path
+        self.read_file = read_file
+        self.working_time = {}
+        self.overtimes = {}
+        self.load_stats = {}
+        # Database has no journal, every change is written by its transaction.
+        self.replayed_dates = set()
+        self.error = None
+
+    def load(self):
+        """
+        Load days of database, importing json files into empty database first.
+
+        :return: tuple of working time and overtimes dicts.
+        """
+        if self.database.is_empty():
+            self.import_json()
+
+        self.working_time = DatabaseDays(self.database)
+        self.overtimes = self.database.overtimes()
+        self.load_stats = {self.database.path: {"days": len(self.working_time), "overtimes": len(self.overtimes)}}
+
+        return self.working_time, self.overtimes
+
+    def reload(self):
+        """
+        Import manually edited log.json and overtimes.json, written by export().
+
+        :return: tuple of working time and overtimes dicts.
+        """
+        self.database.replace_time(self.read_file(self.log_path, validate_log_day),
+                                   self.read_file(self.overtimes_path, validate_overtime))
+        self.database.commit()
+
+        return self.load()
+
+    def import_json(self):
+        journal = TimeJournal(self.log_path, self.overtimes_path, self.journal_path, self.read_file)
+        working_time, overtimes = journal.load()
+        # Journal is folded into snapshots, so its events aren't replayed over manually edited files later.
+        journal.close()
+
+        self.database.replace_time(working_time, overtimes)
+        self.database.commit()
+
+    def export(self):
+        """
+        Write database content into log.json and overtimes.json.
+
+        :return: None.
+        """
+        try:
+            self.sync()
+            JsonHelpers.dump_atomic(self.log_path, self.database.working_time())
+            JsonHelpers.dump_atomic(self.overtimes_path, self.database.overtimes())
+        except Exception as exc:
+            self.error = exc
+
+    def start(self, date, timestamp, offset):
+        day = self.working_time.get(date)
+        if day is None:
+            day = self.working_time[date] = list()
+
+        index = len(day)
+        day.append(new_entry(timestamp, offset))
+        self._write(self.database.set_interval, date, index, day[index])
+
+        return index
+
+    def end(self, date, timestamp, offset):
+        index = len(self.working_time[date]) - 1
+        entry = self.working_time[date][index]
+        close_entry(date, entry, timestamp, offset)
+        self._write(self.database.set_interval, date, index, entry)
+
+        return index
+
+    def overtime(self, date, value):
+        if value is None:
+            self.overtimes.pop(date, None)
+        else:
+            self.overtimes[date] = value
+        self._write(self.database.set_overtime, date, value)
+
+    def set_day(self, date, intervals):
+        if intervals is None:
+            self.working_time.pop(date, None)
+        else:
+            self.working_time[date] = copy.deepcopy(intervals)
+        self._write(self.database.set_day, date, intervals or [])
+
+    def month_overtimes(self, month):
+        return self.database.overtimes(month)
+
+    def _write(self, write, *args):
+        try:
+            write(*args)
+        except sqlite3.Error as exc:
+            self.error = exc
+
+    def sync(self):
+        return self.database.commit()
+
+    def compact(self, background=True):
+        self.sync()
+
+    def pop_error(self):
+        error, self.error = self.error, None
+
+        return error
+
+    def close(self):
+        self.database.commit()
+
+
+class DatabaseActivityStore:
+    """
+    Applications activity kept in database, with the same interface as ActivityStore.
+
+    Every sample is an upsert of (date, application) row, week/month/range sums are queries over date index.
+    """
+    def __init__(self, database, path=None, legacy_path=None, read_file=JsonHelpers.load):
+        self.database = database
+        self.app_ids = database.app_ids()
+
+        if not database.activity_dates():
+            if path and os.path.isdir(path):
+                self._import_store(path)
+            elif legacy_path and os.path.exists(legacy_path):
+                self.import_json(read_file(legacy_path, validate_activity_day))
+            database.commit()
+
+    def _import_store(self, path):
+        from .activity import ActivityStore
+
+        store = ActivityStore(path)
+        for date in store.dates():
+            for app, active, inactive in store.items(date):
+                self.database.add_activity(date, self._intern(app), active, inactive)
+            store.release(date)
+
+    def _intern(self, name):
+        app_id = self.app_ids.get(name)
+
+        if app_id is None:
+            app_id = self.app_ids[name] = self.database.add_app(name)
+
+        return app_id
+
+    def dates(self):
+        return self.database.activity_dates()
+
+    def day(self, date):
+        active = array.array('I')
+        inactive = array.array('I')
+
+        for app, app_active, app_inactive in self.database.activity_items(date):
+            app_id = self.app_ids[app]
+            if app_id >= len(active):
+                padding = [0] * (app_id + 1 - len(active))
+                active.extend(padding)
+                inactive.extend(padding)
+            active[app_id] = app_active
+            inactive[app_id] = app_inactive
+
+        return active, inactive
+
+    def release(self, date):
+        pass
+
+    def archive_closed(self, current_month):
+        return 0
+
+    def add(self, date, app, active, seconds=1):
+        self.database.add_activity(date, self._intern(app), seconds if active else 0, 0 if active else seconds)
+
+    def items(self, date):
+        return self.database.activity_items(date)
+
+    def summary(self, date):
+        return self.database.activity_sum(date, date)
+
+    def week(self, date):
+        day = datetime.datetime.strptime(date, "%Y/%m/%d").date()
+        monday = day - datetime.timedelta(days=day.weekday())
+
+        return self.database.activity_sum(monday.strftime("%Y/%m/%d"),
+                                          (monday + datetime.timedelta(days=6)).strftime("%Y/%m/%d"))
+
+    def month(self, month):
+        return self.database.activity_sum("{}/01".format(month), "{}/31".format(month))
+
+    def rollup(self, start, end):
+        return self.database.activity_sum(start, end)
+
+    def save(self):
+        return self.database.commit()
+
+    def import_json(self, process_time):
+        for date, apps in process_time.items():
+            for app, times in apps.items():
+                if app != "Summary":
+                    self.database.add_activity(date, self._intern(app), times["active"], times["inactive"])
+
+    def to_json(self, date):
+        return {app: {"active": active, "inactive": inactive} for app, active, inactive in self.items(date)}
+
+
+def import_directory(path):
+    """
+    Import json files and activity store of user directory into its database.
+
+    :param path: user directory.
+    :return: path to database.
+    """
+    database = Database.connect(os.path.join(path, DATABASE_NAME))
+    journal = DatabaseJournal(database, os.path.join(path, "log.json"), os.path.join(path, "overtimes.json"),
+                              os.path.join(path, "journal.log"))
+    journal.import_json()
+
+    database.write("DELETE FROM activity")
+    DatabaseActivityStore(database, os.path.join(path, "activity"), os.path.join(path, "activity_logs.json"))
+    database.close()
+
+    return database.path
+
+
+def export_directory(path):
+    """
+    Export database of user directory into log.json, overtimes.json and activity_logs.json.
+
+    :param path: user directory.
+    :return: None.
+    """
+    database = Database.connect(os.path.join(path, DATABASE_NAME))
+    journal = DatabaseJournal(database, os.path.join(path, "log.json"), os.path.join(path, "overtimes.json"),
+                              os.path.join(path, "journal.log"))
+    journal.export()
+    error = journal.pop_error()
+    if error:
+        raise error
+
+    store = DatabaseActivityStore(database)
+    activity = {date: store.to_json(date) for date in store.dates()}
+    JsonHelpers.dump_atomic(os.path.join(path, "activity_logs.json"), activity)
+    database.close()
+
+
+def migrate_directory(path):
+    """
+    Add epoch timestamps and UTC offsets (TS/UTC fields) to intervals in old format of user directory, in its
+    database if there is one. Old log is backed up into 'log.json.bak' first.
+
+    :param path: user directory.
+    :return: number of migrated days.
+    """
+    log_path = os.path.join(path, "log.json")
+    database = None
+
+    if os.path.exists(os.path.join(path, DATABASE_NAME)):
+        database = Database.connect(os.path.join(path, DATABASE_NAME))
+        journal = DatabaseJournal(database, log_path, os.path.join(path, "overtimes.json"),
+                                  os.path.join(path, "journal.log"))
+    else:
+        journal = TimeJournal(log_path, os.path.join(path, "overtimes.json"), os.path.join(path, "journal.log"))
+
+    working_time, _ = journal.load()
+    days = {date: working_time[date] for date in working_time}
+    JsonHelpers.dump_atomic("{}.bak".format(log_path), days)
+
+    migrated = 0
+    for date, intervals in sorted(days.items()):
+        if any("TS" not in elements for elements in intervals):
+            journal.set_day(date, normalize_day(date, intervals))
+            migrated += 1
+
+    journal.close()
+    error = journal.pop_error()
+    if database:
+        database.close()
+    if error:
+        raise error
+
+    return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="work_time_core",
+        description="Import json files of user directory into {} or export it back, or migrate intervals of "
+                    "user directory to timestamps.".format(DATABASE_NAME)
+    )
+    parser.add_argument("command", choices=("import", "export", "migrate"))
+    parser.add_argument("users", nargs="+", help="user directories")
+    args = parser.parse_args(argv)
+
+    for path in args.users:
+        if args.command == "import":
+            import_directory(path)
+        elif args.command == "migrate":
+            print("{}: {} days migrated".format(path, migrate_directory(path)))
+        else:
+            export_directory(path)
+
+    return 0
+
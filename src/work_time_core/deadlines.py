@@ -0,0 +1,64 @@
+import time
+import datetime
+import collections
+
+MAX_WAKEUP_INTERVAL = 300
+MIN_WAKEUP_INTERVAL = 1
+
+
+class DeadlineScheduler:
+    """
+    Computes the next moment when application has something to do instead of polling: reaching reference
+    working time, day rollover or flush of unsaved (or still queued) changes, bounded by MAX_WAKEUP_INTERVAL
+    so tooltip doesn't get too stale.
+    """
+    def __init__(self, work_time, scheduler, sampler=None, max_interval=MAX_WAKEUP_INTERVAL):
+        self.work_time = work_time
+        self.scheduler = scheduler
+        self.sampler = sampler
+        self.max_interval = max_interval
+        self.started = time.monotonic()
+        self.wakeups = 0
+        self.recent_wakeups = collections.deque()
+        self.reason = ""
+
+    def next_deadline(self):
+        """
+        Get time to next deadline.
+
+        :return: tuple of seconds and reason of deadline.
+        """
+        now = datetime.datetime.now()
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        deadlines = [(self.max_interval, "idle"), ((tomorrow - now).total_seconds(), "day rollover")]
+
+        reference = self.work_time.seconds_to_reference()
+        if reference is not None:
+            deadlines.append((reference, "reference time"))
+
+        # Samples queued after this are drained on next wakeup at latest, which comes long before queue is full.
+        pending = self.sampler is not None and not self.sampler.samples.empty()
+        flush = self.scheduler.next_flush(pending)
+        if flush is not None:
+            deadlines.append((flush, "flush"))
+
+        seconds, self.reason = min(deadlines)
+
+        return max(MIN_WAKEUP_INTERVAL, seconds), self.reason
+
+    def wakeup(self):
+        now = time.monotonic()
+        self.wakeups += 1
+        self.recent_wakeups.append(now)
+
+        while self.recent_wakeups[0] < now - 3600:
+            self.recent_wakeups.popleft()
+
+    def stats(self):
+        return {
+            "wakeups": self.wakeups,
+            "wakeups_last_hour": len(self.recent_wakeups),
+            "wakeups_per_hour": self.wakeups * 3600 / max(60.0, time.monotonic() - self.started),
+            "sampler_wakeups_per_hour": self.sampler.wakeups_per_hour() if self.sampler is not None else 0,
+            "next_deadline": self.reason
+        }
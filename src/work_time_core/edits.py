@@ -0,0 +1,123 @@
+import os
+import json
+import copy
+import datetime
+import tempfile
+
+from .loader import validate_log_day, validate_overtime
+
+VALIDATORS = {"logs": validate_log_day, "overtimes": validate_overtime}
+
+
+def parse_range(text):
+    """
+    Parse range of days, e.g. '2024/01', '2024/01/15', '2024/01/01-2024/02/15' or '2024/01-2024/03'.
+
+    :param text: range of days.
+    :return: tuple of first and last day in '%Y/%m/%d' format.
+    """
+    parts = [part.strip() for part in text.split("-")]
+    if len(parts) > 2:
+        raise ValueError("Incorrect range: {}".format(text))
+
+    bounds = []
+    for part in parts:
+        try:
+            bounds.append((datetime.datetime.strptime(part, "%Y/%m/%d").date(), False))
+        except ValueError:
+            try:
+                bounds.append((datetime.datetime.strptime(part, "%Y/%m").date(), True))
+            except ValueError:
+                raise ValueError("Incorrect day or month: {}".format(part))
+
+    start = bounds[0][0]
+    end, is_month = bounds[-1]
+    if is_month:
+        end = (end.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+
+    if start > end:
+        raise ValueError("Range ends before it starts: {}".format(text))
+
+    return start.strftime("%Y/%m/%d"), end.strftime("%Y/%m/%d")
+
+
+class EditSession:
+    """
+    Days of a range exported into temporary file for manual editing. After editor exits, edited file is compared
+    with exported days, so only changed days are applied.
+    """
+    def __init__(self, kind, days, start, end):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.original = {date: copy.deepcopy(days[date]) for date in sorted(days) if start <= date <= end}
+
+        fd, self.path = tempfile.mkstemp(prefix="work_time_{}_".format(kind), suffix=".json")
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(self.original, fp, indent=3)
+
+    def read(self):
+        """
+        Read edited file and compare it with exported days.
+
+        :return: tuple of changed days dict (None for removed day) and list of errors, changes are empty if there
+            is any error.
+        """
+        with open(self.path, 'r') as fp:
+            text = fp.read()
+
+        try:
+            edited = json.loads(text)
+        except ValueError as exc:
+            return {}, ["line {}: {}".format(getattr(exc, "lineno", 1), getattr(exc, "msg", str(exc)))]
+
+        if not isinstance(edited, dict):
+            return {}, ["line 1: Expected object of days"]
+
+        errors = []
+        for date, value in edited.items():
+            error = self._check(date, value)
+            if error:
+                errors.append("line {}: {}: {}".format(self._line(text, date), date, error))
+
+        if errors:
+            return {}, errors
+
+        changes = {date: value for date, value in edited.items() if self.original.get(date) != value}
+        for date in self.original:
+            if date not in edited:
+                changes[date] = None
+
+        return changes, []
+
+    def _check(self, date, value):
+        try:
+            datetime.datetime.strptime(date, "%Y/%m/%d")
+        except ValueError:
+            return "Incorrect day, expected YYYY/MM/DD format"
+
+        if not self.start <= date <= self.end:
+            return "Day is out of edited range {} - {}".format(self.start, self.end)
+
+        try:
+            VALIDATORS[self.kind](value)
+        except ValueError as exc:
+            return str(exc)
+
+        if self.kind == "logs":
+            # Only last interval of a day can end after midnight (END before START).
+            for elements in value[:-1]:
+                if elements["END"] and elements["END"] < elements["START"]:
+                    return "END before START: {}".format(elements)
+
+        return None
+
+    @staticmethod
+    def _line(text, date):
+        position = text.find('"{}"'.format(date))
+
+        return text.count("\n", 0, position) + 1 if position >= 0 else 1
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,182 @@
+import time
+
+from .intervals import MAX_SHIFT_SECONDS, entry_epochs, day_segments, previous_date
+
+
+class WorkingTimeIndex:
+    """
+    Logged intervals as epoch seconds grouped by date of their start, with running per-day and per-month totals
+    of closed intervals. Intervals crossing midnight are split between days. Only open intervals are computed
+    on query.
+
+    Months are indexed from working time dict on first use, so history which is never queried isn't parsed.
+    """
+    def __init__(self, working_time=None):
+        self.rebuild(working_time or {})
+
+    @staticmethod
+    def now_seconds():
+        return int(time.time())
+
+    def rebuild(self, working_time):
+        self.source = working_time
+        self.indexed_months = set()
+        self.days = {}
+        self.day_totals = {}
+        self.month_totals = {}
+        self.open_days = {}
+
+    def load_all(self):
+        for month in {date[:7] for date in self.source}:
+            self._index_month(month)
+
+    def _ensure(self, month):
+        # Interval started on last day of previous month can be counted into this month.
+        self._index_month(month)
+        self._index_month(previous_date("{}/01".format(month))[:7])
+
+    def _index_month(self, month):
+        if month in self.indexed_months:
+            return
+
+        self.indexed_months.add(month)
+
+        for date in [date for date in self.source if date[:7] == month]:
+            for index, elements in enumerate(self.source[date]):
+                self._set(date, index, elements)
+
+    def start(self, date, index, elements):
+        self._index_month(date[:7])
+        self._set(date, index, elements)
+
+    def end(self, date, index, elements):
+        self._index_month(date[:7])
+        self._set(date, index, elements)
+
+    def set_day(self, date, entries):
+        """
+        Replace indexed intervals of a day, updating day and month totals.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param entries: list of START/END entries.
+        :return: None.
+        """
+        self._index_month(date[:7])
+
+        for interval in self.days.pop(date, []):
+            self._discard(date, interval)
+        self.open_days.get(date[:7], set()).discard(date)
+
+        for index, elements in enumerate(entries):
+            self._set(date, index, elements)
+
+    def _set(self, date, index, elements):
+        intervals = self.days.setdefault(date, [])
+        interval = list(entry_epochs(date, elements))
+
+        if index < len(intervals):
+            self._discard(date, intervals[index])
+            intervals[index] = interval
+        else:
+            intervals.append(interval)
+
+        if interval[1] is not None:
+            self._credit(date, interval, 1)
+        self._set_open(date)
+
+    def _discard(self, date, interval):
+        if interval[1] is not None:
+            self._credit(date, interval, -1)
+
+    def _credit(self, date, interval, sign):
+        start, end, offset = interval
+
+        for day, seconds in day_segments(date, start, end, offset):
+            self._add(day, sign * seconds)
+
+    def _add(self, date, seconds):
+        month = date[:7]
+        self.day_totals[date] = self.day_totals.get(date, 0) + seconds
+        self.month_totals[month] = self.month_totals.get(month, 0) + seconds
+
+    def _set_open(self, date):
+        open_days = self.open_days.setdefault(date[:7], set())
+
+        if any(end is None for start, end, offset in self.days[date]):
+            open_days.add(date)
+        else:
+            open_days.discard(date)
+
+    def open_date(self, date, now):
+        """
+        Get day whose last interval is open and counted into given day: the day itself or previous day, if its
+        interval crosses midnight and isn't older than MAX_SHIFT_SECONDS.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param now: current epoch seconds.
+        :return: day in '%Y/%m/%d' format or None.
+        """
+        self._ensure(date[:7])
+        intervals = self.days.get(date)
+
+        if intervals:
+            return date if intervals[-1][1] is None else None
+
+        previous = previous_date(date)
+        intervals = self.days.get(previous)
+        if intervals and intervals[-1][1] is None and now - intervals[-1][0] <= MAX_SHIFT_SECONDS:
+            return previous
+
+        return None
+
+    def is_open(self, date, now=None):
+        return self.open_date(date, self.now_seconds() if now is None else now) is not None
+
+    def _open_segments(self, date, now):
+        # Open intervals of older days than previous one are forgotten breaks, they aren't counted.
+        for start, end, offset in self.days[date]:
+            if end is None and now > start:
+                yield from day_segments(date, start, now, offset)
+
+    def _counted_open_dates(self, dates, today, now):
+        for date in dates:
+            if date == today or any(end is None and now - start <= MAX_SHIFT_SECONDS
+                                    for start, end, offset in self.days[date]):
+                yield date
+
+    def day_total(self, date):
+        """
+        Get seconds of closed intervals of a day.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: seconds or None if day has no intervals.
+        """
+        self._ensure(date[:7])
+
+        return self.day_totals.get(date)
+
+    def day_seconds(self, date, now):
+        self._ensure(date[:7])
+        total = self.day_totals.get(date, 0)
+
+        previous = previous_date(date)
+        open_dates = [day for day in (previous, date) if day in self.open_days.get(day[:7], ())]
+        for open_date in self._counted_open_dates(open_dates, date, now):
+            total += sum(seconds for day, seconds in self._open_segments(open_date, now) if day == date)
+
+        return total
+
+    def month_seconds(self, month, now):
+        self._ensure(month)
+        total = self.month_totals.get(month, 0)
+
+        previous = previous_date("{}/01".format(month))
+        open_dates = sorted(self.open_days.get(month, ()))
+        if previous in self.open_days.get(previous[:7], ()):
+            open_dates.insert(0, previous)
+
+        today = time.strftime("%Y/%m/%d", time.localtime(now))
+        for open_date in self._counted_open_dates(open_dates, today, now):
+            total += sum(seconds for day, seconds in self._open_segments(open_date, now) if day[:7] == month)
+
+        return total
@@ -0,0 +1,189 @@
+import time
+import datetime
+import functools
+
+DAY_SECONDS = 24 * 3600
+# Open interval started on previous day is counted (e.g. night shift) only if it isn't older, otherwise it's
+# a forgotten break.
+MAX_SHIFT_SECONDS = 12 * 3600
+
+
+def now():
+    """
+    Get current time.
+
+    :return: tuple of epoch seconds and UTC offset in seconds.
+    """
+    timestamp = int(time.time())
+
+    return timestamp, local_offset(timestamp)
+
+
+def local_offset(timestamp):
+    return time.localtime(timestamp).tm_gmtoff
+
+
+def format_time(timestamp, offset):
+    return time.strftime("%H:%M:%S", time.gmtime(timestamp + offset))
+
+
+def format_date(timestamp, offset):
+    return time.strftime("%Y/%m/%d", time.gmtime(timestamp + offset))
+
+
+@functools.lru_cache(maxsize=256)
+def next_date(date):
+    day = datetime.date(int(date[:4]), int(date[5:7]), int(date[8:10])) + datetime.timedelta(days=1)
+
+    return day.strftime("%Y/%m/%d")
+
+
+@functools.lru_cache(maxsize=256)
+def previous_date(date):
+    day = datetime.date(int(date[:4]), int(date[5:7]), int(date[8:10])) - datetime.timedelta(days=1)
+
+    return day.strftime("%Y/%m/%d")
+
+
+def _local_timestamp(date, value):
+    hours, minutes, seconds = value.split(":")
+    moment = datetime.datetime(int(date[:4]), int(date[5:7]), int(date[8:10]), int(hours), int(minutes), int(seconds))
+
+    return int(moment.timestamp())
+
+
+def legacy_epochs(date, entry):
+    """
+    Get epoch seconds of entry in old format (only START/END times), taken as local time of the day. END earlier
+    than START is on the next day.
+
+    :param date: day in '%Y/%m/%d' format.
+    :param entry: dict with START and END times.
+    :return: tuple of start, end (None if interval is open) and UTC offset of start.
+    """
+    start = _local_timestamp(date, entry["START"])
+    end = None
+
+    if entry["END"]:
+        end = _local_timestamp(date if entry["END"] >= entry["START"] else next_date(date), entry["END"])
+
+    return start, end, local_offset(start)
+
+
+def entry_epochs(date, entry):
+    """
+    Get epoch seconds of entry, from its TS/UTC fields or from its times if it's in old format.
+
+    :param date: day in '%Y/%m/%d' format.
+    :param entry: dict with START and END times and optional TS ([start, end]) and UTC ([start, end] offsets).
+    :return: tuple of start, end (None if interval is open) and UTC offset of start.
+    """
+    timestamps = entry.get("TS")
+
+    if timestamps is None:
+        return legacy_epochs(date, entry)
+
+    return timestamps[0], timestamps[1], entry["UTC"][0]
+
+
+def new_entry(timestamp, offset):
+    return {"START": format_time(timestamp, offset), "END": "", "TS": [timestamp, None], "UTC": [offset, None]}
+
+
+def close_entry(date, entry, timestamp, offset):
+    """
+    Set end of entry, adding epoch seconds of its start if it's in old format.
+
+    :return: None.
+    """
+    if "TS" not in entry:
+        start, _, start_offset = legacy_epochs(date, entry)
+        entry["TS"] = [start, None]
+        entry["UTC"] = [start_offset, None]
+
+    entry["END"] = format_time(timestamp, offset)
+    entry["TS"][1] = timestamp
+    entry["UTC"][1] = offset
+
+
+def is_consistent(date, entry):
+    """
+    Check that TS/UTC fields of entry match its day and times, e.g. after its times were edited manually.
+    """
+    timestamps = entry["TS"]
+    offsets = entry["UTC"]
+
+    if format_date(timestamps[0], offsets[0]) != date or format_time(timestamps[0], offsets[0]) != entry["START"]:
+        return False
+
+    if timestamps[1] is None:
+        return entry["END"] == ""
+
+    return entry["END"] == format_time(timestamps[1], offsets[1]) and timestamps[1] >= timestamps[0]
+
+
+def normalize_day(date, entries):
+    """
+    Add TS/UTC fields to entries which don't have them (or have them outdated by manual edit), times as written
+    are kept.
+
+    :param date: day in '%Y/%m/%d' format.
+    :param entries: list of entries.
+    :return: list of entries with TS/UTC fields.
+    """
+    normalized = []
+
+    for entry in entries:
+        if "TS" not in entry or not is_consistent(date, entry):
+            start, end, offset = legacy_epochs(date, entry)
+            entry = {
+                "START": entry["START"],
+                "END": entry["END"],
+                "TS": [start, end],
+                "UTC": [offset, local_offset(end) if end is not None else None]
+            }
+        normalized.append(entry)
+
+    return normalized
+
+
+def migrate_days(days):
+    """
+    Add TS/UTC fields to all entries in old format.
+
+    :param days: mutable mapping of days.
+    :return: number of migrated days.
+    """
+    migrated = 0
+
+    for date in list(days):
+        entries = days[date]
+        if any("TS" not in entry for entry in entries):
+            days[date] = normalize_day(date, entries)
+            migrated += 1
+
+    return migrated
+
+
+def day_segments(date, start, end, offset):
+    """
+    Split interval at local midnights.
+
+    :param date: day of interval start in '%Y/%m/%d' format.
+    :param start: epoch seconds of start.
+    :param end: epoch seconds of end.
+    :param offset: UTC offset of start.
+    :return: list of (day, seconds) tuples.
+    """
+    boundary = start - (start + offset) % DAY_SECONDS + DAY_SECONDS
+    segments = []
+
+    while end > boundary:
+        segments.append((date, boundary - start))
+        start = boundary
+        boundary += DAY_SECONDS
+        date = next_date(date)
+
+    segments.append((date, max(0, end - start)))
+
+    return segments
@@ -0,0 +1,196 @@
+import os
+import json
+import bisect
+
+from .storage import JsonHelpers
+
+
+def format_balance(seconds):
+    """
+    Format signed number of seconds, e.g. '-1:02:03' or '+25:00:00'.
+
+    :param seconds: number of seconds.
+    :return: formatted balance.
+    """
+    sign = "-" if seconds < 0 else "+"
+    seconds = abs(seconds)
+
+    return "{}{}:{:02d}:{:02d}".format(sign, seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class OvertimeLedger:
+    """
+    Overtime balance of every logged day as integer seconds (negative when under reference time), with month,
+    year, total and cumulative (up to and including month) balances updated on every change of a day.
+
+    Balance of a month, year, months range or carry-over from previous months is a lookup, instead of parsing
+    and summing overtime strings. Changes of the latest month, which is the usual case, update a single
+    cumulative balance.
+
+    Days are saved into a directory with one file per month ('2024-01.json'), only months with changed days are
+    written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._reset(None)
+
+    def _reset(self, reference):
+        self.reference = reference
+        self.days = {}
+        self.month_dates = {}
+        self.dirty = set()
+        self.months = {}
+        self.years = {}
+        self.total = 0
+        self.month_order = []
+        self.cumulative = {}
+
+    def load(self, reference):
+        """
+        Load ledger saved with the same reference time.
+
+        :param reference: reference working time of a day in seconds.
+        :return: True if ledger was loaded, False if it has to be rebuilt.
+        """
+        if not os.path.isdir(self.path):
+            return False
+
+        self._reset(reference)
+
+        for month in self._saved_months():
+            try:
+                with open(self._month_path(month), 'r') as fp:
+                    data = json.load(fp)
+            except ValueError:
+                return False
+
+            if data.get("reference") != reference:
+                return False
+
+            for date, balance in sorted(data["days"].items()):
+                self.set_day(date, balance)
+
+        self.dirty.clear()
+
+        return True
+
+    def _month_path(self, month):
+        return os.path.join(self.path, "{}.json".format(month.replace("/", "-")))
+
+    def _saved_months(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        return sorted(name[:7].replace("-", "/") for name in os.listdir(self.path) if name.endswith(".json"))
+
+    def rebuild(self, day_totals, reference):
+        """
+        Rebuild ledger from working time of days.
+
+        :param day_totals: dict of days with worked seconds, e.g. WorkingTimeIndex.day_totals.
+        :param reference: reference working time of a day in seconds.
+        :return: None.
+        """
+        self._reset(reference)
+        # Saved months without days are removed by next save.
+        self.dirty.update(self._saved_months())
+
+        for date in sorted(day_totals):
+            self.set_day(date, day_totals[date] - reference)
+
+    def set_day(self, date, balance):
+        """
+        Set balance of a day.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param balance: overtime of day in seconds, negative if under reference time.
+        :return: True if balance was changed.
+        """
+        change = balance - self.days.get(date, 0)
+        if date in self.days and not change:
+            return False
+
+        self.days[date] = balance
+        month = date[:7]
+        self.month_dates.setdefault(month, set()).add(date)
+        self.dirty.add(month)
+
+        if month not in self.months:
+            position = bisect.bisect(self.month_order, month)
+            self.month_order.insert(position, month)
+            self.months[month] = 0
+            self.cumulative[month] = self.cumulative[self.month_order[position - 1]] if position else 0
+
+        self.months[month] += change
+        self.years[date[:4]] = self.years.get(date[:4], 0) + change
+        self.total += change
+
+        for later in self.month_order[bisect.bisect_left(self.month_order, month):]:
+            self.cumulative[later] += change
+
+        return True
+
+    def remove_day(self, date):
+        """
+        Remove balance of a day, e.g. when its logs were deleted.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: True if day was in ledger.
+        """
+        if date not in self.days:
+            return False
+
+        self.set_day(date, 0)
+        del self.days[date]
+        self.month_dates[date[:7]].discard(date)
+
+        return True
+
+    def day(self, date):
+        return self.days.get(date, 0)
+
+    def month(self, month):
+        return self.months.get(month, 0)
+
+    def year(self, year):
+        return self.years.get(year, 0)
+
+    def balance_until(self, month):
+        """
+        Get balance of all months up to and including given month.
+        """
+        if month in self.cumulative:
+            return self.cumulative[month]
+
+        position = bisect.bisect(self.month_order, month)
+
+        return self.cumulative[self.month_order[position - 1]] if position else 0
+
+    def carry_over(self, month):
+        return self.balance_until(month) - self.month(month)
+
+    def range(self, start_month, end_month):
+        return self.balance_until(end_month) - self.carry_over(start_month)
+
+    def save(self):
+        """
+        Save months with days changed since last save.
+
+        :return: number of bytes written.
+        """
+        written = 0
+        os.makedirs(self.path, exist_ok=True)
+
+        for month in sorted(self.dirty):
+            days = {date: self.days[date] for date in sorted(self.month_dates.get(month, ()))}
+
+            if days:
+                content = json.dumps({"reference": self.reference, "days": days}, indent=3)
+                JsonHelpers.write_atomic(self._month_path(month), lambda fp: fp.write(content))
+                written += len(content)
+            elif os.path.exists(self._month_path(month)):
+                os.remove(self._month_path(month))
+
+        self.dirty.clear()
+
+        return written
@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import time
+
+from collections.abc import MutableMapping
+
+CHUNK_SIZE = 64 * 1024
+MAX_DAY_SIZE = 1024 * 1024
+DATE_PATTERN = re.compile(r"^\d{4}/(0[1-9]|1[0-2])/(0[1-9]|[12]\d|3[01])$")
+TIME_PATTERN = re.compile(r"^([01]\d|2[0-3]):[0-5]\d:[0-5]\d$")
+DURATION_PATTERN = re.compile(r"^(?:(-?\d+) days?, )?(\d+):(\d{2}):(\d{2})(?:\.\d+)?$")
+DAY_KEY_PATTERN = re.compile(r'"\d{4}/\d{2}/\d{2}"\s*:')
+WHITESPACE_PATTERN = re.compile(r"\s*")
+
+
+def parse_duration(value):
+    """
+    Convert str(datetime.timedelta) value (e.g. '1:02:03', '-1 day, 23:59:00') into seconds.
+
+    :param value: duration string.
+    :return: number of seconds.
+    """
+    match = DURATION_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError("Incorrect duration: '{}'".format(value))
+
+    days, hours, minutes, seconds = match.groups()
+
+    return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def validate_log_day(value):
+    if not isinstance(value, list):
+        raise ValueError("Day must be a list of START/END entries")
+
+    for elements in value:
+        if not isinstance(elements, dict) or set(elements) not in ({"START", "END"}, {"START", "END", "TS", "UTC"}):
+            raise ValueError("Entry must have only START and END (and optional TS and UTC): {}".format(elements))
+        if not isinstance(elements["START"], str) or not TIME_PATTERN.match(elements["START"]):
+            raise ValueError("Incorrect START time: {}".format(elements["START"]))
+        if elements["END"] != "" and (not isinstance(elements["END"], str) or not TIME_PATTERN.match(elements["END"])):
+            raise ValueError("Incorrect END time: {}".format(elements["END"]))
+        if "TS" in elements:
+            for name in ("TS", "UTC"):
+                pair = elements[name]
+                if not isinstance(pair, list) or len(pair) != 2 or type(pair[0]) is not int \
+                        or not (pair[1] is None or type(pair[1]) is int):
+                    raise ValueError("{} must be a list of start and end integers: {}".format(name, pair))
+
+
+def validate_overtime(value):
+    if not isinstance(value, str):
+        raise ValueError("Overtime must be a string: {}".format(value))
+
+    parse_duration(value)
+
+
+def validate_activity_day(value):
+    if not isinstance(value, dict):
+        raise ValueError("Day must be an object of applications")
+
+    for app, times in value.items():
+        if not isinstance(times, dict) or set(times) != {"active", "inactive"}:
+            raise ValueError("Application '{}' must have only active and inactive counters".format(app))
+        for counter in times.values():
+            if type(counter) is not int or counter < 0:
+                raise ValueError("Application '{}' has incorrect counter: {}".format(app, counter))
+
+
+class RawDay:
+    """
+    Unparsed json text of a day which wasn't requested yet.
+    """
+    def __init__(self, text):
+        self.text = text
+
+
+class LazyDays(MutableMapping):
+    """
+    Days of json file where days which weren't requested yet are kept as unparsed json text, so they don't
+    hold thousands of small Python objects. Such days are parsed on first access and written back as they were.
+    """
+    def __init__(self):
+        self.data = {}
+        self.stats = {}
+
+    def __getitem__(self, key):
+        value = self.data[key]
+
+        if type(value) is RawDay:
+            value = self.data[key] = json.loads(value.text)
+
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def set_raw(self, key, text):
+        self.data[key] = RawDay(text)
+
+    def is_loaded(self, key):
+        return type(self.data.get(key)) is not RawDay
+
+    def dump(self, fp, indent=3):
+        fp.write("{")
+
+        for position, (key, value) in enumerate(self.data.items()):
+            fp.write(",\n" if position else "\n")
+            if type(value) is RawDay:
+                fp.write("{}{}: {}".format(" " * indent, json.dumps(key), value.text))
+            else:
+                fp.write(json.dumps({key: value}, indent=indent)[2:-2])
+
+        fp.write("\n}" if self.data else "}")
+
+
+class StreamingJsonLoader:
+    """
+    Reads json object of days ('%Y/%m/%d' keys) chunk by chunk and validates every day separately.
+
+    Days which can't be parsed or don't pass validation are skipped and saved into quarantine file
+    (json line per day with error and original text) instead of failing whole file.
+    """
+    def __init__(self, validate=None, materialize=None, quarantine_path=None, chunk_size=CHUNK_SIZE):
+        self.validate = validate
+        self.materialize = materialize
+        self.quarantine_path = quarantine_path
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.stats = {}
+
+    def load(self, file_path):
+        """
+        Load days from file.
+
+        :param file_path: path to json file.
+        :return: LazyDays with days passing materialize predicate parsed and other days kept as json text.
+        """
+        days = LazyDays()
+
+        for key, value, text in self.iter_days(file_path):
+            if self.materialize is None or self.materialize(key):
+                days[key] = value
+                self.stats["materialized"] += 1
+            else:
+                days.set_raw(key, text)
+
+        days.stats = dict(self.stats)
+
+        return days
+
+    def iter_days(self, file_path):
+        """
+        Iterate over valid days of file.
+
+        :param file_path: path to json file.
+        :return: generator of (date, parsed value, json text of value) tuples.
+        """
+        started = time.perf_counter()
+        self.stats = {"days": 0, "materialized": 0, "corrupt": 0, "bytes": 0}
+
+        with open(file_path, 'r') as fp:
+            self.fp = fp
+            self.buffer = ""
+            self.pos = 0
+            self.offset = 0
+            self.mark = None
+            self.eof = False
+
+            self._skip_whitespace()
+            if self.buffer[self.pos:self.pos + 1] != "{":
+                raise ValueError("{} doesn't contain json object".format(file_path))
+            self.pos += 1
+
+            while True:
+                self._skip_whitespace()
+                if self.pos >= len(self.buffer) or self.buffer[self.pos] == "}":
+                    break
+
+                # Absolute offset, as reading next chunks moves buffer.
+                self.mark = self.offset + self.pos
+                try:
+                    key, value, text = self._read_day()
+                except ValueError as exc:
+                    self._quarantine(file_path, self.mark, exc)
+                    continue
+                finally:
+                    self.mark = None
+
+                self.stats["days"] += 1
+                yield key, value, text
+
+        self.stats["bytes"] = self.offset + self.pos
+        self.stats["seconds"] = time.perf_counter() - started
+        self.stats["records_per_second"] = self.stats["days"] / self.stats["seconds"] if self.stats["seconds"] else 0
+
+    def _read_day(self):
+        key, _ = self._decode()
+        if not isinstance(key, str) or not DATE_PATTERN.match(key):
+            raise ValueError("Incorrect date: {}".format(key))
+
+        self._skip_whitespace()
+        if self.buffer[self.pos:self.pos + 1] != ":":
+            raise ValueError("Expecting ':' after '{}'".format(key))
+        self.pos += 1
+
+        self._skip_whitespace()
+        value, text = self._decode()
+
+        self._skip_whitespace()
+        separator = self.buffer[self.pos:self.pos + 1]
+        if separator == ",":
+            self.pos += 1
+        elif separator != "}":
+            raise ValueError("Expecting ',' or '}}' after '{}'".format(key))
+
+        if self.validate:
+            try:
+                self.validate(value)
+            except ValueError as exc:
+                raise ValueError("{}: {}".format(key, exc))
+
+        return key, value, text
+
+    def _read(self):
+        chunk = self.fp.read(self.chunk_size)
+
+        if not chunk:
+            self.eof = True
+            return False
+
+        # Text of day being read is kept, so it can be quarantined if it's incorrect.
+        keep = self.pos if self.mark is None else min(self.pos, self.mark - self.offset)
+        self.offset += keep
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos -= keep
+
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE_PATTERN.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._read():
+                return
+
+    def _decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # Value may be only cut by end of chunk, read more unless it's already too long to be a day.
+                if len(self.buffer) - self.pos < MAX_DAY_SIZE and self._read():
+                    continue
+                raise
+
+            # Number at the end of chunk may be incomplete.
+            if end == len(self.buffer) and not self.eof and self._read():
+                continue
+
+            text = self.buffer[self.pos:end]
+            self.pos = end
+
+            return value, text
+
+    def _quarantine(self, file_path, start, exc):
+        # Skip to the next day key, reading more chunks if necessary. Start is absolute offset of the day.
+        while True:
+            match = DAY_KEY_PATTERN.search(self.buffer, max(start - self.offset + 1, self.pos))
+            if match or self.eof or not self._read():
+                break
+
+        end = match.start() if match else len(self.buffer)
+        text = self.buffer[start - self.offset:end].rstrip().rstrip(",").rstrip()
+        self.pos = end
+        self.stats["corrupt"] += 1
+
+        if self.quarantine_path:
+            with open(self.quarantine_path, 'a') as fp:
+                fp.write("{}\n".format(json.dumps({"file": file_path, "error": str(exc), "text": text})))
+
@@ -0,0 +1,202 @@
+import os
+import time
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+STAMP_NAME = "work_time.version"
+STAMP_LOCK_NAME = "work_time.lock"
+STAMP_READ_RETRIES = 20
+STAMP_READ_DELAY = 0.05
+
+
+class FileLock:
+    """
+    Advisory lock of a file between processes (flock, or msvcrt byte lock on Windows where all locks are
+    exclusive). Every lock of the same file conflicts, also between FileLock objects of one process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fp = None
+
+    def acquire(self, blocking=True, shared=False):
+        """
+        Lock the file, creating it if it doesn't exist.
+
+        :param blocking: wait until the lock is released by other owner.
+        :param shared: shared (reader) lock instead of exclusive one.
+        :return: True if locked, False if file is locked by other owner and blocking is False.
+        """
+        fp = open(self.path, 'a+')
+
+        try:
+            if fcntl:
+                operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                fcntl.flock(fp.fileno(), operation if blocking else operation | fcntl.LOCK_NB)
+            else:
+                fp.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after 10 seconds.
+                        if not blocking:
+                            raise
+        except OSError:
+            fp.close()
+            if blocking:
+                raise
+            return False
+
+        self.fp = fp
+
+        return True
+
+    def release(self):
+        if self.fp is None:
+            return
+
+        if not fcntl:
+            self.fp.seek(0)
+            msvcrt.locking(self.fp.fileno(), msvcrt.LK_UNLCK, 1)
+        self.fp.close()
+        self.fp = None
+
+    def __enter__(self):
+        self.acquire()
+
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class VersionStamp:
+    """
+    Version of files of a directory which are written by several writers (threads or processes) and read by
+    readers which never lock them.
+
+    Writer ('with stamp:') holds exclusive lock of 'work_time.lock' and makes version in 'work_time.version' odd
+    before it writes files and even after. Reader repeats reading until version is even and the same before and
+    after reading, so it gets consistent snapshot of all files (e.g. log shards and overtimes.json) without
+    blocking the writer.
+    """
+    _stamps = {}
+    _stamps_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, STAMP_NAME)
+        self.lock = FileLock(os.path.join(directory, STAMP_LOCK_NAME))
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.writes = 0
+        self.read_retries = 0
+
+    @classmethod
+    def for_directory(cls, directory):
+        """
+        Get stamp shared by all writers of directory in this process, so nested writes don't lock it twice.
+
+        :param directory: directory of files.
+        :return: VersionStamp.
+        """
+        directory = os.path.abspath(directory)
+
+        with cls._stamps_lock:
+            stamp = cls._stamps.get(directory)
+            if stamp is None:
+                stamp = cls._stamps[directory] = cls(directory)
+
+        return stamp
+
+    def version(self):
+        try:
+            with open(self.path, 'r') as fp:
+                return int(fp.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _set(self, version):
+        # Stamp only orders writers and readers, so it's replaced atomically but isn't synced to disk.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(str(version))
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        self.depth += 1
+
+        if self.depth == 1:
+            try:
+                self.lock.acquire()
+                version = self.version()
+                # Odd version left by crashed writer is skipped.
+                self._set(version + 1 if version % 2 == 0 else version + 2)
+            except BaseException:
+                self.lock.release()
+                self.depth -= 1
+                self.thread_lock.release()
+                raise
+
+        return self
+
+    def __exit__(self, *args):
+        try:
+            if self.depth == 1:
+                try:
+                    self._set(self.version() + 1)
+                    self.writes += 1
+                finally:
+                    self.lock.release()
+        finally:
+            self.depth -= 1
+            self.thread_lock.release()
+
+    def read_consistent(self, read, retries=STAMP_READ_RETRIES, delay=STAMP_READ_DELAY):
+        """
+        Call read until no writer changed the files while it was running. Errors of read (e.g. file removed by
+        writer) are ignored if files were changed meanwhile. If files keep changing (or writer crashed while
+        writing), read is called under shared lock.
+
+        :param read: callable reading files.
+        :param retries: number of attempts without lock.
+        :param delay: seconds between attempts.
+        :return: tuple of result of read and version it was read at.
+        """
+        for _ in range(retries):
+            before = self.version()
+
+            if before % 2 == 0:
+                try:
+                    result = read()
+                except (OSError, ValueError):
+                    if self.version() == before:
+                        raise
+                else:
+                    if self.version() == before:
+                        return result, before
+
+            self.read_retries += 1
+            time.sleep(delay)
+
+        lock = FileLock(self.lock.path)
+        lock.acquire(shared=True)
+        try:
+            return read(), self.version()
+        finally:
+            lock.release()
+
+    def stats(self):
+        return {"version": self.version(), "writes": self.writes, "read_retries": self.read_retries}
@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import time
+import cProfile
+import datetime
+import tempfile
+import threading
+import tracemalloc
+import collections
+
+METRICS_EXPORT_INTERVAL = 300
+METRICS_HISTORY = 288
+PROFILE_TOP_ALLOCATIONS = 30
+METRIC_PREFIX = "work_time_"
+
+
+class Timer:
+    """
+    Reusable context manager adding duration of its block into timer of Metrics, used on a single thread (other
+    threads call Metrics.observe directly).
+    """
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.started = []
+
+    def __enter__(self):
+        self.started.append(time.perf_counter())
+
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.perf_counter() - self.started.pop())
+
+
+class Metrics:
+    """
+    Counters, timers (count, sum, max and last duration) and gauges of running application, with stats of other
+    objects (e.g. WriteBehindScheduler.stats) read only when metrics are exported.
+
+    Metrics are exported into '<directory>/metrics.json' with rolling history of snapshots and
+    '<directory>/metrics.prom' in Prometheus text format with the latest values.
+
+    Profiling (cProfile of the thread which started it and tracemalloc) is off unless started explicitly.
+    """
+    def __init__(self, history=METRICS_HISTORY, export_interval=METRICS_EXPORT_INTERVAL):
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+        self.sources = {}
+        self.timer_contexts = {}
+        self.history = collections.deque(maxlen=history)
+        self.history_loaded = False
+        self.export_interval = export_interval
+        self.last_export = time.monotonic()
+        self.profiler = None
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+
+            if timer is None:
+                timer = self.timers[name] = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0}
+
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["last"] = seconds
+            if seconds > timer["max"]:
+                timer["max"] = seconds
+
+    def timer(self, name):
+        """
+        Get context manager measuring duration of its block.
+
+        :param name: name of timer.
+        :return: Timer.
+        """
+        context = self.timer_contexts.get(name)
+
+        if context is None:
+            context = self.timer_contexts[name] = Timer(self, name)
+
+        return context
+
+    def register_source(self, name, stats):
+        """
+        Register stats read on export, numbers (also in nested dicts) are exported as gauges.
+
+        :param name: prefix of gauges.
+        :param stats: callable returning dict of stats.
+        :return: None.
+        """
+        self.sources[name] = stats
+
+    def snapshot(self):
+        gauges = dict(self.gauges)
+
+        for name, stats in self.sources.items():
+            try:
+                self._flatten(gauges, name, stats())
+            except Exception as exc:
+                gauges["{}_error".format(name)] = str(exc)
+
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: dict(timer) for name, timer in self.timers.items()}
+
+        return {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "counters": counters,
+            "timers": timers,
+            "gauges": gauges,
+            "profiling": self.is_profiling()
+        }
+
+    def _flatten(self, gauges, prefix, stats):
+        for key, value in stats.items():
+            name = "{}_{}".format(prefix, key)
+
+            if isinstance(value, dict):
+                self._flatten(gauges, name, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[name] = value
+
+    def maybe_export(self, directory):
+        """
+        Export metrics if export interval elapsed since last export.
+
+        :param directory: directory of metrics files.
+        :return: True if metrics were exported.
+        """
+        if time.monotonic() - self.last_export < self.export_interval:
+            return False
+
+        self.export(directory)
+
+        return True
+
+    def export(self, directory):
+        """
+        Add snapshot into rolling history of metrics.json and write latest values into metrics.prom.
+
+        :param directory: directory of metrics files.
+        :return: snapshot of metrics.
+        """
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, "metrics.json")
+
+        if not self.history_loaded:
+            # History of previous runs is continued.
+            self.history_loaded = True
+            try:
+                with open(json_path, 'r') as fp:
+                    self.history.extend(json.load(fp)["history"])
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        snapshot = self.snapshot()
+        self.history.append(snapshot)
+        self.last_export = time.monotonic()
+
+        self._write(json_path, json.dumps({"history": list(self.history)}, indent=1))
+        self._write(os.path.join(directory, "metrics.prom"), self.to_prometheus(snapshot))
+
+        return snapshot
+
+    @staticmethod
+    def _write(file_path, content):
+        # Metrics don't use JsonHelpers.write_atomic, so exports aren't counted as application writes.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(content)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _metric_name(name):
+        return METRIC_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+    def to_prometheus(self, snapshot):
+        """
+        Format snapshot in Prometheus text exposition format.
+
+        :param snapshot: result of snapshot().
+        :return: text of metrics.
+        """
+        lines = []
+
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = "{}_total".format(self._metric_name(name))
+            lines.extend(["# TYPE {} counter".format(metric), "{} {}".format(metric, value)])
+
+        for name, timer in sorted(snapshot["timers"].items()):
+            metric = "{}_seconds".format(self._metric_name(name))
+            lines.extend([
+                "# TYPE {} summary".format(metric),
+                "{}_sum {:.6f}".format(metric, timer["sum"]),
+                "{}_count {}".format(metric, timer["count"]),
+                "# TYPE {}_max gauge".format(metric),
+                "{}_max {:.6f}".format(metric, timer["max"])
+            ])
+
+        for name, value in sorted(snapshot["gauges"].items()):
+            if isinstance(value, (int, float)):
+                metric = self._metric_name(name)
+                lines.extend(["# TYPE {} gauge".format(metric), "{} {}".format(metric, value)])
+
+        return "\n".join(lines) + "\n"
+
+    def is_profiling(self):
+        return self.profiler is not None
+
+    def start_profiling(self):
+        """
+        Start cProfile of current thread and tracemalloc.
+
+        :return: None.
+        """
+        if self.profiler is not None:
+            return
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        tracemalloc.start()
+
+    def stop_profiling(self, directory):
+        """
+        Stop profiling and save its results: cProfile stats (readable by pstats or snakeviz) and top allocations.
+
+        :param directory: directory of profile files.
+        :return: tuple of paths of cProfile stats and allocations files, None if profiling wasn't started.
+        """
+        if self.profiler is None:
+            return None
+
+        self.profiler.disable()
+        allocations = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        name = "profile_{}".format(datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+        stats_path = os.path.join(directory, "{}.prof".format(name))
+        allocations_path = os.path.join(directory, "{}_memory.txt".format(name))
+
+        self.profiler.dump_stats(stats_path)
+        self.profiler = None
+
+        lines = ["Traced memory: current {} B, peak {} B".format(current, peak), ""]
+        lines.extend(str(statistic) for statistic in allocations)
+        self._write(allocations_path, "\n".join(lines) + "\n")
+
+        return stats_path, allocations_path
+
+
+METRICS = Metrics()
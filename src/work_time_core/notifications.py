@@ -0,0 +1,182 @@
+import time
+import threading
+import collections
+
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+NOTIFICATION_QUEUE_SIZE = 20
+# Identical notification isn't shown again within this time, repeats are only counted.
+NOTIFICATION_REPEAT_INTERVAL = 300
+NOTIFICATION_HISTORY = 100
+
+
+class Notification:
+    def __init__(self, text, title, level, detailed_text=""):
+        self.text = text
+        self.title = title
+        self.level = level
+        self.detailed_text = detailed_text
+        self.key = (level, title, text)
+        self.repeats = 0
+        self.created = time.time()
+
+    def __repr__(self):
+        return "Notification({!r}, {!r}, {!r})".format(self.text, self.title, self.level)
+
+
+class HeadlessSink:
+    """
+    Sink keeping delivered notifications in memory (e.g. for tests or without GUI), optionally also writing them
+    into a stream.
+    """
+    def __init__(self, stream=None, history=NOTIFICATION_HISTORY):
+        self.stream = stream
+        self.delivered = collections.deque(maxlen=history)
+
+    def __call__(self, notification):
+        self.delivered.append(notification)
+
+        if self.stream is not None:
+            repeats = " (repeated {} time(s))".format(notification.repeats) if notification.repeats else ""
+            self.stream.write("[{}] {}: {}{}\n".format(notification.level, notification.title,
+                                                       notification.text.replace("\n", " "), repeats))
+
+
+class Notifier:
+    """
+    Bounded queue of notifications between code running on timers and UI. notify() never blocks: notification
+    equal to a queued one is merged into it, notification shown within repeat interval is only counted and the
+    oldest notification is dropped if queue is full.
+
+    Queued notifications are passed to sink by dispatch(), called from UI event loop, at most one per
+    min_interval seconds, so e.g. tray balloons don't replace each other before they can be read.
+    """
+    def __init__(self, sink=None, size=NOTIFICATION_QUEUE_SIZE, repeat_interval=NOTIFICATION_REPEAT_INTERVAL,
+                 min_interval=0, clock=time.monotonic):
+        self.sink = sink
+        self.size = size
+        self.repeat_interval = repeat_interval
+        self.min_interval = min_interval
+        self.clock = clock
+        self.pending = collections.OrderedDict()
+        self.shown = {}
+        self.suppressed = {}
+        self.last_dispatch = None
+        # Called (on thread of notify) when notification is queued, e.g. to wake up UI.
+        self.on_pending = None
+        self.lock = threading.Lock()
+        self.counters = {"queued": 0, "merged": 0, "suppressed": 0, "dropped": 0, "delivered": 0, "sink_errors": 0}
+
+    def notify(self, text, title="Info", level=INFO, detailed_text=""):
+        """
+        Queue notification.
+
+        :param text: text of notification.
+        :param title: title of notification.
+        :param level: INFO, WARNING or ERROR.
+        :param detailed_text: text shown on demand, e.g. type of exception.
+        :return: True if notification was queued, False if it was merged into queued one or suppressed.
+        """
+        notification = Notification(text, title, level, detailed_text)
+        now = self.clock()
+
+        with self.lock:
+            queued = self.pending.get(notification.key)
+            if queued is not None:
+                queued.repeats += 1
+                self.counters["merged"] += 1
+                return False
+
+            shown = self.shown.get(notification.key)
+            if shown is not None and now - shown < self.repeat_interval:
+                self.suppressed[notification.key] = self.suppressed.get(notification.key, 0) + 1
+                self.counters["suppressed"] += 1
+                return False
+
+            notification.repeats = self.suppressed.pop(notification.key, 0)
+            self.pending[notification.key] = notification
+            self.counters["queued"] += 1
+
+            if len(self.pending) > self.size:
+                self.pending.popitem(last=False)
+                self.counters["dropped"] += 1
+
+        if self.on_pending:
+            self.on_pending()
+
+        return True
+
+    def info(self, text, title="Info", detailed_text=""):
+        return self.notify(text, title, INFO, detailed_text)
+
+    def warning(self, text, title="Warning", detailed_text=""):
+        return self.notify(text, title, WARNING, detailed_text)
+
+    def error(self, exc, title="Error"):
+        return self.notify(str(exc), title, ERROR, str(type(exc)))
+
+    def dispatch(self):
+        """
+        Pass next queued notification to sink, if sink is set and min_interval elapsed since previous one.
+
+        :return: seconds until next notification can be dispatched, None if queue is empty.
+        """
+        if self.sink is None:
+            return None
+
+        now = self.clock()
+
+        with self.lock:
+            if not self.pending:
+                return None
+
+            if self.last_dispatch is not None and now - self.last_dispatch < self.min_interval:
+                return self.min_interval - (now - self.last_dispatch)
+
+            key, notification = self.pending.popitem(last=False)
+            self.shown[key] = now
+            self.last_dispatch = now
+            self._forget_shown(now)
+            left = self.min_interval if self.pending else None
+
+        try:
+            self.sink(notification)
+            self.counters["delivered"] += 1
+        except Exception:
+            # Broken sink must never break code which notified.
+            self.counters["sink_errors"] += 1
+
+        return left
+
+    def dispatch_all(self):
+        """
+        Pass all queued notifications to sink, ignoring min_interval.
+
+        :return: number of dispatched notifications.
+        """
+        count = 0
+
+        while self.sink is not None and self.pending:
+            self.last_dispatch = None
+            self.dispatch()
+            count += 1
+
+        return count
+
+    def _forget_shown(self, now):
+        # Repeats of suppressed notification are reported with its next occurrence, counts of only the latest
+        # ones are kept.
+        while len(self.suppressed) > NOTIFICATION_HISTORY:
+            self.suppressed.pop(next(iter(self.suppressed)))
+
+        for key, shown in list(self.shown.items()):
+            if now - shown >= self.repeat_interval and key not in self.suppressed:
+                del self.shown[key]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = len(self.pending)
+
+        return stats
@@ -0,0 +1,33 @@
+class RenderCache:
+    """
+    Rendered views (e.g. message texts) memoized against version of state they are built from. Owner increases
+    version on every change of state, so a view is rebuilt only when it's requested after a change.
+    """
+    def __init__(self):
+        self.views = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, render):
+        """
+        Get view rendered for given state version.
+
+        :param key: view key, including everything else the view depends on (e.g. date).
+        :param version: current state version.
+        :param render: callable building the view.
+        :return: rendered view.
+        """
+        view = self.views.get(key)
+
+        if view is not None and view[0] == version:
+            self.hits += 1
+            return view[1]
+
+        self.misses += 1
+        value = render()
+        self.views[key] = (version, value)
+
+        return value
+
+    def stats(self):
+        return {"views": len(self.views), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,129 @@
+import os
+
+from .index import WorkingTimeIndex
+from .storage import TimeJournal
+from .activity import ActivityStore
+from .database import DATABASE_NAME, Database
+from .locking import VersionStamp
+from .loader import StreamingJsonLoader, parse_duration, validate_activity_day
+
+FIELDS = ("user", "kind", "period", "app", "seconds", "inactive_seconds")
+
+
+def _load(file_path, validate):
+    if not os.path.exists(file_path):
+        return {}
+
+    return StreamingJsonLoader(validate).load(file_path)
+
+
+def _period(date, period):
+    return date if period == "day" else date[:7]
+
+
+def _row(user, kind, period, seconds, app="", inactive_seconds=""):
+    return {
+        "user": user,
+        "kind": kind,
+        "period": period,
+        "app": app,
+        "seconds": seconds,
+        "inactive_seconds": inactive_seconds
+    }
+
+
+def user_report(path, period="day"):
+    """
+    Calculate working time, overtimes and applications activity of single user.
+
+    Open intervals (e.g. forgotten 'Log break' at the end of a day) aren't counted, as archived data has no
+    current time to close them with.
+
+    :param path: directory with work_time.db or log/ shards (or log.json), overtimes.json, journal.log of events
+        since last compaction and activity/ store (or activity_logs.json).
+    :param period: 'day' or 'month'.
+    :return: list of report rows.
+    """
+    if os.path.exists(os.path.join(path, DATABASE_NAME)):
+        return _database_report(path, period)
+
+    # Files can be written meanwhile by running logger, report is calculated from consistent snapshot of them.
+    return VersionStamp.for_directory(path).read_consistent(lambda: _files_report(path, period))[0]
+
+
+def _files_report(path, period):
+    user = os.path.basename(os.path.normpath(path))
+    rows = []
+
+    journal = TimeJournal(os.path.join(path, "log.json"), os.path.join(path, "overtimes.json"),
+                          os.path.join(path, "journal.log"), _load)
+    working_time, overtimes_days = journal.read()
+
+    index = WorkingTimeIndex(working_time)
+    index.load_all()
+    totals = index.day_totals if period == "day" else index.month_totals
+    for key in sorted(totals):
+        rows.append(_row(user, "working_time", key, totals[key]))
+
+    overtimes = {}
+    for date, value in overtimes_days.items():
+        key = _period(date, period)
+        overtimes[key] = overtimes.get(key, 0) + parse_duration(value)
+    for key in sorted(overtimes):
+        rows.append(_row(user, "overtime", key, overtimes[key]))
+
+    activity = {}
+    store_path = os.path.join(path, "activity")
+    if os.path.isdir(store_path):
+        store = ActivityStore(store_path)
+        for date in store.dates():
+            for app, active, inactive in store.items(date):
+                _add_activity(activity, _period(date, period), app, active, inactive)
+            store.release(date)
+    elif os.path.exists(os.path.join(path, "activity_logs.json")):
+        # Days are streamed one by one, so whole activity history is never in memory.
+        loader = StreamingJsonLoader(validate_activity_day)
+        for date, apps, _ in loader.iter_days(os.path.join(path, "activity_logs.json")):
+            for app, times in apps.items():
+                if app != "Summary":
+                    _add_activity(activity, _period(date, period), app, times["active"], times["inactive"])
+
+    for key in sorted(activity):
+        rows.append(_row(user, "activity", key[0], activity[key][0], key[1], activity[key][1]))
+
+    return rows
+
+
+def _database_report(path, period):
+    user = os.path.basename(os.path.normpath(path))
+    rows = []
+    database = Database(os.path.join(path, DATABASE_NAME), read_only=True)
+
+    try:
+        index = WorkingTimeIndex(database.working_time())
+        index.load_all()
+        totals = index.day_totals if period == "day" else index.month_totals
+        for key in sorted(totals):
+            rows.append(_row(user, "working_time", key, totals[key]))
+
+        overtimes = {}
+        for date, value in database.overtimes().items():
+            key = _period(date, period)
+            overtimes[key] = overtimes.get(key, 0) + parse_duration(value)
+        for key in sorted(overtimes):
+            rows.append(_row(user, "overtime", key, overtimes[key]))
+
+        for key, app, active, inactive in database.activity_rollup("0000/00/00", "9999/99/99", period):
+            rows.append(_row(user, "activity", key, active, app, inactive))
+    finally:
+        database.connection.close()
+
+    return rows
+
+
+def _add_activity(activity, period, app, active, inactive):
+    total = activity.get((period, app))
+    if total is None:
+        total = activity[(period, app)] = [0, 0]
+    total[0] += active
+    total[1] += inactive
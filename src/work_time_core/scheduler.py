@@ -0,0 +1,100 @@
+import time
+
+from .metrics import METRICS
+
+FLUSH_INTERVAL = 60
+FLUSH_DIRTY_THRESHOLD = 300
+
+
+class WriteBehindScheduler:
+    """
+    Keeps track of unsaved changes of registered stores and flushes them every interval or as soon as
+    number of unsaved changes reaches threshold.
+    """
+    def __init__(self, interval=FLUSH_INTERVAL, threshold=FLUSH_DIRTY_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.targets = {}
+        self.dirty = {}
+        self.dirty_size = 0
+        self.last_flush = time.monotonic()
+        self.error = None
+
+        self.flushes = 0
+        self.bytes_written = 0
+        self.flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    def register(self, name, flush):
+        """
+        Register store.
+
+        :param name: name of store used in mark_dirty.
+        :param flush: callable saving store and returning number of bytes written.
+        :return: None.
+        """
+        self.targets[name] = flush
+
+    def mark_dirty(self, name, size=1):
+        self.dirty[name] = self.dirty.get(name, 0) + size
+        self.dirty_size += size
+
+        if self.dirty_size >= self.threshold:
+            self.flush()
+
+    def tick(self):
+        if self.dirty and time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def next_flush(self, pending=False):
+        """
+        Get time left to interval flush.
+
+        :param pending: there are changes which aren't marked dirty yet (e.g. queued samples).
+        :return: seconds to flush or None if there is nothing to flush.
+        """
+        if not (self.dirty or pending):
+            return None
+
+        return max(0.0, self.last_flush + self.interval - time.monotonic())
+
+    def flush(self):
+        """
+        Flush all stores with unsaved changes. Stores which failed stay dirty and are retried on next flush.
+
+        :return: None.
+        """
+        for name in list(self.dirty):
+            started = time.perf_counter()
+            try:
+                written = self.targets[name]()
+            except Exception as exc:
+                self.error = exc
+                METRICS.count("flush_errors")
+                continue
+
+            self.last_flush_time = time.perf_counter() - started
+            METRICS.observe("flush_{}".format(name), self.last_flush_time)
+            self.max_flush_time = max(self.max_flush_time, self.last_flush_time)
+            self.flush_time += self.last_flush_time
+            self.bytes_written += written or 0
+            self.flushes += 1
+            self.dirty_size -= self.dirty.pop(name)
+
+        self.last_flush = time.monotonic()
+
+    def pop_error(self):
+        error, self.error = self.error, None
+
+        return error
+
+    def stats(self):
+        return {
+            "flushes": self.flushes,
+            "bytes_written": self.bytes_written,
+            "flush_time": self.flush_time,
+            "last_flush_time": self.last_flush_time,
+            "max_flush_time": self.max_flush_time,
+            "dirty": dict(self.dirty)
+        }
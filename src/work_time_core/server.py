@@ -0,0 +1,512 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import argparse
+import datetime
+
+from urllib.parse import urlsplit, parse_qs
+
+from .index import WorkingTimeIndex
+from .intervals import next_date, is_consistent
+from .loader import parse_duration, validate_log_day
+from .database import DATABASE_NAME, Database
+from .client import DEFAULT_PORT
+
+INGEST_BATCH_SIZE = 1000
+INGEST_QUEUE_SIZE = 100000
+MAX_LINE_SIZE = 64 * 1024
+BACKLOG = 1024
+EVENT_TYPES = ("interval", "overtime", "activity")
+
+
+class Rollups:
+    """
+    Team totals precomputed on every ingested event: working time per day and month, overtimes per user and
+    month and applications activity per day and month. Queries only sort already summed values.
+
+    Open intervals aren't counted, as server has no current time of clients to close them with.
+    """
+    def __init__(self):
+        self.indexes = {}
+        self.overtimes = {}
+        self.team_days = {}
+        self.team_months = {}
+        self.user_months = {}
+        self.user_overtimes = {}
+        self.app_days = {}
+        self.app_months = {}
+
+    def load(self, user, database):
+        working_time = database.working_time()
+        index = self.indexes[user] = WorkingTimeIndex(working_time)
+        index.load_all()
+
+        for date, seconds in index.day_totals.items():
+            self._add_time(user, date, seconds)
+        for date, value in database.overtimes().items():
+            self.overtime(user, date, value)
+        for date in database.activity_dates():
+            for app, active, inactive in database.activity_items(date):
+                self.activity(date, app, active, inactive)
+
+    def reload(self, user, database, events):
+        """
+        Bring rollups of one user back to its database, after batch of its events was rolled back. Working time
+        index of user is rebuilt, activity of all users is summed together, so events are subtracted from it.
+
+        :param user: user name.
+        :param database: Database of user.
+        :param events: rolled back events of user.
+        """
+        previous = self.indexes.pop(user, None)
+        previous_totals = previous.day_totals if previous else {}
+        index = self.indexes[user] = WorkingTimeIndex(database.working_time())
+        index.load_all()
+
+        for date in set(previous_totals) | set(index.day_totals):
+            self._add_time(user, date, index.day_totals.get(date, 0) - previous_totals.get(date, 0))
+
+        overtimes = database.overtimes()
+        for event in events:
+            date = event["date"]
+            if event["type"] == "overtime":
+                if date in overtimes:
+                    self.overtime(user, date, overtimes[date])
+                else:
+                    _add(self.user_overtimes, (user, date[:7]), -self.overtimes.pop((user, date), 0))
+            elif event["type"] == "activity":
+                self.activity(date, event["app"], -int(event["active"]), -int(event["inactive"]))
+                for rollup, key in ((self.app_days, date), (self.app_months, date[:7])):
+                    if rollup[key][event["app"]] == [0, 0]:
+                        del rollup[key][event["app"]]
+
+    def check_interval(self, user, date, index, elements):
+        """
+        Raise ValueError if interval can't be added, e.g. because previous intervals of the day are missing.
+        """
+        validate_log_day([elements])
+        if "TS" in elements and not is_consistent(date, elements):
+            raise ValueError("TS/UTC of interval {} of {} don't match its times".format(index, date))
+
+        user_index = self.indexes.get(user)
+        if index > len(user_index.days.get(date, ()) if user_index else ()):
+            raise ValueError("Interval {} of {} sent before previous intervals".format(index, date))
+
+    def interval(self, user, date, index, elements):
+        self.check_interval(user, date, index, elements)
+
+        user_index = self.indexes.get(user)
+        if user_index is None:
+            user_index = self.indexes[user] = WorkingTimeIndex()
+
+        # Interval crossing midnight is split, so next day's total can change too.
+        dates = (date, next_date(date))
+        before = [user_index.day_totals.get(day, 0) for day in dates]
+        user_index.start(date, index, elements)
+        for day, seconds in zip(dates, before):
+            self._add_time(user, day, user_index.day_totals.get(day, 0) - seconds)
+
+    def _add_time(self, user, date, seconds):
+        if seconds:
+            _add(self.team_days, date, seconds)
+            _add(self.team_months, date[:7], seconds)
+            _add(self.user_months, (user, date[:7]), seconds)
+
+    def overtime(self, user, date, value):
+        seconds = parse_duration(value)
+        previous = self.overtimes.get((user, date), 0)
+        self.overtimes[(user, date)] = seconds
+        _add(self.user_overtimes, (user, date[:7]), seconds - previous)
+
+    def activity(self, date, app, active, inactive):
+        for rollup, key in ((self.app_days, date), (self.app_months, date[:7])):
+            apps = rollup.get(key)
+            if apps is None:
+                apps = rollup[key] = {}
+            total = apps.get(app)
+            if total is None:
+                total = apps[app] = [0, 0]
+            total[0] += active
+            total[1] += inactive
+
+    def team_time(self, period, key):
+        """
+        Get working time of whole team.
+
+        :param period: 'day' or 'month'.
+        :param key: day in '%Y/%m/%d' or month in '%Y/%m' format.
+        :return: dict with seconds of team and of every user for month.
+        """
+        if period == "day":
+            return {"key": key, "seconds": self.team_days.get(key, 0)}
+
+        users = {user: seconds for (user, month), seconds in self.user_months.items() if month == key}
+
+        return {"key": key, "seconds": self.team_months.get(key, 0), "users": users}
+
+    def overtime_leaders(self, month, limit=10):
+        overtimes = ((seconds, user) for (user, key), seconds in self.user_overtimes.items() if key == month)
+
+        return [{"user": user, "seconds": seconds} for seconds, user in heapq.nlargest(limit, overtimes)]
+
+    def top_apps(self, period, key, limit=10):
+        apps = (self.app_days if period == "day" else self.app_months).get(key, {})
+        top = heapq.nlargest(limit, apps.items(), key=lambda item: item[1][0])
+
+        return [{"app": app, "active": active, "inactive": inactive} for app, (active, inactive) in top]
+
+
+def _add(totals, key, value):
+    totals[key] = totals.get(key, 0) + value
+
+
+def _interval_elements(event):
+    # Clients before TS/UTC fields send only times, day is counted from them then.
+    elements = {"START": event["start"], "END": event["end"]}
+    if "ts" in event:
+        elements["TS"] = event["ts"]
+        elements["UTC"] = event["utc"]
+
+    return elements
+
+
+class AggregationServer:
+    """
+    Asyncio service receiving interval, overtime and activity events of many tray applications and answering
+    aggregate queries.
+
+    Clients send json lines over Unix socket or localhost TCP connection. Events aren't answered, they are put
+    into a queue which is ingested in batches into database of every user (<data>/<user>/work_time.db, so
+    reports can be run over data directory) and into rollups. Query lines ({"type": "query", ...}) are answered
+    with a json line. The same port also answers HTTP GET requests of queries, e.g. /team?period=day&key=...,
+    /overtime-leaders?month=..., /top-apps?period=month&key=..., /stats.
+    """
+    def __init__(self, data_path, batch_size=INGEST_BATCH_SIZE):
+        self.data_path = data_path
+        self.batch_size = batch_size
+        self.rollups = Rollups()
+        self.databases = {}
+        self.app_ids = {}
+        self.queue = None
+        self.servers = []
+        self.ingester = None
+        self.stats = {"clients": 0, "connections": 0, "events": 0, "batches": 0, "queries": 0, "errors": 0}
+
+        os.makedirs(data_path, exist_ok=True)
+        self._load_rollups()
+
+    def _load_rollups(self):
+        self.rollups = Rollups()
+
+        for user in sorted(os.listdir(self.data_path)):
+            if os.path.exists(os.path.join(self.data_path, user, DATABASE_NAME)):
+                self.rollups.load(user, self._database(user))
+
+    def _database(self, user):
+        database = self.databases.get(user)
+
+        if database is None:
+            if not user or os.sep in user or (os.altsep and os.altsep in user) or user.startswith("."):
+                raise ValueError("Incorrect user: '{}'".format(user))
+            os.makedirs(os.path.join(self.data_path, user), exist_ok=True)
+            database = self.databases[user] = Database(os.path.join(self.data_path, user, DATABASE_NAME))
+            self.app_ids[user] = database.app_ids()
+
+        return database
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+        self.queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.ingester = asyncio.ensure_future(self._ingest())
+
+        if unix_path:
+            self.servers.append(await asyncio.start_unix_server(self._handle, unix_path, limit=MAX_LINE_SIZE,
+                                                                backlog=BACKLOG))
+        if port is not None:
+            self.servers.append(await asyncio.start_server(self._handle, host, port, limit=MAX_LINE_SIZE,
+                                                           backlog=BACKLOG))
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+        await self.queue.join()
+        self.ingester.cancel()
+        for database in self.databases.values():
+            database.close()
+        self.databases = {}
+
+    async def _handle(self, reader, writer):
+        self.stats["clients"] += 1
+        self.stats["connections"] += 1
+
+        try:
+            line = await reader.readline()
+            if line.startswith((b"GET ", b"HEAD ")):
+                await self._handle_http(line, reader, writer)
+                return
+
+            while line:
+                await self._handle_line(line, writer)
+                line = await reader.readline()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError is raised by too long line.
+            self.stats["errors"] += 1
+        finally:
+            self.stats["clients"] -= 1
+            writer.close()
+
+    async def _handle_line(self, line, writer):
+        try:
+            message = json.loads(line)
+            if message.get("type") == "query":
+                result = {"ok": True, "result": self.query(message)}
+            elif message.get("type") in EVENT_TYPES:
+                await self.queue.put(message)
+                return
+            else:
+                raise ValueError("Unknown message type: {}".format(message.get("type")))
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            self.stats["errors"] += 1
+            result = {"ok": False, "error": str(exc)}
+
+        writer.write("{}\n".format(json.dumps(result)).encode())
+        await writer.drain()
+
+    async def _handle_http(self, request_line, reader, writer):
+        while (await reader.readline()).strip():
+            # Headers aren't needed.
+            pass
+
+        url = urlsplit(request_line.split()[1].decode())
+        message = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        message["name"] = url.path.strip("/").replace("-", "_")
+
+        try:
+            status, body = "200 OK", {"ok": True, "result": self.query(message)}
+        except (ValueError, KeyError, TypeError) as exc:
+            status, body = "400 Bad Request", {"ok": False, "error": str(exc)}
+
+        content = json.dumps(body).encode()
+        writer.write("HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, len(content)).encode() + content)
+        await writer.drain()
+
+    def query(self, message):
+        """
+        Answer aggregate query.
+
+        :param message: dict with query name ('team_time', 'overtime_leaders', 'top_apps' or 'stats') and its
+            arguments (period, key, month, limit).
+        :return: query result.
+        """
+        self.stats["queries"] += 1
+        name = message["name"]
+        limit = int(message.get("limit", 10))
+
+        if name in ("team", "team_time"):
+            return self.rollups.team_time(message.get("period", "day"), message["key"])
+        if name == "overtime_leaders":
+            return self.rollups.overtime_leaders(message["month"], limit)
+        if name == "top_apps":
+            return self.rollups.top_apps(message.get("period", "day"), message["key"], limit)
+        if name == "stats":
+            return dict(self.stats, users=len(self.rollups.indexes), queued=self.queue.qsize())
+
+        raise ValueError("Unknown query: {}".format(name))
+
+    async def _ingest(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                self._ingest_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            # Let connections and queries be handled between batches.
+            await asyncio.sleep(0)
+
+    def _ingest_batch(self, batch):
+        changed = {}
+
+        for event in batch:
+            try:
+                self._ingest_event(event)
+                changed.setdefault(event["user"], []).append(event)
+            except Exception:
+                # Incorrect event of one client mustn't stop ingestion of others.
+                self.stats["errors"] += 1
+
+        # One commit per user and batch.
+        failed = []
+        for user in changed:
+            try:
+                self._database(user).commit()
+            except Exception:
+                self.stats["errors"] += 1
+                failed.append(user)
+
+        # Rollups already count events of the batch which were rolled back, only users whose commit failed are
+        # reloaded.
+        for user in failed:
+            database = self.databases[user]
+            database.rollback()
+            self.app_ids[user] = database.app_ids()
+            self.rollups.reload(user, database, changed[user])
+
+        self.stats["events"] += len(batch)
+        self.stats["batches"] += 1
+
+    def _ingest_event(self, event):
+        user = event["user"]
+        date = event["date"]
+        database = self._database(user)
+
+        # Event is validated and written into database before rollups are changed, so rollups never count event
+        # whose write failed.
+        if event["type"] == "interval":
+            index = int(event["index"])
+            elements = _interval_elements(event)
+            self.rollups.check_interval(user, date, index, elements)
+            database.set_interval(date, index, elements)
+            self.rollups.interval(user, date, index, elements)
+        elif event["type"] == "overtime":
+            parse_duration(event["value"])
+            database.set_overtime(date, event["value"])
+            self.rollups.overtime(user, date, event["value"])
+        else:
+            active, inactive = int(event["active"]), int(event["inactive"])
+            if active < 0 or inactive < 0:
+                raise ValueError("Incorrect activity: {}".format(event))
+            app_id = self.app_ids[user].get(event["app"])
+            if app_id is None:
+                app_id = self.app_ids[user][event["app"]] = database.add_app(event["app"])
+            database.add_activity(date, app_id, active, inactive)
+            self.rollups.activity(date, event["app"], active, inactive)
+
+
+async def _simulated_client(address, user, events, rnd):
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+
+    date = datetime.date.today().strftime("%Y/%m/%d")
+    lines = []
+    intervals = 0
+    for index in range(events):
+        kind = rnd.random()
+        if kind < 0.2:
+            start = 8 * 3600 + index * 60
+            lines.append({"type": "interval", "user": user, "date": date, "index": intervals,
+                          "start": _time(start), "end": _time(start + 30)})
+            intervals += 1
+        elif kind < 0.25:
+            lines.append({"type": "overtime", "user": user, "date": date, "value": _time(rnd.randrange(7200))})
+        else:
+            lines.append({"type": "activity", "user": user, "date": date, "app": "app{}".format(rnd.randrange(20)),
+                          "active": rnd.randrange(60), "inactive": rnd.randrange(10)})
+
+    writer.write("".join("{}\n".format(json.dumps(line)) for line in lines).encode())
+    started = time.perf_counter()
+    writer.write("{}\n".format(json.dumps({"type": "query", "name": "team_time", "period": "day",
+                                           "key": date})).encode())
+    await writer.drain()
+    await reader.readline()
+    latency = time.perf_counter() - started
+
+    writer.close()
+
+    return latency
+
+
+def _time(seconds):
+    seconds = seconds % 86400
+
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+async def simulate_clients(address, clients=200, events=100, seed=1):
+    """
+    Connect many simulated clients at once, each sending events and one query.
+
+    :param address: Unix socket path or (host, port) tuple.
+    :param clients: number of clients.
+    :param events: number of events sent by every client.
+    :param seed: random seed of generated events.
+    :return: dict with number of sent events, duration and query latencies.
+    """
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(
+        _simulated_client(address, "user{}".format(client), events, random.Random(rnd.random()))
+        for client in range(clients)))
+    duration = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        "clients": clients,
+        "events": clients * events,
+        "seconds": duration,
+        "events_per_second": clients * events / duration if duration else 0,
+        "query_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "query_max_ms": latencies[-1] * 1000
+    }
+
+
+async def _serve(args):
+    server = AggregationServer(args.data)
+    await server.start(args.host, None if args.unix else args.port, args.unix)
+    print("Listening on {}".format(args.unix or "{}:{}".format(args.host, args.port)))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+async def _simulate(args):
+    server = AggregationServer(args.data)
+    await server.start(args.host, None if args.unix else args.port, args.unix)
+
+    try:
+        address = args.unix or (args.host, args.port)
+        result = await simulate_clients(address, args.clients, args.events)
+        await server.queue.join()
+        result["stats"] = server.query({"name": "stats"})
+    finally:
+        await server.stop()
+
+    print(json.dumps(result, indent=3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="work_time_core",
+        description="Aggregation server of working time and activity events of many users."
+    )
+    parser.add_argument("command", choices=("serve", "simulate"),
+                        help="run server or run server with simulated clients")
+    parser.add_argument("--data", required=True, help="data directory with directory of every user")
+    parser.add_argument("--host", default="127.0.0.1", help="host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port (default: {})".format(DEFAULT_PORT))
+    parser.add_argument("--unix", help="Unix socket path, used instead of TCP port")
+    parser.add_argument("--clients", type=int, default=200, help="number of simulated clients")
+    parser.add_argument("--events", type=int, default=100, help="number of events of every simulated client")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(_serve(args) if args.command == "serve" else _simulate(args))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
@@ -0,0 +1,272 @@
+import os
+import re
+import copy
+import json
+import lzma
+import time
+import threading
+import collections
+
+from collections.abc import MutableMapping
+
+from . import storage
+from .metrics import METRICS
+
+SHARD_CACHE_BUDGET = 1024 * 1024
+MANIFEST_NAME = "index.json"
+SHARD_PATTERN = re.compile(r"^(\d{4})-(\d{2})\.json(\.xz)?$")
+
+
+class ShardedDays(MutableMapping):
+    """
+    Days of log kept in a directory of per-month json files ('2024-01.json'), closed months compressed with lzma
+    ('2024-01.json.xz'). Dates of all months are listed in a small manifest, so keys are known without reading
+    shards.
+
+    Current month is loaded eagerly, other months on first access into LRU cache limited by memory budget (size
+    of month json text). Months with unsaved changes are never evicted.
+    """
+    def __init__(self, path, current_month=None, budget=SHARD_CACHE_BUDGET):
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.current_month = current_month
+        self.budget = budget
+        self.dates = {}
+        self.months = collections.OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.unsaved = set()
+        self.writing = set()
+        self.lock = threading.Lock()
+        self.stats = {"months": 0, "loads": 0, "evictions": 0}
+
+        os.makedirs(path, exist_ok=True)
+        self._load_manifest()
+
+        if current_month:
+            self._month(current_month)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            manifest = None
+
+        files = self._files()
+        if manifest is None or set(manifest) != set(files):
+            # Manifest is missing or outdated, dates are read from shards.
+            manifest = {month: list(self._read(month)) for month in files}
+
+        self.dates = {month: dict.fromkeys(dates) for month, dates in manifest.items()}
+        self.stats["months"] = len(self.dates)
+
+    def _files(self):
+        files = {}
+
+        for name in os.listdir(self.path):
+            match = SHARD_PATTERN.match(name)
+            if match:
+                files["{}/{}".format(match.group(1), match.group(2))] = os.path.join(self.path, name)
+
+        return files
+
+    def _shard_path(self, month, archived):
+        return os.path.join(self.path, "{}.json{}".format(month.replace("/", "-"), ".xz" if archived else ""))
+
+    def _read_text(self, month):
+        if os.path.exists(self._shard_path(month, True)):
+            with lzma.open(self._shard_path(month, True), 'rt') as fp:
+                return fp.read()
+
+        if os.path.exists(self._shard_path(month, False)):
+            with open(self._shard_path(month, False), 'r') as fp:
+                return fp.read()
+
+        return ""
+
+    def _read(self, month):
+        text = self._read_text(month)
+
+        return json.loads(text) if text else {}
+
+    def _month(self, month):
+        days = self.months.get(month)
+
+        if days is not None:
+            self.months.move_to_end(month)
+            return days
+
+        if month in self.dates:
+            started = time.perf_counter()
+            text = self._read_text(month)
+            days = json.loads(text) if text else {}
+            self.stats["loads"] += 1
+            METRICS.observe("shard_load", time.perf_counter() - started)
+        else:
+            text = ""
+            days = {}
+
+        self.months[month] = days
+        self.sizes[month] = len(text)
+        self.size += len(text)
+        self._evict()
+
+        return days
+
+    def _evict(self):
+        with self.lock:
+            pinned = self.unsaved | self.writing | {self.current_month}
+
+        for month in list(self.months):
+            if self.size <= self.budget:
+                break
+            if month in pinned:
+                continue
+
+            del self.months[month]
+            self.size -= self.sizes.pop(month)
+            self.stats["evictions"] += 1
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        return self._month(key[:7])[key]
+
+    def __setitem__(self, key, value):
+        month = key[:7]
+        self._month(month)[key] = value
+        self.dates.setdefault(month, {})[key] = None
+
+        with self.lock:
+            self.unsaved.add(month)
+
+    def __delitem__(self, key):
+        month = key[:7]
+        del self._month(month)[key]
+        del self.dates[month][key]
+
+        with self.lock:
+            self.unsaved.add(month)
+
+    def __contains__(self, key):
+        return key in self.dates.get(key[:7], ())
+
+    def __iter__(self):
+        for month in sorted(self.dates):
+            yield from list(self.dates[month])
+
+    def __len__(self):
+        return sum(len(dates) for dates in self.dates.values())
+
+    def month_days(self, month):
+        """
+        Get days of a month without keeping them in cache.
+
+        :param month: month in '%Y/%m' format.
+        :return: dict of days.
+        """
+        if month in self.months:
+            return self.months[month]
+
+        return self._read(month) if month in self.dates else {}
+
+    def to_dict(self):
+        return {date: days[date] for month in sorted(self.dates) for days in [self.month_days(month)]
+                for date in sorted(days)}
+
+    def snapshot(self):
+        """
+        Copy months with unsaved changes, so they can be written on another thread.
+
+        :return: tuple of months dict and manifest.
+        """
+        with self.lock:
+            months = {month: copy.deepcopy(self.months.get(month, {})) for month in self.unsaved}
+            self.writing |= self.unsaved
+            self.unsaved = set()
+
+        manifest = {month: list(dates) for month, dates in self.dates.items() if dates}
+
+        return months, manifest
+
+    def write(self, snapshot):
+        """
+        Write snapshot of months, closed months (before current month) compressed.
+
+        :param snapshot: result of snapshot().
+        :return: number of bytes written.
+        """
+        months, manifest = snapshot
+        written = 0
+
+        try:
+            for month, days in months.items():
+                written += self._write_month(month, days)
+
+            content = json.dumps(manifest)
+            storage.JsonHelpers.write_atomic(self.manifest_path, lambda fp: fp.write(content))
+            written += len(content)
+        finally:
+            with self.lock:
+                # Failed months stay unsaved, so they are written again by next snapshot.
+                self.writing -= set(months)
+
+        return written
+
+    def _write_month(self, month, days):
+        archived = self.current_month is not None and month < self.current_month
+        path = self._shard_path(month, archived)
+        other_path = self._shard_path(month, not archived)
+
+        if not days:
+            content = b""
+            for shard_path in (path, other_path):
+                if os.path.exists(shard_path):
+                    os.remove(shard_path)
+        else:
+            text = json.dumps({date: days[date] for date in sorted(days)}, indent=None if archived else 3)
+            content = lzma.compress(text.encode()) if archived else text.encode()
+            storage.JsonHelpers.write_atomic(path, lambda fp: fp.write(content), mode='wb')
+            if os.path.exists(other_path):
+                os.remove(other_path)
+
+        return len(content)
+
+    def archive_closed(self):
+        """
+        Compress shards of months before current month which aren't compressed yet.
+
+        :return: None.
+        """
+        for month in sorted(self.dates):
+            if self.current_month and month < self.current_month and os.path.exists(self._shard_path(month, False)):
+                self._write_month(month, self.month_days(month))
+
+    def replace(self, days):
+        """
+        Replace all months with given days, e.g. with manually edited log.
+
+        :param days: dict of days.
+        :return: None.
+        """
+        months = {}
+        for date, value in days.items():
+            months.setdefault(date[:7], {})[date] = value
+
+        for month in set(self.dates) - set(months):
+            months[month] = {}
+
+        manifest = {month: list(month_days) for month, month_days in months.items() if month_days}
+        self.write((months, manifest))
+
+        self.dates = {month: dict.fromkeys(dates) for month, dates in manifest.items()}
+        self.months = collections.OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        with self.lock:
+            self.unsaved = set()
+
+        if self.current_month:
+            self._month(self.current_month)
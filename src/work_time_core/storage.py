@@ -0,0 +1,361 @@
+import os
+import json
+import copy
+import time
+import tempfile
+import datetime
+import threading
+
+from .loader import LazyDays, StreamingJsonLoader, validate_log_day, validate_overtime
+from .shards import ShardedDays
+from .metrics import METRICS
+from .intervals import format_time, new_entry, close_entry
+from .locking import VersionStamp
+
+JOURNAL_FSYNC_BATCH = 20
+JOURNAL_COMPACT_THRESHOLD = 500
+
+
+class JsonHelpers:
+    @staticmethod
+    def load(file_path, validate=None, materialize=None):
+        """
+        Read days from specific json file. Corrupt days are moved into '<file_path>.quarantine' file.
+
+        :param file_path: path to json file.
+        :param validate: callable raising ValueError for incorrect day.
+        :param materialize: predicate of days which should be parsed eagerly, all days if not given.
+        :return: LazyDays with loaded days, empty if file doesn't exist.
+        """
+        if not os.path.exists(file_path):
+            return LazyDays()
+
+        loader = StreamingJsonLoader(validate, materialize, "{}.quarantine".format(file_path))
+
+        return loader.load(file_path)
+
+    @staticmethod
+    def dump_atomic(file_path, data):
+        """
+        Write data into json file through a temporary file, so a crash never leaves truncated content.
+
+        :param file_path: path to file where data will be written.
+        :param data: data to write into file
+        :return: None.
+        """
+        if isinstance(data, LazyDays):
+            JsonHelpers.write_atomic(file_path, lambda fp: data.dump(fp, indent=3))
+        else:
+            JsonHelpers.write_atomic(file_path, lambda fp: json.dump(data, fp, indent=3))
+
+    @staticmethod
+    def write_atomic(file_path, write, mode='w'):
+        """
+        Write file content through a temporary file renamed over the destination.
+
+        :param file_path: path to file where data will be written.
+        :param write: callable writing content into given file object.
+        :param mode: 'w' for text or 'wb' for binary content.
+        :return: None.
+        """
+        started = time.perf_counter()
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as fp:
+                write(fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            METRICS.count("io_write_errors")
+            raise
+
+        METRICS.observe("io_write", time.perf_counter() - started)
+
+
+class TimeJournal:
+    """
+    Append-only journal of START/END/overtime events kept on top of per-month log shards and overtimes.json.
+
+    Every event is idempotent (it sets a value at a given date/index), so replaying the journal over a snapshot
+    which already contains some of its events always gives the same state.
+
+    Log is kept in a directory next to log.json (e.g. 'log/2024-01.json'), log.json is imported into it once and
+    later only written by export() for manual editing. Journal is rotated and removed under version stamp of the
+    directory, so other processes (e.g. reports) read() consistent state of running logger. Snapshots are written
+    outside of it: every file is replaced atomically and rotated journal is replayed over them until all are
+    written, so readers never wait for their serialization.
+    """
+    def __init__(self, log_path, overtimes_path, journal_path, read_file=JsonHelpers.load):
+        self.log_path = log_path
+        self.shards_path = os.path.splitext(log_path)[0]
+        self.overtimes_path = overtimes_path
+        self.journal_path = journal_path
+        self.rotated_path = "{}.old".format(journal_path)
+        self.read_file = read_file
+        self.stamp = VersionStamp.for_directory(os.path.dirname(os.path.abspath(log_path)))
+        self.working_time = {}
+        self.overtimes = {}
+        self.load_stats = {}
+        self.fp = None
+        self.pending = 0
+        self.pending_bytes = 0
+        self.events = 0
+        self.replayed_dates = set()
+        self.compaction = None
+        self.error = None
+
+    def load(self):
+        """
+        Load snapshots and replay journal events written after them.
+
+        :return: tuple of working time and overtimes dicts.
+        """
+        self._wait_compaction()
+        if self.fp:
+            self.fp.close()
+
+        if not os.path.isdir(self.shards_path):
+            days = self.read_file(self.log_path, validate_log_day)
+            with self.stamp:
+                self._open_shards().replace(days)
+
+        self.working_time = self._open_shards()
+        with self.stamp:
+            self.working_time.archive_closed()
+        self.overtimes = self.read_file(self.overtimes_path, validate_overtime)
+        self.load_stats = {
+            self.shards_path: self.working_time.stats,
+            self.overtimes_path: getattr(self.overtimes, "stats", {})
+        }
+        self.events = 0
+        self.replayed_dates = set()
+
+        for path in (self.rotated_path, self.journal_path):
+            self.events += self._replay(path)
+
+        self.fp = open(self.journal_path, 'a')
+        self.pending = 0
+        self.pending_bytes = 0
+
+        return self.working_time, self.overtimes
+
+    def read(self):
+        """
+        Read state written by other process (e.g. running logger) without changing its files: snapshots with
+        journal events written since last compaction replayed over them. Files are consistent only if read through
+        VersionStamp.read_consistent() of their directory.
+
+        :return: tuple of working time and overtimes dicts.
+        """
+        if os.path.isdir(self.shards_path):
+            self.working_time = ShardedDays(self.shards_path)
+        else:
+            self.working_time = self.read_file(self.log_path, validate_log_day)
+        self.overtimes = self.read_file(self.overtimes_path, validate_overtime)
+
+        for path in (self.rotated_path, self.journal_path):
+            self._replay(path)
+
+        return self.working_time, self.overtimes
+
+    def _open_shards(self):
+        return ShardedDays(self.shards_path, datetime.date.today().strftime("%Y/%m"))
+
+    def reload(self):
+        """
+        Import manually edited log.json and overtimes.json, written by export().
+
+        :return: tuple of working time and overtimes dicts.
+        """
+        self._wait_compaction()
+        days = self.read_file(self.log_path, validate_log_day)
+        with self.stamp:
+            self.working_time.replace(days)
+
+        return self.load()
+
+    def export(self):
+        """
+        Write current state into log.json and overtimes.json, e.g. before they are edited manually.
+
+        :return: None.
+        """
+        self.compact(background=False)
+        JsonHelpers.dump_atomic(self.log_path, self.working_time.to_dict())
+
+    def month_overtimes(self, month):
+        return {date: value for date, value in self.overtimes.items() if month in date}
+
+    def start(self, date, timestamp, offset):
+        index = len(self.working_time.get(date) or [])
+        self._append({"op": "START", "date": date, "index": index, "time": format_time(timestamp, offset),
+                      "ts": timestamp, "utc": offset})
+
+        return index
+
+    def end(self, date, timestamp, offset):
+        index = len(self.working_time[date]) - 1
+        self._append({"op": "END", "date": date, "index": index, "time": format_time(timestamp, offset),
+                      "ts": timestamp, "utc": offset})
+
+        return index
+
+    def overtime(self, date, value):
+        self._append({"op": "OVERTIME", "date": date, "value": value})
+
+    def set_day(self, date, intervals):
+        """
+        Replace all intervals of a day, e.g. with manually edited ones.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param intervals: list of START/END entries, None to remove the day.
+        :return: None.
+        """
+        self._append({"op": "DAY", "date": date, "intervals": intervals})
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        with open(path, 'r') as fp:
+            for line in fp:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Torn write of the last line after a crash.
+                    continue
+                self._apply(event)
+                self.replayed_dates.add(event["date"])
+                count += 1
+
+        return count
+
+    def _apply(self, event):
+        if event["op"] == "OVERTIME":
+            if event["value"] is None:
+                self.overtimes.pop(event["date"], None)
+            else:
+                self.overtimes[event["date"]] = event["value"]
+            return
+
+        if event["op"] == "DAY":
+            if event["intervals"] is None:
+                self.working_time.pop(event["date"], None)
+            else:
+                self.working_time[event["date"]] = copy.deepcopy(event["intervals"])
+            return
+
+        day = self.working_time.get(event["date"])
+        if day is None:
+            day = self.working_time[event["date"]] = list()
+
+        index = event["index"]
+        if event["op"] == "START":
+            # Events written before epoch seconds were kept have only time.
+            entry = new_entry(event["ts"], event["utc"]) if "ts" in event else {"START": event["time"], "END": ""}
+            if index < len(day):
+                day[index] = entry
+            else:
+                day.append(entry)
+        elif event["op"] == "END" and index < len(day):
+            if "ts" in event:
+                close_entry(event["date"], day[index], event["ts"], event["utc"])
+            else:
+                day[index]["END"] = event["time"]
+
+        # Marks month of the day as changed.
+        self.working_time[event["date"]] = day
+
+    def _append(self, event):
+        METRICS.count("journal_events")
+        self._apply(event)
+        line = "{}\n".format(json.dumps(event))
+        self.fp.write(line)
+        self.fp.flush()
+        self.pending += 1
+        self.pending_bytes += len(line)
+        self.events += 1
+
+        if self.pending >= JOURNAL_FSYNC_BATCH:
+            self.sync()
+
+        if self.events >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact()
+
+    def sync(self):
+        """
+        Force journal events written so far to disk.
+
+        :return: number of bytes synced.
+        """
+        synced = self.pending_bytes
+
+        if self.fp and self.pending:
+            started = time.perf_counter()
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            METRICS.observe("journal_fsync", time.perf_counter() - started)
+        self.pending = 0
+        self.pending_bytes = 0
+
+        return synced
+
+    def compact(self, background=True):
+        """
+        Write current state into snapshots and start new, empty journal.
+
+        :param background: write snapshots in separate thread.
+        :return: None.
+        """
+        self._wait_compaction()
+        self.sync()
+        self.fp.close()
+
+        # Readers replay both journals, rotation mustn't happen between their reads.
+        with self.stamp:
+            if os.path.exists(self.rotated_path):
+                # Previous compaction failed, keep its events until snapshot is written.
+                with open(self.journal_path, 'r') as src, open(self.rotated_path, 'a') as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            elif os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.rotated_path)
+
+        self.fp = open(self.journal_path, 'a')
+        self.events = 0
+
+        args = (self.working_time.snapshot(), copy.deepcopy(self.overtimes))
+        if background:
+            self.compaction = threading.Thread(target=self._write_snapshots, args=args, daemon=True)
+            self.compaction.start()
+        else:
+            self._write_snapshots(*args)
+
+    def _write_snapshots(self, months, overtimes):
+        try:
+            self.working_time.write(months)
+            JsonHelpers.dump_atomic(self.overtimes_path, overtimes)
+            with self.stamp:
+                os.remove(self.rotated_path)
+        except Exception as exc:
+            self.error = exc
+
+    def _wait_compaction(self):
+        if self.compaction:
+            self.compaction.join()
+            self.compaction = None
+
+    def pop_error(self):
+        error, self.error = self.error, None
+
+        return error
+
+    def close(self):
+        if self.fp:
+            self.compact(background=False)
+            self.fp.close()
+            self.fp = None
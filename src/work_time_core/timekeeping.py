@@ -0,0 +1,374 @@
+import os
+import datetime
+
+from .storage import JsonHelpers, TimeJournal
+from .index import WorkingTimeIndex
+from .scheduler import WriteBehindScheduler
+from .database import Database, DatabaseJournal
+from .render import RenderCache
+from .ledger import OvertimeLedger, format_balance
+from .edits import EditSession
+from . import intervals
+
+
+class WorkTime:
+    """
+    Logged working time and overtimes with calculations used by the tray application and reports.
+
+    Every change of logged time increases version, messages which don't depend on current time are rendered
+    only once per version. Changes of ledger balances (also of running interval) increase only ledger_version,
+    which is checked only by messages showing balances.
+    """
+    def __init__(self, log_path, overtimes_path, journal_path, scheduler=None, read_file=JsonHelpers.load,
+                 database_path=None):
+        self.reference_time = datetime.timedelta(minutes=0, hours=8)
+        self.now_date = ""
+        self.time_left = ""
+        self.is_overtime = False
+        self.version = 0
+        self.ledger_version = 0
+        self.rendered = RenderCache()
+        self.publisher = None
+        self.loaded_month = datetime.date.today().strftime("%Y/%m")
+        if database_path:
+            self.storage = DatabaseJournal(Database.connect(database_path), log_path, overtimes_path, journal_path,
+                                           read_file)
+        else:
+            self.storage = TimeJournal(log_path, overtimes_path, journal_path, read_file)
+        self.working_time, self.overtimes = self.storage.load()
+        self.index = WorkingTimeIndex(self.working_time)
+
+        self.scheduler = scheduler or WriteBehindScheduler()
+        self.scheduler.register("time", self.storage.sync)
+
+        self.ledger = OvertimeLedger("{}_ledger".format(os.path.splitext(overtimes_path)[0]))
+        self.scheduler.register("ledger", self.ledger.save)
+        if self.ledger.load(self._reference_seconds()):
+            # Ledger is saved after logs, days changed just before exit (or crash) may be missing in it.
+            for date in self._recent_dates():
+                self.update_ledger(date)
+        else:
+            self.rebuild_ledger()
+
+    def _reference_seconds(self):
+        return int(self.reference_time.total_seconds())
+
+    def rebuild_ledger(self):
+        """
+        Rebuild overtime ledger from all logged days.
+
+        :return: None.
+        """
+        self.index.load_all()
+        self.ledger.rebuild(self.index.day_totals, self._reference_seconds())
+        self.ledger_version += 1
+        self.update_ledger()
+        self.scheduler.mark_dirty("ledger")
+
+    def update_ledger(self, date=None):
+        """
+        Update overtime ledger with current working time of a day (today by default).
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: None.
+        """
+        today = datetime.date.today().strftime("%Y/%m/%d")
+        date = date or today
+
+        if date == today:
+            seconds = self.index.day_seconds(date, self.index.now_seconds())
+        else:
+            # Interval left open on previous day isn't counted until it's closed.
+            seconds = self.index.day_total(date)
+            if seconds is None and date not in self.working_time:
+                return
+            seconds = seconds or 0
+
+        if date == today and not seconds and date not in self.working_time:
+            return
+
+        if self.ledger.set_day(date, seconds - self._reference_seconds()):
+            self.ledger_version += 1
+            # Balance of running interval changes on every wakeup and is recomputed at start, so it's saved only
+            # once the interval is closed.
+            if date != today or not self.index.is_open(date):
+                self.scheduler.mark_dirty("ledger")
+
+    def _recent_dates(self):
+        # Days of current and previous month (interval closed after midnight) and days of journal events.
+        previous_month = (datetime.date.today().replace(day=1) - datetime.timedelta(days=1)).strftime("%Y/%m")
+        dates = set(self.storage.replayed_dates)
+        dates.update(date for date in self.working_time if date[:7] in (self.loaded_month, previous_month))
+
+        return sorted(dates)
+
+    def log_time(self, first_run=False, exit=False):
+        timestamp, offset = intervals.now()
+        self.now_date = intervals.format_date(timestamp, offset)
+
+        self._write_time_to_file(timestamp, offset, first_run, exit)
+
+        return intervals.format_time(timestamp, offset)
+
+    def is_working(self):
+        """
+        Check if work is logged right now, i.e. last interval counted into today isn't ended by a break.
+        """
+        return self.index.is_open(datetime.date.today().strftime("%Y/%m/%d"))
+
+    def seconds_to_reference(self):
+        """
+        Get time left to reaching reference working time today.
+
+        :return: seconds or None if work isn't logged right now or reference time is already reached.
+        """
+        date = datetime.date.today().strftime("%Y/%m/%d")
+
+        if not self.index.is_open(date):
+            return None
+
+        left = self.reference_time.total_seconds() - self.index.day_seconds(date, self.index.now_seconds())
+
+        return left if left > 0 else None
+
+    def _check_date_exist(self, data):
+        if self.now_date in data.keys():
+            return True
+
+        return False
+
+    def _write_time_to_file(self, timestamp, offset, first_run, exit):
+        self.log_label = "Log break"
+        # Interval started before midnight (e.g. night shift) is ended on the day it was started.
+        open_date = self.index.open_date(self.now_date, timestamp)
+
+        if open_date:
+            if not first_run:
+                self._log_end(open_date, timestamp, offset)
+                self.log_label = "Log work"
+        elif self.working_time.get(self.now_date):
+            if not exit:
+                self._log_start(self.now_date, timestamp, offset)
+        else:
+            self._log_start(self.now_date, timestamp, offset)
+
+        self.report_storage_error()
+
+    def _log_start(self, date, timestamp, offset):
+        index = self.storage.start(date, timestamp, offset)
+        self.index.start(date, index, self.working_time[date][index])
+        self.version += 1
+        self.scheduler.mark_dirty("time")
+        self.update_ledger(date)
+        self._publish(date, index)
+
+    def _log_end(self, date, timestamp, offset):
+        index = self.storage.end(date, timestamp, offset)
+        self.index.end(date, index, self.working_time[date][index])
+        self.version += 1
+        self.scheduler.mark_dirty("time")
+        self.update_ledger(date)
+        if date != self.now_date:
+            self.update_ledger(self.now_date)
+        self._publish(date, index)
+
+    def _publish(self, date, index):
+        # Send interval to aggregation server, if any.
+        if self.publisher:
+            self.publisher.interval(date, index, self.working_time[date][index])
+
+    def save_overtime(self, date, overtimes, timestamp=None, offset=None):
+        if timestamp is None:
+            timestamp, offset = intervals.now()
+
+        self.storage.overtime(date, str(overtimes))
+        if self.publisher:
+            self.publisher.overtime(date, str(overtimes))
+        self._log_end(self.index.open_date(date, timestamp) or date, timestamp, offset)
+        self.report_storage_error()
+
+    def report_storage_error(self):
+        exc = self.storage.pop_error()
+        if exc:
+            raise exc
+
+    def reload(self):
+        self.working_time, self.overtimes = self.storage.reload()
+        self.index.rebuild(self.working_time)
+        self.rebuild_ledger()
+        self.version += 1
+
+    def begin_edit(self, kind, start, end):
+        """
+        Export days of a range into temporary file for manual editing.
+
+        :param kind: 'logs' or 'overtimes'.
+        :param start: first day in '%Y/%m/%d' format.
+        :param end: last day in '%Y/%m/%d' format.
+        :return: EditSession with path of the file.
+        """
+        return EditSession(kind, self.working_time if kind == "logs" else self.overtimes, start, end)
+
+    def apply_edit(self, session):
+        """
+        Apply days changed in edited file, indexes and ledger are updated only for those days. Nothing is applied
+        if the file has any incorrect day.
+
+        :param session: EditSession returned by begin_edit.
+        :return: tuple of changed days count and list of errors.
+        """
+        changes, errors = session.read()
+        session.close()
+
+        for date, value in sorted(changes.items()):
+            if session.kind == "logs" and value is not None:
+                value = intervals.normalize_day(date, value)
+
+            if session.kind == "overtimes":
+                self.storage.overtime(date, value)
+                if self.publisher and value is not None:
+                    self.publisher.overtime(date, value)
+                continue
+
+            self.storage.set_day(date, value)
+            self.index.set_day(date, value or [])
+            if value is None:
+                self.ledger.remove_day(date)
+                self.ledger_version += 1
+                self.scheduler.mark_dirty("ledger")
+            else:
+                self.update_ledger(date)
+                for index in range(len(value)):
+                    self._publish(date, index)
+
+        if changes:
+            self.version += 1
+            self.scheduler.mark_dirty("time")
+            self.report_storage_error()
+
+        return len(changes), errors
+
+    def stats(self):
+        return {
+            "days": len(self.working_time),
+            "indexed_months": len(self.index.indexed_months),
+            "indexed_days": len(self.index.days),
+            "ledger_days": len(self.ledger.days),
+            "storage": getattr(self.working_time, "stats", {}),
+            "rendered": self.rendered.stats()
+        }
+
+    def today_logs_message(self):
+        return self.rendered.get(("today", self.now_date), self.version, self._render_today_logs)
+
+    def _render_today_logs(self):
+        if not self._check_date_exist(self.working_time):
+            return "Not logged any time!"
+
+        return "".join("{}:{}\n".format(element_name, elements[element_name])
+                       for elements in self.working_time[self.now_date]
+                       for element_name in ("START", "END"))
+
+    def update_time_left(self):
+        """
+        Update time_left and is_overtime without building whole working time message, e.g. for tooltip.
+
+        :return: today's working time.
+        """
+        working_time = self._calculate_working_time()
+        self._update_time_left(working_time)
+
+        return working_time
+
+    def _update_time_left(self, working_time):
+        self.is_overtime = working_time > self.reference_time
+
+        if self.is_overtime:
+            delta = working_time - self.reference_time
+            self.time_left = "Overtimes: {}".format(delta)
+        else:
+            delta = self._calculate_time_left(working_time, self.reference_time)
+            if working_time:
+                self.time_left = "Time left: {}".format(delta)
+
+        return delta
+
+    def working_time_message(self):
+        working_time = self._calculate_working_time()
+        delta = self._update_time_left(working_time)
+        lines = ["Today:", "", "{:<20} {}".format("Working time:", working_time)]
+
+        if working_time:
+            if not self.is_overtime:
+                end_time = (datetime.datetime.now() + delta).strftime("%H:%M:%S")
+                lines.append("{:<20} {}".format("Time left:", delta))
+                lines.append("{:<20} {}".format("Estimated end work:", end_time))
+            else:
+                lines.append("{:<20} {}".format("Overtimes:", delta))
+
+        month_working_time = self._calculate_summary_working_time()
+        lines.extend(["", "Current month:", "", "{:<20} {}".format("Working time:", month_working_time), ""])
+
+        return "\n".join(lines)
+
+    def _calculate_summary_working_time(self):
+        month = datetime.datetime.now().strftime("%Y/%m")
+        seconds = self.index.month_seconds(month, self.index.now_seconds())
+        working_time = datetime.timedelta(seconds=seconds)
+
+        working_time = self._convert_timedelta(working_time)
+
+        return working_time
+
+    def _convert_timedelta(self, duration):
+        days, seconds = duration.days, duration.seconds
+        hours = days * 24 + seconds // 3600
+        minutes = (seconds % 3600) // 60
+        seconds = (seconds % 60)
+
+        return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+    def _calculate_time_left(self, working_time=None, reference_time=None):
+        if not (working_time and reference_time):
+            working_time = self._calculate_working_time()
+            reference_time = datetime.timedelta(minutes=0, hours=8)
+
+        to_go = reference_time - working_time
+
+        return to_go
+
+    def _calculate_working_time(self):
+        working_time = datetime.timedelta()
+
+        now = self.index.now_seconds()
+
+        if self._check_date_exist(self.working_time) or self.index.open_date(self.now_date, now):
+            seconds = self.index.day_seconds(self.now_date, now)
+            working_time = datetime.timedelta(seconds=seconds)
+        else:
+            self._missing_start()
+
+        return working_time
+
+    def _missing_start(self):
+        self.log_time()
+
+    def overtimes_message(self):
+        month = str(datetime.datetime.now().strftime("%Y/%m"))
+
+        return self.rendered.get(("overtimes", month), (self.version, self.ledger_version),
+                                 lambda: self._render_overtimes(month))
+
+    def _render_overtimes(self, month):
+        overtimes = self.storage.month_overtimes(month)
+        balance = "{:<36} {}\n{:<36} {}\n{:<36} {}".format(
+            "Balance of month:", format_balance(self.ledger.month(month)),
+            "Carried over from previous months:", format_balance(self.ledger.carry_over(month)),
+            "Balance of year:", format_balance(self.ledger.year(month[:4])))
+
+        if not overtimes:
+            return "No overtimes in current month.\n\n{}".format(balance)
+
+        lines = ["{}: {}\n".format(date, value) for date, value in overtimes.items()]
+
+        return "Overtimes in: '{}'\n\n{}\n{}".format(month, "".join(lines), balance)
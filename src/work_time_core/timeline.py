@@ -0,0 +1,259 @@
+import os
+import array
+import bisect
+import collections
+
+from .storage import JsonHelpers
+
+TIMELINE_CACHE_SIZE = 2
+# Samples whose windows are at most this far apart (e.g. because of timer jitter) extend the same segment.
+TIMELINE_MERGE_GAP = 2
+DAY_SECONDS = 24 * 3600
+
+
+def parse_time(value):
+    """
+    Get seconds since midnight.
+
+    :param value: seconds or time in '%H:%M' or '%H:%M:%S' format ('24:00' is the end of a day).
+    :return: seconds.
+    """
+    if isinstance(value, int):
+        return value
+
+    parts = [int(part) for part in value.split(":")]
+
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+
+class DayTimeline:
+    """
+    Foreground application of one day at second resolution as run-length encoded segments: parallel arrays of
+    segment start and end (seconds since midnight), application id and active flag. Sample continuing the last
+    segment only moves its end, so typical day takes a few hundred segments (about 10 B each).
+    """
+    def __init__(self):
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+        self.app_ids = array.array('I')
+        self.active = array.array('B')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, second, app_id, active, seconds=1):
+        """
+        Add sample covering seconds before given second.
+
+        :param second: seconds since midnight when sample was taken.
+        :param app_id: id of application.
+        :param active: True if user was active.
+        :param seconds: length of sample window.
+        :return: True if sample was added, False if its window was already logged.
+        """
+        end = min(second, DAY_SECONDS)
+        start = max(end - seconds, 0)
+
+        if self.starts:
+            last_end = self.ends[-1]
+            if end <= last_end:
+                # Clock moved back or duplicate sample, second can't be logged twice.
+                return False
+
+            if self.app_ids[-1] == app_id and self.active[-1] == active and start - last_end <= TIMELINE_MERGE_GAP:
+                self.ends[-1] = end
+                return True
+
+            start = max(start, last_end)
+
+        self.starts.append(start)
+        self.ends.append(end)
+        self.app_ids.append(app_id)
+        self.active.append(1 if active else 0)
+
+        return True
+
+    def query(self, start, end):
+        """
+        Get segments overlapping range, clipped to it. Only segments in range are visited.
+
+        :param start: seconds since midnight.
+        :param end: seconds since midnight.
+        :return: list of (start, end, application id, active) tuples.
+        """
+        # Segments don't overlap, so their ends are sorted too.
+        index = bisect.bisect_right(self.ends, start)
+        segments = []
+
+        while index < len(self.starts) and self.starts[index] < end:
+            segments.append((max(self.starts[index], start), min(self.ends[index], end), self.app_ids[index],
+                             bool(self.active[index])))
+            index += 1
+
+        return segments
+
+    def to_bytes(self):
+        return array.array('I', [len(self.starts)]).tobytes() + self.starts.tobytes() + self.ends.tobytes() + \
+            self.app_ids.tobytes() + self.active.tobytes()
+
+    @classmethod
+    def from_file(cls, fp):
+        timeline = cls()
+        count = array.array('I')
+        count.fromfile(fp, 1)
+
+        for values in (timeline.starts, timeline.ends, timeline.app_ids, timeline.active):
+            values.fromfile(fp, count[0])
+
+        return timeline
+
+
+class ActivityTimeline:
+    """
+    Day timelines of foreground applications kept in a directory, one binary file per day ('2024-01-15.rle')
+    with application names interned in 'apps.txt'. Current day is kept in memory and written by save(), other
+    days are read on query into a small LRU cache.
+    """
+    def __init__(self, path, cache_size=TIMELINE_CACHE_SIZE):
+        self.path = path
+        self.apps_path = os.path.join(path, "apps.txt")
+        self.cache_size = cache_size
+        self.apps = []
+        self.app_ids = {}
+        self.days = collections.OrderedDict()
+        self.dirty = set()
+
+        os.makedirs(path, exist_ok=True)
+        self._load_apps()
+
+    def _load_apps(self):
+        if os.path.exists(self.apps_path):
+            with open(self.apps_path, 'r', encoding='utf-8') as fp:
+                for name in fp.read().splitlines():
+                    self.app_ids[name] = len(self.apps)
+                    self.apps.append(name)
+
+    def _day_path(self, date):
+        return os.path.join(self.path, "{}.rle".format(date.replace("/", "-")))
+
+    def _intern(self, name):
+        app_id = self.app_ids.get(name)
+
+        if app_id is None:
+            with open(self.apps_path, 'a', encoding='utf-8') as fp:
+                fp.write("{}\n".format(name))
+            app_id = self.app_ids[name] = len(self.apps)
+            self.apps.append(name)
+
+        return app_id
+
+    def day(self, date):
+        """
+        Get timeline of a day, reading it from disk on first access.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: DayTimeline.
+        """
+        timeline = self.days.get(date)
+
+        if timeline is not None:
+            self.days.move_to_end(date)
+            return timeline
+
+        if os.path.exists(self._day_path(date)):
+            with open(self._day_path(date), 'rb') as fp:
+                timeline = DayTimeline.from_file(fp)
+        else:
+            timeline = DayTimeline()
+
+        self.days[date] = timeline
+        for cached in list(self.days):
+            if len(self.days) <= self.cache_size:
+                break
+            if cached not in self.dirty:
+                del self.days[cached]
+
+        return timeline
+
+    def add(self, date, second, app, active, seconds=1):
+        """
+        Add sample of foreground application.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param second: seconds since midnight when sample was taken.
+        :param app: application name (None if it wasn't detected).
+        :param active: True if user was active.
+        :param seconds: length of sample window.
+        :return: None.
+        """
+        if self.day(date).append(second, self._intern(app or ""), active, seconds):
+            self.dirty.add(date)
+
+    def query(self, date, start="00:00", end="24:00"):
+        """
+        Get segments of foreground applications in range of a day.
+
+        :param date: day in '%Y/%m/%d' format.
+        :param start: seconds since midnight or '%H:%M[:%S]' time.
+        :param end: seconds since midnight or '%H:%M[:%S]' time.
+        :return: list of (start, end, application name, active) tuples, times in seconds since midnight.
+        """
+        return [(segment_start, segment_end, self.apps[app_id], active) for segment_start, segment_end, app_id, active
+                in self.day(date).query(parse_time(start), parse_time(end))]
+
+    def usage(self, date, start="00:00", end="24:00"):
+        """
+        Sum seconds of applications in range of a day, e.g. which application was used between 14:00 and 15:00.
+
+        :return: list of (application name, active seconds, inactive seconds) tuples, most active first.
+        """
+        usage = {}
+
+        for segment_start, segment_end, app, active in self.query(date, start, end):
+            times = usage.setdefault(app, [0, 0])
+            times[0 if active else 1] += segment_end - segment_start
+
+        return sorted(((app, times[0], times[1]) for app, times in usage.items()), key=lambda item: (-item[1], item[0]))
+
+    def hours(self, date):
+        """
+        Get most active application of every hour of a day.
+
+        :param date: day in '%Y/%m/%d' format.
+        :return: list of (hour, application name, active seconds) tuples of hours with activity.
+        """
+        hours = []
+
+        for hour in range(24):
+            usage = self.usage(date, hour * 3600, (hour + 1) * 3600)
+            if usage and usage[0][1]:
+                hours.append((hour, usage[0][0], usage[0][1]))
+
+        return hours
+
+    def release(self, date):
+        if date not in self.dirty:
+            self.days.pop(date, None)
+
+    def save(self):
+        """
+        Save days changed since last save.
+
+        :return: number of bytes written.
+        """
+        written = 0
+
+        for date in list(self.dirty):
+            content = self.days[date].to_bytes()
+            JsonHelpers.write_atomic(self._day_path(date), lambda fp: fp.write(content), mode='wb')
+            self.dirty.discard(date)
+            written += len(content)
+
+        return written
+
+    def stats(self):
+        return {
+            "loaded_days": len(self.days),
+            "segments": sum(len(timeline) for timeline in self.days.values()),
+            "apps": len(self.apps)
+        }
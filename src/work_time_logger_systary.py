@@ -1,577 +1,884 @@
-import sys
-import signal
-import datetime
-import os
-import json
-import subprocess
-import psutil
-import win32process
-
-from win32gui import GetForegroundWindow
-from pynput import keyboard, mouse
-from PySide2.QtGui import QIcon, QFont
-from PySide2.QtWidgets import QSystemTrayIcon, QMenu, QApplication, QAction, QMessageBox, QErrorMessage
-from PySide2.QtCore import QRunnable, QTimer
-
-TXT_EDITOR = "notepad.exe"
-TRAY_TOOLTIP = 'Work time logger\n{}'
-STOP_MODE = False
-MSG_BOX_SHOWED = False
-TRAY_ICON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon.png')
-FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log.json")
-OVERTIMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "overtimes.json")
-ACTIVITY_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_logs.json")
-PROGRAM_NAME = "Work Time Logger"
-VERSION = "ver. 0.0.1"
-
-
-class MessageBox:
-    @staticmethod
-    def show(text, title="Info", icon=QMessageBox.Information, detailed_text="", informative_text="", buttons=""):
-        msg = QMessageBox()
-
-        msg.setText(text)
-        msg.setWindowTitle(title)
-        msg.setIcon(icon)
-        msg.setFont(QFont('Consolas', 9))
-
-        if detailed_text:
-            msg.setDetailedText(detailed_text)
-
-        if informative_text:
-            msg.setInformativeText(informative_text)
-
-        if buttons:
-            msg.setStandardButtons(QMessageBox.Ok)
-
-        msg.exec_()
-
-
-class JsonHelpers:
-    @staticmethod
-    def read_file(file_path):
-        """
-        Read content from specific json file.
-        :param json_path: path to json file.
-        :return: loaded json content or empty dict.
-        """
-        try:
-            with open(file_path, 'r') as fp:
-                return json.load(fp)
-        except Exception as exc:
-            MessageBox.show(
-                text=str(exc),
-                title="Error",
-                icon=QMessageBox.Critical,
-                detailed_text=str(type(exc))
-            )
-            if (exc.__class__ == IOError):
-                JsonHelpers.write_file(file_path, {})
-            else:
-                MessageBox.show(
-                    text="Work Time Logger will open incorrect file.\nPlease validate data, make necessary changes, save and start application again.",
-                    title="Error",
-                    icon=QMessageBox.Critical
-                )
-                try:
-                    subprocess.run([TXT_EDITOR, file_path])
-                except Exception as exc:
-                    MessageBox.show(
-                        text=str(exc),
-                        title="Error",
-                        icon=QMessageBox.Critical,
-                        detailed_text=str(type(exc))
-                    )
-                
-                sys.exit(1)
-            return {}
-
-    @staticmethod
-    def write_file(file_path, data):
-        """
-        Write specific data into json file.
-
-        :param file_path: path to file where data will be written.
-        :param data: data to write into file
-        :return: None.
-        """
-        try:
-            with open(file_path, 'w') as fp:
-                json.dump(data, fp, indent=3)
-        except Exception as exc:
-            MessageBox.show(
-                text=str(exc),
-                title="Error",
-                icon=QMessageBox.Critical,
-                detailed_text=str(type(exc))
-            )
-
-
-class ActivityLogger:
-    def __init__(self):
-        now = datetime.datetime.now()
-        self.now_date = str(now.strftime("%Y/%m/%d"))
-        self.keyboard_listener = self._set_keyboard_listener()
-        self.keyboard_listener.start()
-
-        self.mouse_listener = self._set_mouse_listener()
-        self.mouse_listener.start()
-
-        self.process_time = JsonHelpers.read_file(ACTIVITY_LOG_PATH)
-        self.activity_detected = False
-
-        self.counter = 0
-
-    def _set_keyboard_listener(self):
-        listener = keyboard.Listener(
-            on_press=self._set_activity,
-            on_release=self._set_activity
-        )
-
-        return listener
-
-    def _set_mouse_listener(self):
-        listener = mouse.Listener(
-            on_move=self._set_activity,
-            on_click=self._set_activity,
-            on_scroll=self._set_activity
-        )
-
-        return listener
-
-    def _set_activity(self, *args, **kwargs):
-        self.activity_detected = True
-
-    def _detect_current_application(self):
-        try:
-            now = datetime.datetime.now()
-            self.now_date = str(now.strftime("%Y/%m/%d"))
-            current_app = psutil.Process(
-                win32process.GetWindowThreadProcessId(GetForegroundWindow())[1]).name().replace(
-                ".exe", "")
-
-            if self.now_date not in self.process_time.keys():
-                self.process_time[self.now_date] = {}
-
-            if current_app not in self.process_time[self.now_date].keys():
-                self.process_time[self.now_date][current_app] = {"active": 0, "inactive": 0}
-
-            if self.activity_detected:
-                self.process_time[self.now_date][current_app]["active"] = \
-                    self.process_time[self.now_date][current_app]["active"] + 1
-            else:
-                self.process_time[self.now_date][current_app]["inactive"] = \
-                    self.process_time[self.now_date][current_app]["inactive"] + 1
-        except Exception as exc:
-            if (exc.__class__ != psutil.NoSuchProcess) and ("pid" not in str(exc)):
-                MessageBox.show(
-                    text=str(exc),
-                    title="Error",
-                    icon=QMessageBox.Critical,
-                    detailed_text=str(type(exc))
-                )
-
-        self._calculate_summary_time()
-
-        self.activity_detected = False
-
-    def _calculate_summary_time(self):
-        summary = {"active": 0, "inactive": 0}
-
-        self.process_time[self.now_date].pop("Summary", None)
-
-        for time in self.process_time[self.now_date].values():
-            summary["active"] += time["active"]
-            summary["inactive"] += time["inactive"]
-
-        self.process_time[self.now_date]["Summary"] = summary
-
-    def show_activity(self):
-        msg = "Application usage:\n"
-        self._calculate_summary_time()
-        data = self.process_time[self.now_date]
-
-        sorted_keys = sorted(data, key=lambda x: (data[x]['active']), reverse=True)
-
-        for key in sorted_keys:
-            converted_active = str(datetime.timedelta(seconds=data[key]["active"]))
-            converted_inactive = str(datetime.timedelta(seconds=data[key]["inactive"]))
-            if key != "Summary":
-                msg = "{}\n{:<20}\tactive: {:<6}\tinactive: {}".format(msg, key, converted_active, converted_inactive)
-
-        converted_active = str(datetime.timedelta(seconds=data["Summary"]["active"]))
-        converted_inactive = str(datetime.timedelta(seconds=data["Summary"]["inactive"]))
-        msg = "{}\n\n{:<20}\tactive: {:<6}\tinactive: {}".format(msg, "Summary", converted_active, converted_inactive)
-
-        MessageBox.show(text=msg)
-        JsonHelpers.write_file(ACTIVITY_LOG_PATH, self.process_time)
-
-    def run(self):
-        self.counter = 0
-
-        self._detect_current_application()
-        self.counter += 1
-
-        if not self.counter % 60:
-            JsonHelpers.write_file(ACTIVITY_LOG_PATH, self.process_time)
-            self.counter = 0
-
-
-class Time:
-    def __init__(self):
-        self.reference_time = datetime.timedelta(minutes=0, hours=8)
-        self.now_date = ""
-        self.time_left = ""
-        self.is_overtime = False
-        self.working_time = JsonHelpers.read_file(FILE_PATH)
-        self.overtimes = JsonHelpers.read_file(OVERTIMES_PATH)
-
-    def log_time(self, first_run=False, msg_box=True, exit=False):
-        now = datetime.datetime.now()
-        self.now_date = str(now.strftime("%Y/%m/%d"))
-        now_time = str(now.strftime("%H:%M:%S"))
-
-        self._write_time_to_file(now_time, first_run, exit)
-
-        msg = "Logged time:\n\n{} {}".format(self.now_date, now_time)
-
-        if msg_box:
-            MessageBox.show(text=msg)
-
-    def _check_date_exist(self, data):
-        if self.now_date in data.keys():
-            return True
-
-        return False
-
-    def _write_time_to_file(self, now_time, first_run, exit):
-        self.log_label = "Log break"
-
-        if self._check_date_exist(self.working_time):
-            if self.working_time[self.now_date]:
-                if self.working_time[self.now_date][-1]["END"]:
-                    if not exit:
-                        self.working_time[self.now_date].append({"START": now_time, "END": ""})
-                else:
-                    if not first_run:
-                        self.working_time[self.now_date][-1]["END"] = now_time
-                        self.log_label = "Log work"
-            else:
-                self.working_time[self.now_date] = list()
-                self.working_time[self.now_date].append({"START": now_time, "END": ""})
-        else:
-            self.working_time[self.now_date] = list()
-            self.working_time[self.now_date].append({"START": now_time, "END": ""})
-
-        JsonHelpers.write_file(FILE_PATH, self.working_time)
-
-    def get_today_logs(self):
-        msg = "Not logged any time!"
-
-        date_exists = self._check_date_exist(self.working_time)
-
-        if date_exists:
-            msg = ""
-            for elements in self.working_time[self.now_date]:
-                for element_name, element_value in elements.items():
-                    msg = "{}{}:{}\n".format(msg, element_name, element_value)
-
-        MessageBox.show(text=msg)
-
-    def show_working_time(self, silent_mode=False):
-        working_time = self._calculate_working_time()
-        msg = "Today:\n\n{:<20} {}\n".format("Working time:", working_time)
-        self.is_overtime = False
-
-        delta = self._calculate_time_left(working_time, self.reference_time)
-        end_time = datetime.datetime.now() + delta
-
-        end_time = end_time.strftime("%H:%M:%S")
-
-        if working_time > self.reference_time:
-            delta = working_time - self.reference_time
-            self.is_overtime = True
-
-        if working_time:
-            if not self.is_overtime:
-                msg = "{}{:<20} {}\n{:<20} {}\n".format(msg, "Time left:", delta, "Estimated end work:", end_time)
-                self.time_left = "Time left: {}".format(delta)
-            elif self.is_overtime:
-                msg = "{}{:<20} {}".format(msg, "Overtimes:", delta)
-                self.time_left = "Overtimes: {}".format(delta)
-
-        month_working_time = self._calculate_summary_working_time()
-        msg = "{}\nCurrent month:\n\n{:<20} {}\n".format(msg, "Working time:", month_working_time)
-
-        if not silent_mode:
-            MessageBox.show(text=msg)
-
-    def _calculate_summary_working_time(self):
-        now = datetime.datetime.now()
-        month = "{}/".format(now.strftime("%Y/%m"))
-        working_time = datetime.timedelta()
-
-        current_month_days = [day for day in self.working_time.keys() if month in day]
-
-        for day in current_month_days:
-            for elements in self.working_time[day]:
-                if elements["END"]:
-                    end = datetime.datetime.strptime(elements["END"], '%H:%M:%S')
-                    start = datetime.datetime.strptime(elements["START"], '%H:%M:%S')
-                    delta = end - start
-                else:
-                    now = datetime.datetime.now().strftime("%H:%M:%S")
-                    current_time = datetime.datetime.strptime(now, '%H:%M:%S')
-                    start = datetime.datetime.strptime(elements["START"], '%H:%M:%S')
-                    delta = current_time - start
-
-                working_time += delta
-
-        working_time = self._convert_timedelta(working_time)
-
-        return working_time
-
-    def _convert_timedelta(self, duration):
-        days, seconds = duration.days, duration.seconds
-        hours = days * 24 + seconds // 3600
-        minutes = (seconds % 3600) // 60
-        seconds = (seconds % 60)
-
-        return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
-
-    def _calculate_time_left(self, working_time=None, reference_time=None):
-        if not (working_time and reference_time):
-            working_time = self._calculate_working_time()
-            reference_time = datetime.timedelta(minutes=0, hours=8)
-
-        to_go = reference_time - working_time
-
-        return to_go
-
-    def _calculate_working_time(self):
-        working_time = datetime.timedelta()
-
-        if self._check_date_exist(self.working_time):
-            for elements in self.working_time[self.now_date]:
-                if elements["END"]:
-                    end = datetime.datetime.strptime(elements["END"], '%H:%M:%S')
-                    start = datetime.datetime.strptime(elements["START"], '%H:%M:%S')
-                    delta = end - start
-                else:
-                    now = datetime.datetime.now().strftime("%H:%M:%S")
-                    current_time = datetime.datetime.strptime(now, '%H:%M:%S')
-                    start = datetime.datetime.strptime(elements["START"], '%H:%M:%S')
-                    delta = current_time - start
-
-                working_time += delta
-        else:
-            msg = "Not found start time in current day."
-            MessageBox.show(text=msg)
-            global MSG_BOX_SHOWED
-            MSG_BOX_SHOWED = False
-            self.log_time(msg_box=False)
-
-        return working_time
-
-    def show_overtimes(self):
-        now = datetime.datetime.now()
-        month = str(now.strftime("%Y/%m"))
-        msg = ""
-
-        for date in self.overtimes.keys():
-            if month in date:
-                msg = "{}{}: {}\n".format(msg, date, self.overtimes[date])
-
-        if msg:
-            msg = "Overtimes in: '{}'\n\n{}".format(month, msg)
-        else:
-            msg = "No overtimes in current month."
-
-        MessageBox.show(text=msg)
-
-    def _edit_times(self, file_path):
-        try:
-            subprocess.run([TXT_EDITOR, file_path])
-        except Exception as exc:
-            MessageBox.show(
-                text=str(exc),
-                title="Error",
-                icon=QMessageBox.Critical,
-                detailed_text=str(type(exc))
-            )
-
-        self.working_time = JsonHelpers.read_file(file_path)
-        self.show_working_time(silent_mode=True)
-
-    def edit_logs(self):
-        self._edit_times(FILE_PATH)
-
-    def edit_overtimes(self):
-        self._edit_times(OVERTIMES_PATH)
-
-
-class App:
-    def __init__(self):
-        self.app = QApplication([])
-        self.app.setQuitOnLastWindowClosed(False)
-
-        self.time = Time()
-        self.time.log_time(msg_box=False, first_run=True)
-
-        self.activity = ActivityLogger()
-
-        self.tray = self._prepare_tray_menu()
-        self._update_tooltip_text()
-        self.tray.show()
-
-        self.overtime_timer = self._prepare_overtime_check_timer()
-        self.overtime_timer.start()
-
-        self.activity_timer = self._prepare_activity_logger_timer()
-        self.activity_timer.start()
-
-    def _prepare_tray_menu(self):
-        tray = QSystemTrayIcon(QIcon("icon.png"), self.app)
-        menu = QMenu()
-
-        menu = self._set_tray_menu_item(menu, "Log break", self._log_time)
-        menu = self._set_tray_menu_item(menu, "Working time", self._show_working_time)
-
-        menu.addSeparator()
-
-        menu = self._set_tray_menu_item(menu, "Show logs", self._get_today_log)
-        menu = self._set_tray_menu_item(menu, "Show overtimes", self._show_overtimes)
-        menu = self._set_tray_menu_item(menu, "Show activity", self._show_activity)
-
-        menu.addSeparator()
-
-        menu = self._set_tray_menu_item(menu, "Edit logs", self._edit_logs)
-        menu = self._set_tray_menu_item(menu, "Edit overtimes", self._edit_overtimes)
-
-        menu.addSeparator()
-
-        menu = self._set_tray_menu_item(menu, "About", self._show_about_message)
-        menu = self._set_tray_menu_item(menu, "Exit", self.app.exit)
-
-        tray.setContextMenu(menu)
-        tray.setToolTip("Work time logger")
-
-        return tray
-
-    def _prepare_overtime_check_timer(self):
-        self._check_overtime()
-
-        timer = QTimer()
-        timer.setInterval(60 * 1000)
-        timer.timeout.connect(self._check_overtime)
-
-        return timer
-
-    def _prepare_activity_logger_timer(self):
-        timer = QTimer()
-        timer.setInterval(1 * 1000)
-        timer.timeout.connect(self._check_activity)
-
-        return timer
-
-    def _log_time(self, first_run=False):
-        self.time.log_time(first_run=first_run)
-        self._update_tooltip_text()
-        self._change_log_work_break()
-
-    def _get_today_log(self):
-        self.time.get_today_logs()
-        self._update_tooltip_text()
-
-    def _show_working_time(self):
-        self.time.show_working_time()
-        self._update_tooltip_text()
-
-    def _show_overtimes(self):
-        self.time.show_overtimes()
-        self._update_tooltip_text()
-
-    def _show_activity(self):
-        self.activity.show_activity()
-
-    def _edit_logs(self):
-        self.time.edit_logs()
-        self._update_tooltip_text()
-
-    def _edit_overtimes(self):
-        self.time.edit_overtimes()
-        self._update_tooltip_text()
-
-    def _update_tooltip_text(self):
-        self.time.show_working_time(silent_mode=True)
-        self.tray.setToolTip(TRAY_TOOLTIP.format(self.time.time_left))
-
-    def _set_tray_menu_item(self, menu, name, method):
-        menu_item = menu.addAction(name)
-        menu_item.triggered.connect(method)
-
-        return menu
-
-    def _change_log_work_break(self):
-        for action in self.tray.contextMenu().actions():
-            if action.text() == "Log break":
-                action.setText("Log work")
-
-                return True
-            elif action.text() == "Log work":
-                action.setText("Log break")
-
-                return True
-
-        return False
-
-    def _show_tray_message(self, title, text):
-        self.tray.showMessage(title, text)
-
-    def _not_implemented_yet_msg(self):
-        MessageBox.show(text="Not implemented yet!", title="ERROR", icon=QMessageBox.Critical)
-
-    def _show_about_message(self):
-        msg = "{} {}".format(PROGRAM_NAME, VERSION)
-        MessageBox.show(text=msg, title="About")
-
-    def run(self):
-        self._show_tray_message("Work Time Logger", "Application started.")
-        status = self.app.exec_()
-        self.time.log_time(exit=True)
-
-        sys.exit(status)
-
-    def _check_overtime(self):
-        global MSG_BOX_SHOWED
-        working_time = self.time._calculate_working_time()
-
-        if working_time > self.time.reference_time:
-            if not MSG_BOX_SHOWED:
-                msg = "It's time to end your work.\n\n{}".format(working_time)
-                MessageBox.show(text=msg)
-                MSG_BOX_SHOWED = True
-            overtimes = working_time - self.time.reference_time
-
-            self._save_overtimes(overtimes)
-        self._update_tooltip_text()
-
-    def _check_activity(self):
-        self.activity.run()
-
-    def _save_overtimes(self, overtimes):
-        now = datetime.datetime.now()
-        now_date = str(now.strftime("%Y/%m/%d"))
-
-        self.time.overtimes[now_date] = str(overtimes)
-        JsonHelpers.write_file(OVERTIMES_PATH, self.time.overtimes)
-
-        self.time.working_time[now_date][-1]["END"] = str(datetime.datetime.now().strftime("%H:%M:%S"))
-        JsonHelpers.write_file(FILE_PATH, self.time.working_time)
-
-
-if __name__ == '__main__':
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-
-    app = App()
-    app.run()
+import sys
+import signal
+import datetime
+import os
+import queue
+import zlib
+import socket
+import subprocess
+import psutil
+import win32api
+import win32process
+
+from win32gui import GetForegroundWindow
+from pynput import keyboard, mouse
+from PySide2.QtGui import QIcon, QFont
+from PySide2.QtWidgets import QSystemTrayIcon, QMenu, QApplication, QAction, QMessageBox, QErrorMessage, QInputDialog
+from PySide2.QtCore import QRunnable, QTimer, QProcess, QSocketNotifier, QThreadPool, QObject, Signal
+from PySide2.QtNetwork import QLocalServer, QLocalSocket
+
+import work_time_core
+
+from work_time_core import WriteBehindScheduler, DeadlineScheduler, InputSampler, ForegroundSampler, ActivityTracker, \
+    WorkTime, Notifier, FileLock, VersionStamp, parse_range, METRICS
+from work_time_core.notifications import INFO, WARNING, ERROR
+
+TXT_EDITOR = "notepad.exe"
+TRAY_TOOLTIP = 'Work time logger\n{}'
+STOP_MODE = False
+MSG_BOX_SHOWED = False
+TRAY_ICON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon.png')
+FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log.json")
+OVERTIMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "overtimes.json")
+ACTIVITY_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_logs.json")
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal.log")
+ACTIVITY_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity")
+INPUT_SAMPLER = "last_input"
+# Set to database file path (e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "work_time.db")) to keep
+# logs, overtimes and activity in SQLite database instead of json files.
+DATABASE_PATH = None
+# Set to aggregation server address ("host:port" or Unix socket path) to send logged time and activity to it.
+AGGREGATION_SERVER = None
+AGGREGATION_USER = os.environ.get("USERNAME", os.environ.get("USER", "user"))
+# Metrics (metrics.json, metrics.prom) and profiles are saved into this directory. Profiling can be started at
+# startup by setting WORK_TIME_PROFILE environment variable (e.g. WORK_TIME_PROFILE=1) or from tray menu.
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics")
+PROFILE_ENV = "WORK_TIME_PROFILE"
+# Notifications of timers are shown as tray balloons, one per this time at most.
+BALLOON_SECONDS = 5
+# Only one instance logs time into data files, next launch (e.g. 'work_time_logger_systary.py working-time')
+# forwards its command to the running instance and exits.
+INSTANCE_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "work_time_logger.lock")
+INSTANCE_SERVER = "work_time_logger_{}".format(zlib.crc32(os.path.dirname(os.path.abspath(__file__)).encode()))
+INSTANCE_TIMEOUT_MS = 1000
+COMMANDS = ("show", "log", "working-time", "logs", "overtimes", "activity", "history", "edit-logs", "edit-overtimes",
+            "about", "exit")
+PROGRAM_NAME = "Work Time Logger"
+VERSION = "ver. 0.0.1"
+NOTIFIER = Notifier(min_interval=BALLOON_SECONDS)
+
+
+class MessageBox:
+    # Non-modal message boxes are referenced until they're closed.
+    opened = []
+
+    @staticmethod
+    def show(text, title="Info", icon=QMessageBox.Information, detailed_text="", informative_text="", buttons="",
+             modal=False):
+        msg = QMessageBox()
+
+        msg.setText(text)
+        msg.setWindowTitle(title)
+        msg.setIcon(icon)
+        msg.setFont(QFont('Consolas', 9))
+
+        if detailed_text:
+            msg.setDetailedText(detailed_text)
+
+        if informative_text:
+            msg.setInformativeText(informative_text)
+
+        if buttons:
+            msg.setStandardButtons(QMessageBox.Ok)
+
+        if modal:
+            msg.exec_()
+        else:
+            # Event loop (and timers) keeps running while message is shown.
+            MessageBox.opened.append(msg)
+            msg.finished.connect(lambda result: MessageBox.opened.remove(msg))
+            msg.show()
+
+
+class TraySink:
+    """
+    Notifications sink showing non-modal tray balloons, details of the last one are shown when it's clicked.
+    """
+    ICONS = {INFO: QSystemTrayIcon.Information, WARNING: QSystemTrayIcon.Warning, ERROR: QSystemTrayIcon.Critical}
+
+    def __init__(self, tray):
+        self.tray = tray
+        self.last = None
+        self.tray.messageClicked.connect(self.show_details)
+
+    def __call__(self, notification):
+        text = notification.text
+        if notification.repeats:
+            text = "{}\n\n(repeated {} time(s))".format(text, notification.repeats)
+
+        self.last = notification
+        self.tray.showMessage(notification.title, text, self.ICONS[notification.level], BALLOON_SECONDS * 1000)
+
+    def show_details(self):
+        if self.last is None:
+            return
+
+        MessageBox.show(
+            text=self.last.text,
+            title=self.last.title,
+            icon=QMessageBox.Critical if self.last.level == ERROR else QMessageBox.Information,
+            detailed_text=self.last.detailed_text
+        )
+
+
+class JsonHelpers(work_time_core.JsonHelpers):
+    @staticmethod
+    def read_file(file_path, validate=None, materialize=None):
+        """
+        Read days from specific json file. Incorrect days are skipped and moved into quarantine file.
+        :param json_path: path to json file.
+        :param validate: callable raising ValueError for incorrect day.
+        :param materialize: predicate of days which should be parsed eagerly.
+        :return: loaded days or empty dict.
+        """
+        try:
+            days = JsonHelpers.load(file_path, validate, materialize)
+        except Exception as exc:
+            if (exc.__class__ == IOError):
+                NOTIFIER.error(exc)
+                JsonHelpers.write_file(file_path, {})
+            else:
+                # Application exits, so messages are shown right away.
+                MessageBox.show(
+                    text=str(exc),
+                    title="Error",
+                    icon=QMessageBox.Critical,
+                    detailed_text=str(type(exc)),
+                    modal=True
+                )
+                MessageBox.show(
+                    text="Work Time Logger will open incorrect file.\nPlease validate data, make necessary changes, save and start application again.",
+                    title="Error",
+                    icon=QMessageBox.Critical,
+                    modal=True
+                )
+                try:
+                    subprocess.run([TXT_EDITOR, file_path])
+                except Exception as exc:
+                    MessageBox.show(
+                        text=str(exc),
+                        title="Error",
+                        icon=QMessageBox.Critical,
+                        detailed_text=str(type(exc)),
+                        modal=True
+                    )
+                
+                sys.exit(1)
+            return {}
+
+        if days.stats.get("corrupt"):
+            NOTIFIER.warning(
+                text="{} incorrect day(s) skipped in {}.".format(days.stats["corrupt"], file_path),
+                detailed_text="Skipped days were saved into {}.quarantine".format(file_path)
+            )
+
+        return days
+
+    @staticmethod
+    def write_file(file_path, data):
+        """
+        Write specific data into json file.
+
+        :param file_path: path to file where data will be written.
+        :param data: data to write into file
+        :return: None.
+        """
+        try:
+            JsonHelpers.dump_atomic(file_path, data)
+        except Exception as exc:
+            NOTIFIER.error(exc)
+
+
+class LastInputSampler(InputSampler):
+    """
+    Polls system last input time, so input events never call back into Python.
+    """
+    def __init__(self):
+        super().__init__()
+        self.last_input = win32api.GetLastInputInfo()
+
+    def _detect(self):
+        last_input = win32api.GetLastInputInfo()
+        active = last_input != self.last_input
+        self.last_input = last_input
+
+        return active
+
+
+class ListenerSampler(InputSampler):
+    """
+    Uses pynput listeners. Mouse listener unsubscribes after first event in sampling window and is re-armed on
+    next sample, so mouse moves don't call back into Python hundreds of times per second.
+    """
+    def __init__(self):
+        super().__init__()
+        self.hit = False
+        self.keyboard_listener = None
+        self.mouse_listener = None
+
+    def start(self):
+        self.keyboard_listener = keyboard.Listener(
+            on_press=self._on_keyboard,
+            on_release=self._on_keyboard
+        )
+        self.keyboard_listener.start()
+        self._arm_mouse()
+
+    def stop(self):
+        for listener in (self.keyboard_listener, self.mouse_listener):
+            if listener:
+                listener.stop()
+
+    def _arm_mouse(self):
+        self.mouse_listener = mouse.Listener(
+            on_move=self._on_mouse,
+            on_click=self._on_mouse,
+            on_scroll=self._on_mouse
+        )
+        self.mouse_listener.start()
+
+    def _hit(self):
+        self.callbacks += 1
+        self.hit = True
+
+    def _on_keyboard(self, *args, **kwargs):
+        self._hit()
+
+    def _on_mouse(self, *args, **kwargs):
+        self._hit()
+
+        # Returning False stops listener until next sampling window.
+        return False
+
+    def _detect(self):
+        active = self.hit
+        self.hit = False
+
+        if self.mouse_listener and not self.mouse_listener.running:
+            self._arm_mouse()
+
+        return active
+
+
+class Win32WindowSource:
+    """
+    Foreground window process taken from win32 API and psutil.
+    """
+    def foreground_pid(self):
+        return win32process.GetWindowThreadProcessId(GetForegroundWindow())[1]
+
+    def create_time(self, pid):
+        return psutil.Process(pid).create_time()
+
+    def name(self, pid):
+        return psutil.Process(pid).name().replace(".exe", "")
+
+
+class ActivityLogger(ActivityTracker):
+    def __init__(self, scheduler=None, source=None):
+        super().__init__(ACTIVITY_STORE_PATH, ACTIVITY_LOG_PATH, scheduler, JsonHelpers.read_file, DATABASE_PATH)
+
+        self.input = self._create_input_sampler()
+        self.input.start()
+
+        self.sampler = ForegroundSampler(source or Win32WindowSource(), self.input)
+        self.sampler.start()
+
+    def _create_input_sampler(self):
+        if INPUT_SAMPLER == "last_input":
+            return LastInputSampler()
+
+        return ListenerSampler()
+
+    def _record_samples(self):
+        while True:
+            try:
+                sample = self.sampler.samples.get_nowait()
+            except queue.Empty:
+                break
+
+            self._record_sample(*sample)
+
+    def _record_sample(self, today, current_app, active, seconds, error, second=None):
+        try:
+            if error:
+                raise error
+
+            self.record(today, current_app, active, seconds, second)
+        except Exception as exc:
+            if (exc.__class__ != psutil.NoSuchProcess) and ("pid" not in str(exc)):
+                NOTIFIER.error(exc)
+
+    def show_activity(self):
+        self._record_samples()
+        MessageBox.show(text=self.activity_message())
+
+    def stop(self):
+        self.sampler.stop()
+        self.input.stop()
+        self._record_samples()
+
+    def run(self):
+        self._record_samples()
+
+
+class Time(WorkTime):
+    def __init__(self, scheduler=None):
+        super().__init__(FILE_PATH, OVERTIMES_PATH, JOURNAL_PATH, scheduler, JsonHelpers.read_file, DATABASE_PATH)
+        self.edit_processes = []
+
+    def log_time(self, first_run=False, msg_box=True, exit=False):
+        now_time = super().log_time(first_run, exit)
+
+        msg = "Logged time:\n\n{} {}".format(self.now_date, now_time)
+
+        if msg_box:
+            MessageBox.show(text=msg)
+
+    def report_storage_error(self):
+        exc = self.storage.pop_error()
+        if exc:
+            NOTIFIER.error(exc)
+
+    def get_today_logs(self):
+        MessageBox.show(text=self.today_logs_message())
+
+    def show_working_time(self, silent_mode=False):
+        msg = self.working_time_message()
+
+        if not silent_mode:
+            MessageBox.show(text=msg)
+
+    def _missing_start(self):
+        msg = "Not found start time in current day."
+        NOTIFIER.info(msg)
+        global MSG_BOX_SHOWED
+        MSG_BOX_SHOWED = False
+        self.log_time(msg_box=False)
+
+    def show_overtimes(self):
+        MessageBox.show(text=self.overtimes_message())
+
+    def _edit_times(self, kind, on_finished=None):
+        """
+        Open days of selected range in text editor without blocking the application, changed days are applied
+        when editor exits.
+
+        :param kind: 'logs' or 'overtimes'.
+        :param on_finished: callable called after changes are applied.
+        :return: None.
+        """
+        month = datetime.date.today().strftime("%Y/%m")
+        text, ok = QInputDialog.getText(
+            None,
+            PROGRAM_NAME,
+            "Edit {} of day, month or range (e.g. {}/01-{}):".format(kind, month, month),
+            text=month
+        )
+        if not ok:
+            return
+
+        try:
+            session = self.begin_edit(kind, *parse_range(text))
+        except Exception as exc:
+            MessageBox.show(
+                text=str(exc),
+                title="Error",
+                icon=QMessageBox.Critical,
+                detailed_text=str(type(exc))
+            )
+            return
+
+        process = QProcess()
+        process.finished.connect(lambda *args: self._edit_finished(process, session, on_finished))
+        process.errorOccurred.connect(lambda error: self._edit_failed(process, session, error))
+        self.edit_processes.append(process)
+        process.start(TXT_EDITOR, [session.path])
+
+    def _edit_finished(self, process, session, on_finished):
+        self.edit_processes.remove(process)
+
+        try:
+            count, errors = self.apply_edit(session)
+        except Exception as exc:
+            MessageBox.show(
+                text=str(exc),
+                title="Error",
+                icon=QMessageBox.Critical,
+                detailed_text=str(type(exc))
+            )
+            return
+
+        if errors:
+            MessageBox.show(
+                text="Edited {} weren't saved, {} incorrect line(s) found.".format(session.kind, len(errors)),
+                title="Error",
+                icon=QMessageBox.Critical,
+                detailed_text="\n".join(errors)
+            )
+
+        self.show_working_time(silent_mode=True)
+        if on_finished:
+            on_finished()
+
+    def _edit_failed(self, process, session, error):
+        if error != QProcess.FailedToStart:
+            return
+
+        self.edit_processes.remove(process)
+        session.close()
+        MessageBox.show(
+            text="Couldn't start {}.".format(TXT_EDITOR),
+            title="Error",
+            icon=QMessageBox.Critical,
+            detailed_text=process.errorString()
+        )
+
+    def edit_logs(self, on_finished=None):
+        self._edit_times("logs", on_finished)
+
+    def edit_overtimes(self, on_finished=None):
+        self._edit_times("overtimes", on_finished)
+
+
+class HistorySignals(QObject):
+    finished = Signal(str)
+    failed = Signal(object)
+
+
+class HistoryTask(QRunnable):
+    """
+    Computes history summary on thread pool, so tray menu doesn't freeze on long histories. History is read
+    from files (and database) like reports do, objects used by GUI thread aren't touched.
+    """
+    def __init__(self):
+        super().__init__()
+        self.signals = HistorySignals()
+
+    def run(self):
+        try:
+            from work_time_core.analytics import load_user
+
+            message = load_user(os.path.dirname(FILE_PATH), DATABASE_PATH).history_message()
+        except Exception as exc:
+            self.signals.failed.emit(exc)
+        else:
+            self.signals.finished.emit(message)
+
+
+class App:
+    def __init__(self, command="show"):
+        if os.environ.get(PROFILE_ENV):
+            METRICS.start_profiling()
+
+        self.app = QApplication([])
+        self.app.setQuitOnLastWindowClosed(False)
+
+        self.command = command
+        self.instance_lock = FileLock(INSTANCE_LOCK_PATH)
+        if not self.instance_lock.acquire(blocking=False):
+            self._forward_command(command)
+
+        self.scheduler = WriteBehindScheduler()
+
+        self.time = Time(self.scheduler)
+        self.time.log_time(msg_box=False, first_run=True)
+
+        self.activity = ActivityLogger(self.scheduler)
+        self.deadlines = DeadlineScheduler(self.time, self.scheduler, self.activity.sampler)
+        self.client = self._prepare_aggregation_client()
+        self._prepare_metrics()
+        self._prepare_signal_handlers()
+
+        self.tray = self._prepare_tray_menu()
+        self.tray.show()
+        self.notification_timer = self._prepare_notifications()
+        self.history_task = None
+        self.instance_server = self._prepare_instance_server()
+
+        self.deadline_timer = self._prepare_deadline_timer()
+        self._check_overtime()
+        self._schedule()
+
+    def _prepare_aggregation_client(self):
+        if not AGGREGATION_SERVER:
+            return None
+
+        from work_time_core import AggregationClient
+
+        client = AggregationClient(AGGREGATION_SERVER, AGGREGATION_USER)
+        self.time.publisher = client
+        self.activity.publisher = client
+        client.start()
+
+        # Intervals logged before client was started.
+        for index in range(len(self.time.working_time.get(self.time.now_date) or [])):
+            self.time._publish(self.time.now_date, index)
+
+        return client
+
+    def _prepare_metrics(self):
+        METRICS.register_source("scheduler", self.scheduler.stats)
+        METRICS.register_source("deadlines", self.deadlines.stats)
+        METRICS.register_source("time", self.time.stats)
+        METRICS.register_source("activity", self.activity.stats)
+        METRICS.register_source("sampler", self.activity.sampler.stats)
+        METRICS.register_source("notifications", NOTIFIER.stats)
+        METRICS.register_source("stamp", VersionStamp.for_directory(os.path.dirname(FILE_PATH)).stats)
+        if self.client:
+            METRICS.register_source("client", self.client.stats)
+
+    def _forward_command(self, command):
+        socket = QLocalSocket()
+        socket.connectToServer(INSTANCE_SERVER)
+
+        if socket.waitForConnected(INSTANCE_TIMEOUT_MS):
+            socket.write("{}\n".format(command).encode())
+            if socket.waitForBytesWritten(INSTANCE_TIMEOUT_MS):
+                socket.disconnectFromServer()
+                sys.exit(0)
+
+        MessageBox.show(
+            text="{} is already running, command '{}' can't be passed to it.".format(PROGRAM_NAME, command),
+            title="Error",
+            icon=QMessageBox.Critical,
+            detailed_text=socket.errorString(),
+            modal=True
+        )
+        sys.exit(1)
+
+    def _prepare_instance_server(self):
+        server = QLocalServer(self.app)
+        server.newConnection.connect(self._accept_commands)
+        # Instance lock is held, so server left by crashed instance can be removed.
+        QLocalServer.removeServer(INSTANCE_SERVER)
+
+        if not server.listen(INSTANCE_SERVER):
+            NOTIFIER.warning("Commands of next launches can't be received.\n\n{}".format(server.errorString()))
+
+        return server
+
+    def _accept_commands(self):
+        while self.instance_server.hasPendingConnections():
+            socket = self.instance_server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self._read_commands(socket))
+            socket.disconnected.connect(socket.deleteLater)
+            self._read_commands(socket)
+
+    def _read_commands(self, socket):
+        while socket.canReadLine():
+            self._run_command(bytes(socket.readLine()).decode('utf-8', 'replace').strip())
+
+    def _run_command(self, command):
+        commands = dict(zip(COMMANDS, (
+            lambda: self._show_tray_message(PROGRAM_NAME, "Application is already running."),
+            self._log_time,
+            self._show_working_time,
+            self._get_today_log,
+            self._show_overtimes,
+            self._show_activity,
+            self._show_history,
+            self._edit_logs,
+            self._edit_overtimes,
+            self._show_about_message,
+            self.app.exit
+        )))
+
+        if command not in commands:
+            NOTIFIER.warning("Unknown command '{}'.\n\nCommands: {}".format(command, ", ".join(COMMANDS)))
+            return
+
+        commands[command]()
+
+    def _prepare_signal_handlers(self):
+        # Python handlers run only when event loop calls into Python, which can be minutes away with deadline
+        # timer, so signal number written into socket wakes the loop up. Quitting event loop lets run() do final
+        # flush.
+        self.signal_socket, self.signal_wakeup_socket = socket.socketpair()
+        for sock in (self.signal_socket, self.signal_wakeup_socket):
+            sock.setblocking(False)
+        signal.set_wakeup_fd(self.signal_wakeup_socket.fileno())
+
+        self.signal_notifier = QSocketNotifier(self.signal_socket.fileno(), QSocketNotifier.Read)
+        self.signal_notifier.activated.connect(self._read_signals)
+
+        signal.signal(signal.SIGINT, self._quit)
+        signal.signal(signal.SIGTERM, self._quit)
+
+    def _read_signals(self):
+        # Handlers already ran before this slot, only wakeup bytes are drained.
+        try:
+            self.signal_socket.recv(64)
+        except OSError:
+            pass
+
+    def _quit(self, *args):
+        self.app.quit()
+
+    def _prepare_tray_menu(self):
+        tray = QSystemTrayIcon(QIcon("icon.png"), self.app)
+        menu = QMenu()
+
+        menu = self._set_tray_menu_item(menu, "Log break", self._log_time)
+        menu = self._set_tray_menu_item(menu, "Working time", self._show_working_time)
+
+        menu.addSeparator()
+
+        menu = self._set_tray_menu_item(menu, "Show logs", self._get_today_log)
+        menu = self._set_tray_menu_item(menu, "Show overtimes", self._show_overtimes)
+        menu = self._set_tray_menu_item(menu, "Show activity", self._show_activity)
+        menu = self._set_tray_menu_item(menu, "Show history", self._show_history)
+
+        menu.addSeparator()
+
+        menu = self._set_tray_menu_item(menu, "Edit logs", self._edit_logs)
+        menu = self._set_tray_menu_item(menu, "Edit overtimes", self._edit_overtimes)
+
+        menu.addSeparator()
+
+        menu = self._set_tray_menu_item(
+            menu, "Stop profiling" if METRICS.is_profiling() else "Start profiling", self._toggle_profiling)
+        menu = self._set_tray_menu_item(menu, "About", self._show_about_message)
+        menu = self._set_tray_menu_item(menu, "Exit", self.app.exit)
+
+        tray.setContextMenu(menu)
+        tray.setToolTip("Work time logger")
+
+        return tray
+
+    def _prepare_notifications(self):
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(self._dispatch_notifications)
+
+        NOTIFIER.sink = TraySink(self.tray)
+        NOTIFIER.on_pending = self._wake_notifications
+        # Notifications queued before tray was shown.
+        timer.start(0)
+
+        return timer
+
+    def _wake_notifications(self):
+        # Timer waiting for previous balloon dispatches the new notification too.
+        if not self.notification_timer.isActive():
+            self.notification_timer.start(0)
+
+    def _dispatch_notifications(self):
+        seconds = NOTIFIER.dispatch()
+
+        if seconds is not None:
+            self.notification_timer.start(int(seconds * 1000))
+
+    def _prepare_deadline_timer(self):
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(self._on_deadline)
+
+        return timer
+
+    def _schedule(self):
+        seconds, _ = self.deadlines.next_deadline()
+        self.deadline_timer.start(int(seconds * 1000))
+
+    def _on_deadline(self):
+        with METRICS.timer("tick"):
+            self.deadlines.wakeup()
+            self._check_activity()
+            self._check_overtime()
+            self._schedule()
+
+        self._export_metrics(force=False)
+
+    def _export_metrics(self, force=True, stop_profiling=False):
+        try:
+            if stop_profiling:
+                METRICS.stop_profiling(METRICS_PATH)
+            if force:
+                METRICS.export(METRICS_PATH)
+            else:
+                METRICS.maybe_export(METRICS_PATH)
+        except Exception:
+            # Metrics must never disturb logging of time.
+            METRICS.count("metrics_export_errors")
+
+    def _toggle_profiling(self):
+        if METRICS.is_profiling():
+            try:
+                stats_path, allocations_path = METRICS.stop_profiling(METRICS_PATH)
+            except Exception as exc:
+                MessageBox.show(
+                    text=str(exc),
+                    title="Error",
+                    icon=QMessageBox.Critical,
+                    detailed_text=str(type(exc))
+                )
+            else:
+                self._export_metrics()
+                MessageBox.show(
+                    text="Profile saved.",
+                    detailed_text="{}\n{}".format(stats_path, allocations_path)
+                )
+        else:
+            METRICS.start_profiling()
+
+        for action in self.tray.contextMenu().actions():
+            if action.text() in ("Start profiling", "Stop profiling"):
+                action.setText("Stop profiling" if METRICS.is_profiling() else "Start profiling")
+
+    def _log_time(self, first_run=False):
+        self.time.log_time(first_run=first_run)
+        self._update_tooltip_text()
+        self._change_log_work_break()
+        self._schedule()
+
+    def _get_today_log(self):
+        self.time.get_today_logs()
+        self._update_tooltip_text()
+
+    def _show_working_time(self):
+        self.time.show_working_time()
+        self._update_tooltip_text()
+
+    def _show_overtimes(self):
+        self.time.show_overtimes()
+        self._update_tooltip_text()
+
+    def _show_activity(self):
+        self.activity.show_activity()
+
+    def _show_history(self):
+        if self.history_task:
+            return
+
+        # Activity counted since last flush is written, so history includes it.
+        self._flush()
+        self.history_task = HistoryTask()
+        self.history_task.signals.finished.connect(self._history_finished)
+        self.history_task.signals.failed.connect(self._history_failed)
+        QThreadPool.globalInstance().start(self.history_task)
+
+    def _history_finished(self, message):
+        self.history_task = None
+        MessageBox.show(text=message, title="History")
+
+    def _history_failed(self, exc):
+        self.history_task = None
+        MessageBox.show(
+            text=str(exc),
+            title="Error",
+            icon=QMessageBox.Critical,
+            detailed_text=str(type(exc))
+        )
+
+    def _edit_logs(self):
+        self.time.edit_logs(self._edited)
+
+    def _edit_overtimes(self):
+        self.time.edit_overtimes(self._edited)
+
+    def _edited(self):
+        self._update_tooltip_text()
+        self._schedule()
+
+    def _update_tooltip_text(self):
+        self.time.update_time_left()
+        self.tray.setToolTip(TRAY_TOOLTIP.format(self.time.time_left))
+
+    def _set_tray_menu_item(self, menu, name, method):
+        menu_item = menu.addAction(name)
+        menu_item.triggered.connect(method)
+
+        return menu
+
+    def _change_log_work_break(self):
+        for action in self.tray.contextMenu().actions():
+            if action.text() == "Log break":
+                action.setText("Log work")
+
+                return True
+            elif action.text() == "Log work":
+                action.setText("Log break")
+
+                return True
+
+        return False
+
+    def _show_tray_message(self, title, text):
+        self.tray.showMessage(title, text)
+
+    def _not_implemented_yet_msg(self):
+        MessageBox.show(text="Not implemented yet!", title="ERROR", icon=QMessageBox.Critical)
+
+    def _show_about_message(self):
+        msg = "{} {}".format(PROGRAM_NAME, VERSION)
+        stats = self.deadlines.stats()
+        detailed_text = "Wakeups in last hour: {}\nWakeups per hour: {:.1f}\nSampler wakeups per hour: {:.1f}\n" \
+                        "Next wakeup: {}".format(stats["wakeups_last_hour"], stats["wakeups_per_hour"],
+                                                 stats["sampler_wakeups_per_hour"], stats["next_deadline"])
+
+        for name, timer in sorted(METRICS.snapshot()["timers"].items()):
+            detailed_text += "\n{}: {} x, avg {:.2f} ms, max {:.2f} ms".format(
+                name, timer["count"], timer["sum"] * 1000 / timer["count"], timer["max"] * 1000)
+        MessageBox.show(text=msg, title="About", detailed_text=detailed_text)
+
+    def run(self):
+        self._show_tray_message("Work Time Logger", "Application started.")
+        if self.command != "show":
+            QTimer.singleShot(0, lambda: self._run_command(self.command))
+        status = self.app.exec_()
+        self.instance_server.close()
+        self.activity.stop()
+        self.time.log_time(exit=True)
+        self._flush()
+        self.time.storage.close()
+        self._export_metrics(stop_profiling=True)
+
+        if self.client:
+            self.client.stop()
+            self.client.join()
+
+        self.instance_lock.release()
+
+        sys.exit(status)
+
+    def _check_overtime(self):
+        global MSG_BOX_SHOWED
+        with METRICS.timer("compute"):
+            working_time = self.time._calculate_working_time()
+            self.time.update_ledger()
+
+        if working_time > self.time.reference_time:
+            if not MSG_BOX_SHOWED:
+                msg = "It's time to end your work.\n\n{}".format(working_time)
+                NOTIFIER.info(msg)
+                MSG_BOX_SHOWED = True
+            overtimes = working_time - self.time.reference_time
+
+            self._save_overtimes(overtimes)
+        self._update_tooltip_text()
+
+    def _check_activity(self):
+        with METRICS.timer("activity"):
+            self.activity.run()
+        self.scheduler.tick()
+        self._report_flush_error()
+
+    def _flush(self):
+        self.scheduler.flush()
+        self._report_flush_error()
+
+    def _report_flush_error(self):
+        exc = self.scheduler.pop_error()
+        if exc:
+            NOTIFIER.error(exc)
+
+    def _save_overtimes(self, overtimes):
+        now = datetime.datetime.now()
+        now_date = str(now.strftime("%Y/%m/%d"))
+
+        self.time.save_overtime(now_date, overtimes)
+
+
+if __name__ == '__main__':
+    app = App(sys.argv[1] if len(sys.argv) > 1 else "show")
+    app.run()
@@ -0,0 +1,141 @@
+import time
+
+from work_time_core.activity import ForegroundSampler, InputSampler, ProcessNameCache, IDLE_SECONDS
+
+
+class FakeSource:
+    """
+    Foreground window source with processes set by test, counting system calls.
+    """
+    def __init__(self, pid=1):
+        self.pid = pid
+        self.processes = {1: (100.0, "editor"), 2: (200.0, "browser")}
+        self.create_time_calls = 0
+        self.name_calls = 0
+
+    def foreground_pid(self):
+        if self.pid not in self.processes:
+            raise LookupError("No such process: {}".format(self.pid))
+
+        return self.pid
+
+    def create_time(self, pid):
+        self.create_time_calls += 1
+
+        return self.processes[pid][0]
+
+    def name(self, pid):
+        self.name_calls += 1
+
+        return self.processes[pid][1]
+
+
+class FakeInput(InputSampler):
+    def __init__(self, active=True):
+        super().__init__()
+        self.active = active
+
+    def _detect(self):
+        return self.active
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_same_pid_isnt_validated_again():
+    source = FakeSource()
+    cache = ProcessNameCache(source, clock=FakeClock())
+
+    names = [cache.name(1) for _ in range(100)]
+
+    assert set(names) == {"editor"}
+    assert source.create_time_calls == 1
+    assert source.name_calls == 1
+    assert cache.hits == 99
+
+
+def test_changed_pid_is_validated_from_cache():
+    source = FakeSource()
+    cache = ProcessNameCache(source, clock=FakeClock())
+
+    assert [cache.name(1), cache.name(2), cache.name(1)] == ["editor", "browser", "editor"]
+    assert source.create_time_calls == 3
+    assert source.name_calls == 2
+
+
+def test_reused_pid_is_resolved_after_revalidation():
+    source = FakeSource()
+    clock = FakeClock()
+    cache = ProcessNameCache(source, revalidate=60, clock=clock)
+    cache.name(1)
+
+    source.processes[1] = (300.0, "terminal")
+    assert cache.name(1) == "editor"
+
+    clock.now = 60
+    assert cache.name(1) == "terminal"
+    assert cache.misses == 2
+
+
+def test_cache_is_bounded():
+    source = FakeSource()
+    source.processes = {pid: (float(pid), "app{}".format(pid)) for pid in range(10)}
+    cache = ProcessNameCache(source, size=3, clock=FakeClock())
+
+    for pid in range(10):
+        cache.name(pid)
+
+    assert list(cache.entries) == [7, 8, 9]
+
+
+def test_sample_counts_window_of_foreground_app():
+    sampler = ForegroundSampler(FakeSource(2), FakeInput(active=False))
+
+    date, app, active, seconds, error, second = sampler.sample(10)
+
+    assert (app, active, seconds, error) == ("browser", False, 10, None)
+    assert 0 <= second < 24 * 3600
+
+
+def test_sample_keeps_lookup_error():
+    sampler = ForegroundSampler(FakeSource(3), FakeInput())
+
+    date, app, active, seconds, error, second = sampler.sample()
+
+    assert app is None
+    assert isinstance(error, LookupError)
+
+
+def test_sampling_slows_down_while_input_is_idle():
+    input_sampler = FakeInput()
+    sampler = ForegroundSampler(FakeSource(), input_sampler, interval=1, idle_interval=10)
+
+    assert sampler.current_interval() == 1
+
+    input_sampler.last_active -= IDLE_SECONDS
+    assert sampler.current_interval() == 10
+
+    input_sampler.sample()
+    assert sampler.current_interval() == 1
+
+
+def test_samples_are_queued_by_thread():
+    source = FakeSource()
+    sampler = ForegroundSampler(source, FakeInput(), interval=0.01)
+    sampler.start()
+
+    deadline = time.monotonic() + 5
+    while sampler.samples.qsize() < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sampler.stop()
+    sampler.join()
+
+    samples = [sampler.samples.get_nowait() for _ in range(sampler.samples.qsize())]
+    assert len(samples) >= 3
+    assert {sample[1] for sample in samples} == {"editor"}
+    assert source.name_calls == 1
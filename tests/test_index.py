@@ -0,0 +1,91 @@
+import calendar
+import datetime
+
+from work_time_core.index import WorkingTimeIndex
+from work_time_core.intervals import MAX_SHIFT_SECONDS, new_entry, close_entry
+
+# Central European Time, so local midnight differs from UTC one.
+OFFSET = 3600
+
+
+def _timestamp(date, time, offset=OFFSET):
+    moment = datetime.datetime.strptime("{} {}".format(date, time), "%Y/%m/%d %H:%M:%S")
+
+    return calendar.timegm(moment.timetuple()) - offset
+
+
+def _entry(date, start, end=None, end_date=None, offset=OFFSET):
+    entry = new_entry(_timestamp(date, start, offset), offset)
+    if end is not None:
+        close_entry(date, entry, _timestamp(end_date or date, end, offset), offset)
+
+    return entry
+
+
+def test_interval_crossing_midnight_is_split():
+    index = WorkingTimeIndex({"2024/01/15": [_entry("2024/01/15", "22:00:00", "02:30:00", "2024/01/16")]})
+    index.load_all()
+
+    assert index.day_totals == {"2024/01/15": 2 * 3600, "2024/01/16": 2 * 3600 + 1800}
+    assert index.month_totals == {"2024/01": 4 * 3600 + 1800}
+
+
+def test_interval_crossing_month_is_split_between_months():
+    index = WorkingTimeIndex({"2024/01/31": [_entry("2024/01/31", "23:00:00", "01:00:00", "2024/02/01")]})
+
+    assert index.month_seconds("2024/02", _timestamp("2024/02/02", "12:00:00")) == 3600
+    assert index.month_totals == {"2024/01": 3600, "2024/02": 3600}
+
+
+def test_interval_longer_than_day_is_split_into_every_day():
+    index = WorkingTimeIndex({"2024/01/15": [_entry("2024/01/15", "20:00:00", "04:00:00", "2024/01/17")]})
+    index.load_all()
+
+    assert index.day_totals == {"2024/01/15": 4 * 3600, "2024/01/16": 24 * 3600, "2024/01/17": 4 * 3600}
+
+
+def test_replaced_day_removes_split_part_of_next_day():
+    index = WorkingTimeIndex()
+    index.start("2024/01/15", 0, _entry("2024/01/15", "22:00:00", "02:00:00", "2024/01/16"))
+    index.start("2024/01/16", 0, _entry("2024/01/16", "08:00:00", "12:00:00"))
+
+    index.set_day("2024/01/15", [_entry("2024/01/15", "20:00:00", "23:00:00")])
+
+    assert index.day_totals == {"2024/01/15": 3 * 3600, "2024/01/16": 4 * 3600}
+    assert index.month_totals == {"2024/01": 7 * 3600}
+
+
+def test_open_interval_is_counted_into_next_day():
+    index = WorkingTimeIndex({"2024/01/15": [_entry("2024/01/15", "22:00:00")]})
+    now = _timestamp("2024/01/16", "03:00:00")
+
+    assert index.open_date("2024/01/16", now) == "2024/01/15"
+    assert index.day_seconds("2024/01/15", now) == 2 * 3600
+    assert index.day_seconds("2024/01/16", now) == 3 * 3600
+    assert index.day_totals == {}
+
+
+def test_old_open_interval_is_forgotten_break():
+    index = WorkingTimeIndex({"2024/01/15": [_entry("2024/01/15", "08:00:00")]})
+    now = _timestamp("2024/01/15", "08:00:00") + MAX_SHIFT_SECONDS + 1
+
+    assert index.open_date("2024/01/16", now) is None
+    assert index.day_seconds("2024/01/16", now) == 0
+
+
+def test_months_are_indexed_on_first_use():
+    index = WorkingTimeIndex({
+        "2023/12/31": [_entry("2023/12/31", "23:00:00", "01:00:00", "2024/01/01")],
+        "2024/03/01": [_entry("2024/03/01", "08:00:00", "09:00:00")]
+    })
+
+    assert index.day_total("2024/01/01") == 3600
+    assert index.indexed_months == {"2023/12", "2024/01"}
+    assert index.day_total("2024/02/01") is None
+
+
+def test_entries_without_epochs_end_next_day():
+    index = WorkingTimeIndex({"2024/01/15": [{"START": "22:00:00", "END": "02:00:00"}]})
+    index.load_all()
+
+    assert index.day_totals == {"2024/01/15": 2 * 3600, "2024/01/16": 2 * 3600}
@@ -0,0 +1,119 @@
+import os
+
+from work_time_core.ledger import OvertimeLedger, format_balance
+from work_time_core.scheduler import WriteBehindScheduler
+from work_time_core.timekeeping import WorkTime
+
+HOUR = 3600
+REFERENCE = 8 * HOUR
+
+
+def _ledger(path):
+    ledger = OvertimeLedger(str(path / "ledger"))
+    ledger.rebuild({"2023/12/01": 9 * HOUR, "2024/01/02": 10 * HOUR, "2024/01/03": 7 * HOUR,
+                    "2024/02/01": 8 * HOUR + 1800}, REFERENCE)
+
+    return ledger
+
+
+def test_balances_of_months_years_and_ranges(tmp_path):
+    ledger = _ledger(tmp_path)
+
+    assert (ledger.day("2024/01/03"), ledger.month("2024/01"), ledger.year("2024")) == (-HOUR, HOUR, HOUR + 1800)
+    assert ledger.total == 2 * HOUR + 1800
+    assert ledger.carry_over("2024/02") == 2 * HOUR
+    assert ledger.balance_until("2024/01") == 2 * HOUR
+    assert ledger.balance_until("2024/05") == ledger.total
+    assert ledger.balance_until("2020/01") == 0
+    assert ledger.range("2024/01", "2024/02") == HOUR + 1800
+
+
+def test_change_of_earlier_month_updates_later_balances(tmp_path):
+    ledger = _ledger(tmp_path)
+
+    assert ledger.set_day("2023/11/30", -2 * HOUR)
+    assert ledger.set_day("2024/01/02", 0)
+    assert not ledger.set_day("2024/01/02", 0)
+
+    assert ledger.carry_over("2024/01") == -HOUR
+    assert ledger.carry_over("2024/02") == -2 * HOUR
+    assert ledger.total == -HOUR - 1800
+
+
+def test_removed_day_is_subtracted(tmp_path):
+    ledger = _ledger(tmp_path)
+
+    assert ledger.remove_day("2024/01/03")
+    assert not ledger.remove_day("2024/01/03")
+
+    assert ledger.month("2024/01") == 2 * HOUR
+    assert ledger.carry_over("2024/02") == 3 * HOUR
+
+
+def test_only_changed_months_are_saved(tmp_path):
+    ledger = _ledger(tmp_path)
+    ledger.save()
+    assert sorted(os.listdir(ledger.path)) == ["2023-12.json", "2024-01.json", "2024-02.json"]
+
+    ledger.set_day("2024/02/02", HOUR)
+    assert ledger.dirty == {"2024/02"}
+    os.remove(os.path.join(ledger.path, "2024-01.json"))
+    ledger.save()
+
+    assert sorted(os.listdir(ledger.path)) == ["2023-12.json", "2024-02.json"]
+    assert not ledger.dirty
+
+
+def test_month_without_days_is_removed(tmp_path):
+    ledger = _ledger(tmp_path)
+    ledger.save()
+
+    ledger.remove_day("2023/12/01")
+    ledger.save()
+
+    assert sorted(os.listdir(ledger.path)) == ["2024-01.json", "2024-02.json"]
+
+
+def test_saved_ledger_is_loaded(tmp_path):
+    ledger = _ledger(tmp_path)
+    ledger.save()
+
+    loaded = OvertimeLedger(ledger.path)
+
+    assert loaded.load(REFERENCE)
+    assert loaded.days == ledger.days
+    assert loaded.cumulative == ledger.cumulative
+    assert not loaded.dirty
+
+
+def test_ledger_with_other_reference_or_corrupt_file_isnt_loaded(tmp_path):
+    ledger = _ledger(tmp_path)
+    ledger.save()
+
+    assert not OvertimeLedger(ledger.path).load(7 * HOUR)
+
+    with open(os.path.join(ledger.path, "2024-01.json"), 'w') as fp:
+        fp.write('{"reference": ')
+    assert not OvertimeLedger(ledger.path).load(REFERENCE)
+    assert not OvertimeLedger(str(tmp_path / "missing")).load(REFERENCE)
+
+
+def test_days_logged_before_ledger_was_saved_are_refreshed(tmp_path):
+    paths = [str(tmp_path / name) for name in ("log.json", "overtimes.json", "journal.log")]
+    work_time = WorkTime(*paths, scheduler=WriteBehindScheduler())
+    work_time.ledger.save()
+
+    # Logs of old day are written, application exits before ledger is saved.
+    work_time.storage.set_day("2020/03/04", [{"START": "08:00:00", "END": "12:00:00"}])
+    work_time.storage.sync()
+
+    restarted = WorkTime(*paths, scheduler=WriteBehindScheduler())
+
+    assert restarted.ledger.reference == REFERENCE
+    assert restarted.ledger.day("2020/03/04") == 4 * HOUR - REFERENCE
+
+
+def test_format_balance():
+    assert format_balance(0) == "+0:00:00"
+    assert format_balance(-3723) == "-1:02:03"
+    assert format_balance(25 * HOUR) == "+25:00:00"
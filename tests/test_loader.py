@@ -0,0 +1,72 @@
+import json
+import datetime
+
+import pytest
+
+from work_time_core.loader import StreamingJsonLoader, CHUNK_SIZE, validate_log_day
+
+
+def _days(count):
+    first = datetime.date(2020, 1, 1)
+
+    return {(first + datetime.timedelta(days=number)).strftime("%Y/%m/%d"):
+            [{"START": "08:00:00", "END": "12:00:00"}, {"START": "12:30:00", "END": "16:30:00"}]
+            for number in range(count)}
+
+
+def _write_with_corrupt_day(path, days, chunk_size):
+    """
+    Write days with one incorrect day whose text spans boundary of the second chunk.
+    """
+    text = json.dumps(days, indent=3)
+    boundary = 2 * chunk_size if len(text) > 2 * chunk_size else chunk_size
+
+    for date in days:
+        start = text.index('"{}"'.format(date))
+        end = text.index('"2', start + 1) if date != list(days)[-1] else len(text)
+        if start < boundary < end:
+            break
+
+    corrupt = text[start:end].replace('"START": "08:00:00"', '"START": "8 o\'clock"', 1)
+    path.write_text(text[:start] + corrupt + text[end:])
+
+    return date
+
+
+def test_loads_all_days(tmp_path):
+    days = _days(50)
+    path = tmp_path / "log.json"
+    path.write_text(json.dumps(days))
+
+    loaded = StreamingJsonLoader(validate_log_day, chunk_size=100).load(str(path))
+
+    assert dict(loaded) == days
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 4096, CHUNK_SIZE])
+def test_corrupt_day_across_chunk_boundary(tmp_path, chunk_size):
+    days = _days(1000)
+    path = tmp_path / "log.json"
+    quarantine = tmp_path / "log.json.quarantine"
+    corrupt = _write_with_corrupt_day(path, days, chunk_size)
+
+    loader = StreamingJsonLoader(validate_log_day, quarantine_path=str(quarantine), chunk_size=chunk_size)
+    loaded = loader.load(str(path))
+
+    del days[corrupt]
+    assert dict(loaded) == days
+    assert loader.stats["corrupt"] == 1
+    record = json.loads(quarantine.read_text())
+    assert record["text"].startswith('"{}"'.format(corrupt))
+    assert "8 o'clock" in record["text"]
+    assert json.loads("{" + record["text"] + "}")
+
+
+def test_unparsable_day_is_skipped(tmp_path):
+    path = tmp_path / "log.json"
+    path.write_text('{"2024/01/01": [{"START": "08:00:00", "END": "09:00:00"}], "2024/01/02": [{"START": ,'
+                    ' "2024/01/03": []}')
+
+    loaded = StreamingJsonLoader(validate_log_day, chunk_size=16).load(str(path))
+
+    assert sorted(loaded) == ["2024/01/01", "2024/01/03"]
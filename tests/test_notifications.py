@@ -0,0 +1,131 @@
+import io
+import threading
+
+from work_time_core.notifications import Notifier, HeadlessSink, ERROR, WARNING
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _notifier(**kwargs):
+    sink = HeadlessSink()
+    clock = FakeClock()
+
+    return Notifier(sink, clock=clock, **kwargs), sink, clock
+
+
+def test_notifications_are_delivered_in_order():
+    notifier, sink, clock = _notifier()
+
+    notifier.info("first")
+    notifier.warning("second")
+    notifier.error(ValueError("third"))
+
+    assert notifier.dispatch_all() == 3
+    assert [(notification.text, notification.level) for notification in sink.delivered] == [
+        ("first", "info"), ("second", WARNING), ("third", ERROR)]
+    assert sink.delivered[2].detailed_text == str(ValueError)
+
+
+def test_queued_duplicate_is_merged():
+    notifier, sink, clock = _notifier()
+
+    assert notifier.info("Time to go home!")
+    assert not notifier.info("Time to go home!")
+
+    notifier.dispatch_all()
+    assert len(sink.delivered) == 1
+    assert sink.delivered[0].repeats == 1
+    assert notifier.stats()["merged"] == 1
+
+
+def test_shown_notification_is_suppressed_within_repeat_interval():
+    notifier, sink, clock = _notifier(repeat_interval=300)
+    notifier.info("Overtime!")
+    notifier.dispatch()
+
+    clock.now = 100
+    assert not notifier.info("Overtime!")
+    assert not notifier.info("Overtime!")
+    assert notifier.dispatch() is None
+
+    clock.now = 300
+    assert notifier.info("Overtime!")
+    notifier.dispatch()
+
+    assert len(sink.delivered) == 2
+    assert sink.delivered[1].repeats == 2
+    assert notifier.stats()["suppressed"] == 2
+
+
+def test_oldest_notification_is_dropped_when_queue_is_full():
+    notifier, sink, clock = _notifier(size=3)
+
+    for number in range(5):
+        notifier.info("message {}".format(number))
+
+    notifier.dispatch_all()
+    assert [notification.text for notification in sink.delivered] == ["message 2", "message 3", "message 4"]
+    assert notifier.stats()["dropped"] == 2
+
+
+def test_dispatch_waits_for_min_interval():
+    notifier, sink, clock = _notifier(min_interval=5)
+    notifier.info("first")
+    notifier.info("second")
+
+    assert notifier.dispatch() == 5
+    clock.now = 2
+    assert notifier.dispatch() == 3
+    assert len(sink.delivered) == 1
+
+    clock.now = 5
+    assert notifier.dispatch() is None
+    assert [notification.text for notification in sink.delivered] == ["first", "second"]
+
+
+def test_broken_sink_doesnt_break_dispatch():
+    def sink(notification):
+        raise RuntimeError("no tray")
+
+    notifier = Notifier(sink)
+    notifier.info("text")
+
+    notifier.dispatch()
+
+    stats = notifier.stats()
+    assert (stats["delivered"], stats["sink_errors"], stats["pending"]) == (0, 1, 0)
+
+
+def test_notify_without_sink_never_blocks():
+    notifier = Notifier(size=10)
+    woken = []
+    notifier.on_pending = lambda: woken.append(True)
+
+    threads = [threading.Thread(target=lambda number=number: [notifier.info("{} {}".format(number, index))
+                                                               for index in range(100)]) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert notifier.dispatch() is None
+    assert notifier.stats()["pending"] == 10
+    assert notifier.stats()["dropped"] == 390
+    assert len(woken) == 400
+
+
+def test_sink_writes_stream():
+    stream = io.StringIO()
+    notifier = Notifier(HeadlessSink(stream))
+    notifier.warning("Disk\nfull", title="Storage")
+    notifier.warning("Disk\nfull", title="Storage")
+
+    notifier.dispatch_all()
+
+    assert stream.getvalue() == "[warning] Storage: Disk full (repeated 1 time(s))\n"
@@ -0,0 +1,164 @@
+import json
+import asyncio
+
+from work_time_core.server import AggregationServer
+from work_time_core.intervals import new_entry, close_entry, format_date
+
+DATE = "2024/01/02"
+
+
+def _interval(user, index, start, end, date=DATE):
+    return {"type": "interval", "user": user, "date": date, "index": index, "start": start, "end": end}
+
+
+def _overtime(user, value, date=DATE):
+    return {"type": "overtime", "user": user, "date": date, "value": value}
+
+
+def _activity(user, app, active, inactive=0, date=DATE):
+    return {"type": "activity", "user": user, "date": date, "app": app, "active": active, "inactive": inactive}
+
+
+def _ingest_team(server):
+    server._ingest_batch([
+        _interval("anna", 0, "08:00:00", "12:00:00"),
+        _interval("anna", 1, "12:30:00", "16:30:00"),
+        _interval("bob", 0, "09:00:00", "10:00:00"),
+        _overtime("anna", "1:00:00"),
+        _overtime("bob", "0:30:00"),
+        _activity("anna", "editor", 100, 10),
+        _activity("bob", "editor", 50),
+        _activity("bob", "browser", 200, 5)
+    ])
+
+
+def test_ingested_events_are_rolled_up(tmp_path):
+    server = AggregationServer(str(tmp_path))
+    _ingest_team(server)
+
+    assert server.stats["errors"] == 0
+    assert server.query({"name": "team_time", "period": "day", "key": DATE}) == {"key": DATE, "seconds": 9 * 3600}
+    assert server.query({"name": "team_time", "period": "month", "key": "2024/01"})["users"] == {
+        "anna": 8 * 3600, "bob": 3600}
+    assert server.query({"name": "overtime_leaders", "month": "2024/01"}) == [
+        {"user": "anna", "seconds": 3600}, {"user": "bob", "seconds": 1800}]
+    assert server.query({"name": "top_apps", "period": "day", "key": DATE, "limit": 1}) == [
+        {"app": "browser", "active": 200, "inactive": 5}]
+
+
+def test_rollups_are_loaded_from_databases(tmp_path):
+    server = AggregationServer(str(tmp_path))
+    _ingest_team(server)
+
+    loaded = AggregationServer(str(tmp_path))
+
+    for message in ({"name": "team_time", "period": "month", "key": "2024/01"},
+                    {"name": "overtime_leaders", "month": "2024/01"},
+                    {"name": "top_apps", "period": "month", "key": "2024/01"}):
+        assert loaded.query(message) == server.query(message)
+
+
+def test_changed_interval_and_overtime_replace_previous(tmp_path):
+    server = AggregationServer(str(tmp_path))
+    server._ingest_batch([_interval("anna", 0, "08:00:00", ""), _overtime("anna", "1:00:00")])
+    assert server.rollups.team_days.get(DATE, 0) == 0
+
+    server._ingest_batch([_interval("anna", 0, "08:00:00", "10:00:00"), _overtime("anna", "0:15:00")])
+
+    assert server.rollups.team_days[DATE] == 2 * 3600
+    assert server.query({"name": "overtime_leaders", "month": "2024/01"}) == [{"user": "anna", "seconds": 900}]
+
+
+def test_interval_crossing_midnight_is_split(tmp_path):
+    server = AggregationServer(str(tmp_path))
+    entry = new_entry(1704236400, 0)
+    date = format_date(1704236400, 0)
+    close_entry(date, entry, 1704236400 + 4 * 3600, 0)
+    event = _interval("anna", 0, entry["START"], entry["END"], date)
+    event.update(ts=entry["TS"], utc=entry["UTC"])
+
+    server._ingest_batch([event])
+
+    assert server.rollups.team_days == {date: 3600, "2024/01/03": 3 * 3600}
+    assert server._database("anna").working_time() == {date: [entry]}
+
+
+def test_incorrect_events_are_skipped(tmp_path):
+    server = AggregationServer(str(tmp_path))
+
+    server._ingest_batch([
+        _interval("anna", 1, "08:00:00", "09:00:00"),
+        _interval("anna", 0, "8 o'clock", ""),
+        _overtime("anna", "a lot"),
+        _activity("anna", "editor", -1),
+        dict(_interval("anna", 0, "08:00:00", "09:00:00"), ts=[1, 2], utc=[0, 0]),
+        _activity("../anna", "editor", 1),
+        _activity("bob", "editor", 5)
+    ])
+
+    assert server.stats["errors"] == 6
+    assert server.rollups.team_days == {}
+    assert server._database("anna").working_time() == {}
+    assert server.query({"name": "top_apps", "period": "day", "key": DATE}) == [
+        {"app": "editor", "active": 5, "inactive": 0}]
+
+
+def test_failed_commit_reloads_only_its_user(tmp_path, monkeypatch):
+    server = AggregationServer(str(tmp_path))
+    _ingest_team(server)
+    before = server.query({"name": "team_time", "period": "month", "key": "2024/01"})
+
+    def fail():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(server._database("anna"), "commit", fail)
+    bob = server.rollups.indexes["bob"]
+    server._ingest_batch([
+        _interval("anna", 2, "17:00:00", "18:00:00"),
+        _overtime("anna", "2:00:00"),
+        _activity("anna", "terminal", 60),
+        _activity("bob", "terminal", 30)
+    ])
+
+    assert server.stats["errors"] == 1
+    assert server.rollups.indexes["bob"] is bob
+    assert server.query({"name": "team_time", "period": "month", "key": "2024/01"}) == before
+    assert server.query({"name": "overtime_leaders", "month": "2024/01"})[0] == {"user": "anna", "seconds": 3600}
+    assert {"app": "terminal", "active": 30, "inactive": 0} in server.query(
+        {"name": "top_apps", "period": "day", "key": DATE})
+    assert "terminal" not in server.app_ids["anna"]
+
+
+def test_events_and_queries_over_connection(tmp_path):
+    async def run():
+        server = AggregationServer(str(tmp_path))
+        await server.start(port=0)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        lines = [_interval("anna", 0, "08:00:00", "12:00:00"), _activity("anna", "editor", 10)]
+        writer.write("".join("{}\n".format(json.dumps(line)) for line in lines).encode())
+        await writer.drain()
+        while server.stats["events"] < len(lines):
+            await asyncio.sleep(0.01)
+        writer.write(b'{"type": "query", "name": "team_time", "period": "day", "key": "2024/01/02"}\n')
+        answer = json.loads(await reader.readline())
+        writer.write(b'{"type": "unknown"}\n')
+        error = json.loads(await reader.readline())
+        writer.close()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /top-apps?period=day&key=2024/01/02 HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = (await reader.read()).decode()
+        writer.close()
+
+        await server.stop()
+
+        return answer, error, response
+
+    answer, error, response = asyncio.run(run())
+
+    assert answer == {"ok": True, "result": {"key": DATE, "seconds": 4 * 3600}}
+    assert not error["ok"]
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert json.loads(response.split("\r\n\r\n", 1)[1])["result"] == [{"app": "editor", "active": 10, "inactive": 0}]
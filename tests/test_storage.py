@@ -0,0 +1,145 @@
+import os
+import json
+
+import pytest
+
+from work_time_core import storage
+from work_time_core.storage import TimeJournal
+from work_time_core.locking import VersionStamp
+
+START = 1704178800
+
+
+def _journal(path):
+    journal = TimeJournal(str(path / "log.json"), str(path / "overtimes.json"), str(path / "journal.log"))
+    journal.load()
+
+    return journal
+
+
+def _log_days(journal, dates):
+    for date_index, date in enumerate(dates):
+        timestamp = START + date_index * 86400
+        journal.start(date, timestamp, 0)
+        journal.end(date, timestamp + 4 * 3600, 0)
+    journal.overtime(dates[0], "1:00:00")
+
+
+def _state(journal):
+    return dict(journal.working_time.to_dict()), dict(journal.overtimes)
+
+
+def _read(path):
+    def read():
+        reader = TimeJournal(str(path / "log.json"), str(path / "overtimes.json"), str(path / "journal.log"))
+        working_time, overtimes = reader.read()
+
+        return dict(working_time.to_dict()), dict(overtimes)
+
+    return VersionStamp.for_directory(str(path)).read_consistent(read)[0]
+
+
+def test_compaction_writes_snapshots_and_empties_journal(tmp_path):
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/02", "2024/01/03"])
+    state = _state(journal)
+
+    journal.compact(background=False)
+
+    assert journal.pop_error() is None
+    assert os.path.getsize(journal.journal_path) == 0
+    assert not os.path.exists(journal.rotated_path)
+    assert sorted(os.listdir(journal.shards_path)) == ["2024-01.json.xz", "index.json"]
+    assert json.loads((tmp_path / "overtimes.json").read_text()) == {"2024/01/02": "1:00:00"}
+    journal.close()
+    assert _state(_journal(tmp_path)) == state
+
+
+def test_events_after_compaction_are_replayed(tmp_path):
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/02"])
+    journal.compact(background=False)
+    journal.start("2024/01/03", START + 86400, 0)
+    journal.sync()
+    state = _state(journal)
+
+    assert _state(_journal(tmp_path)) == state
+    assert state[0]["2024/01/03"][0]["END"] == ""
+
+
+def test_failed_snapshot_keeps_rotated_journal(tmp_path, monkeypatch):
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/02"])
+    state = _state(journal)
+
+    def fail(snapshot):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(journal.working_time, "write", fail)
+    journal.compact(background=False)
+
+    assert isinstance(journal.pop_error(), OSError)
+    assert os.path.exists(journal.rotated_path)
+    assert _state(_journal(tmp_path)) == state
+
+    journal.overtime("2024/01/03", "0:30:00")
+    monkeypatch.undo()
+    journal.compact(background=False)
+
+    assert journal.pop_error() is None
+    assert not os.path.exists(journal.rotated_path)
+    assert _state(_journal(tmp_path))[1] == {"2024/01/02": "1:00:00", "2024/01/03": "0:30:00"}
+
+
+def test_reader_sees_all_events_while_snapshots_are_written(tmp_path, monkeypatch):
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/02", "2024/01/03"])
+    journal.sync()
+    state = _state(journal)
+    reads = []
+    write = journal.working_time.write
+
+    def read_and_write(snapshot):
+        # Journal is already rotated, snapshots aren't written yet.
+        reads.append(_read(tmp_path))
+        write(snapshot)
+        reads.append(_read(tmp_path))
+
+    monkeypatch.setattr(journal.working_time, "write", read_and_write)
+    journal.compact(background=False)
+    reads.append(_read(tmp_path))
+
+    assert reads == [state] * 3
+
+
+def test_journal_is_compacted_in_background_after_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "JOURNAL_COMPACT_THRESHOLD", 10)
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/{:02d}".format(day) for day in range(1, 11)])
+    journal._wait_compaction()
+
+    assert journal.events == 1
+    assert not os.path.exists(journal.rotated_path)
+    assert len(_journal(tmp_path).working_time) == 10
+
+
+@pytest.mark.parametrize("tail", ['{"op": "START", "da', "\n"])
+def test_torn_journal_line_is_skipped(tmp_path, tail):
+    journal = _journal(tmp_path)
+    _log_days(journal, ["2024/01/02"])
+    journal.sync()
+    state = _state(journal)
+    with open(journal.journal_path, 'a') as fp:
+        fp.write(tail)
+
+    assert _state(_journal(tmp_path)) == state
+
+
+def test_events_with_times_only_are_replayed(tmp_path):
+    (tmp_path / "journal.log").write_text(
+        '{"op": "START", "date": "2024/01/02", "index": 0, "time": "08:00:00"}\n'
+        '{"op": "END", "date": "2024/01/02", "index": 0, "time": "12:00:00"}\n')
+
+    working_time, overtimes = _state(_journal(tmp_path))
+
+    assert working_time == {"2024/01/02": [{"START": "08:00:00", "END": "12:00:00"}]}